@@ -0,0 +1,359 @@
+"""
+Benchmarks for the annotation entry points of cq-annotate.
+
+Each benchmark case runs in a fresh process so that its peak memory use is measured on its
+own. The results can be saved as a baseline and later runs compared against it.
+
+    python benchmarks/run.py --output baseline.json
+    python benchmarks/run.py --compare baseline.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from collections import namedtuple
+
+# Allow the benchmarks to be run from a source checkout
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cadquery as cq
+from cq_annotate import callouts, dimensioning, overlays, vector, views
+from synthetic import synthetic_assembly, synthetic_plate
+
+# A benchmark case
+#   name - Name of the entry point being measured
+#   params - A list of keyword argument dictionaries for setup, one per benchmark
+#   setup - Function building the input of the benchmark from the params, which is not timed
+#   run - Function running the entry point on the input, which is timed
+Case = namedtuple("Case", ["name", "params", "setup", "run"])
+
+PART_COUNTS = (10, 100, 1000)
+TREE_DEPTHS = (2, 3, 4, 5, 6)
+HOLE_COUNTS = (1, 10, 100, 500)
+
+
+def _clear_caches():
+    """
+    Empties the geometry caches of cq-annotate so that every repeat measures a cold start.
+    """
+
+    callouts._arrow_prototype.cache_clear()
+    callouts._line_prototype.cache_clear()
+    dimensioning._leader_prototype.cache_clear()
+    dimensioning._label_prototype.cache_clear()
+    overlays._icon_template.cache_clear()
+    overlays._overlay_template.cache_clear()
+    overlays._overlay_markup.cache_clear()
+
+
+def _setup_svg(parts):
+    """
+    Exports a drawing of a synthetic assembly to a temporary SVG file.
+    """
+
+    svg = cq.exporters.getSVG(synthetic_assembly(parts).toCompound())
+    fd, path = tempfile.mkstemp(suffix=".svg")
+    with os.fdopen(fd, "w") as svg_file:
+        svg_file.write(svg)
+
+    return svg, path
+
+
+def _run_assembly_arrows(assy):
+    return callouts.add_assembly_arrows(assy, arrow_scale_factor=0.5)
+
+
+def _run_assembly_lines(assy):
+    callouts.add_assembly_lines(assy)
+    return assy
+
+
+def _run_explode_assembly(assy):
+    views.explode_assembly(assy, depth=None)
+    return assy
+
+
+def _run_compute_explode_locs(assy):
+    views.compute_explode_locs(assy, overwrite=True)
+    return assy
+
+
+def _run_circular_dimensions(plate):
+    return dimensioning.add_circular_dimensions(plate, arrow_scale_factor=0.1)
+
+
+def _run_find_circular_edges(plate):
+    return dimensioning.find_circular_edges(plate)
+
+
+def _run_safety_warning(state):
+    svg, path = state
+    try:
+        overlays.add_safety_warning(path, "Safety Warning")
+    finally:
+        os.unlink(path)
+
+
+def _run_safety_warning_data(state):
+    svg, path = state
+    os.unlink(path)
+    return overlays.add_safety_warning_data(svg, "Safety Warning")
+
+
+def _setup_vector_annotations(parts):
+    """
+    Exports a drawing of a synthetic assembly and keeps the assembly for its annotations.
+    """
+
+    assy = synthetic_assembly(parts)
+
+    return assy, cq.exporters.getSVG(assy.toCompound())
+
+
+def _run_vector_annotations(state):
+    assy, svg = state
+    primitives = callouts.get_assembly_arrow_primitives(
+        assy, arrow_scale_factor=0.5
+    ) + callouts.get_assembly_line_primitives(assy)
+    return vector.add_vector_annotations(svg, primitives)
+
+
+CASES = [
+    Case(
+        "add_assembly_arrows",
+        [{"parts": n} for n in PART_COUNTS]
+        + [{"parts": 100, "depth": d} for d in TREE_DEPTHS],
+        synthetic_assembly,
+        _run_assembly_arrows,
+    ),
+    Case(
+        "add_assembly_lines",
+        [{"parts": n} for n in PART_COUNTS]
+        + [{"parts": 100, "depth": d} for d in TREE_DEPTHS],
+        synthetic_assembly,
+        _run_assembly_lines,
+    ),
+    Case(
+        "explode_assembly",
+        [{"parts": n} for n in PART_COUNTS]
+        + [{"parts": 100, "depth": d} for d in TREE_DEPTHS],
+        synthetic_assembly,
+        _run_explode_assembly,
+    ),
+    Case(
+        "compute_explode_locs",
+        [{"parts": n} for n in PART_COUNTS],
+        synthetic_assembly,
+        _run_compute_explode_locs,
+    ),
+    Case(
+        "add_circular_dimensions",
+        [{"holes": n} for n in HOLE_COUNTS],
+        synthetic_plate,
+        _run_circular_dimensions,
+    ),
+    Case(
+        "find_circular_edges",
+        [{"holes": n} for n in HOLE_COUNTS],
+        synthetic_plate,
+        _run_find_circular_edges,
+    ),
+    Case(
+        "add_safety_warning",
+        [{"parts": n} for n in (10, 100)],
+        _setup_svg,
+        _run_safety_warning,
+    ),
+    Case(
+        "add_safety_warning_data",
+        [{"parts": n} for n in (10, 100)],
+        _setup_svg,
+        _run_safety_warning_data,
+    ),
+    Case(
+        "add_vector_annotations",
+        [{"parts": n} for n in PART_COUNTS],
+        _setup_vector_annotations,
+        _run_vector_annotations,
+    ),
+]
+
+
+def _case_id(case, params):
+    """
+    Builds the unique name of one benchmark, such as "add_assembly_arrows[depth=3,parts=100]".
+    """
+
+    args = ",".join("%s=%s" % (key, params[key]) for key in sorted(params))
+
+    return "%s[%s]" % (case.name, args)
+
+
+def _shape_counts(result):
+    """
+    Counts the OCCT solids and faces that a benchmark produced.
+    """
+
+    if isinstance(result, cq.Assembly):
+        compound = result.toCompound()
+        return len(compound.Solids()), len(compound.Faces())
+
+    return None, None
+
+
+def _measure(case_index, params, repeat, queue):
+    """
+    Runs one benchmark in a worker process and sends the measurements back.
+    """
+
+    case = CASES[case_index]
+
+    times = []
+    for _ in range(repeat):
+        _clear_caches()
+        state = case.setup(**params)
+
+        start = time.perf_counter()
+        result = case.run(state)
+        times.append(time.perf_counter() - start)
+
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss = peak_rss / 1024.0**2 if sys.platform == "darwin" else peak_rss / 1024.0
+
+    solids, faces = _shape_counts(result)
+
+    queue.put(
+        {
+            "time": min(times),
+            "mean_time": sum(times) / len(times),
+            "peak_rss_mb": peak_rss,
+            "solids": solids,
+            "faces": faces,
+        }
+    )
+
+
+def run_benchmarks(name_filter=None, max_size=None, repeat=3):
+    """
+    Runs the benchmarks, each in its own process.
+
+    Parameters:
+        name_filter - Only run benchmarks whose name contains this string.
+        max_size - Skip benchmarks with more parts or holes than this.
+        repeat - The number of times each benchmark is run, of which the fastest is reported.
+
+    Returns:
+        A dictionary mapping the name of each benchmark to its measurements.
+    """
+
+    context = multiprocessing.get_context("spawn")
+    results = {}
+
+    for case_index, case in enumerate(CASES):
+        for params in case.params:
+            case_id = _case_id(case, params)
+            if name_filter and name_filter not in case_id:
+                continue
+            size = params.get("parts", params.get("holes", 0))
+            if max_size is not None and size > max_size:
+                continue
+
+            queue = context.Queue()
+            worker = context.Process(
+                target=_measure, args=(case_index, params, repeat, queue)
+            )
+            worker.start()
+            result = queue.get()
+            worker.join()
+
+            results[case_id] = result
+            print(
+                "%-50s %10.4f s %10.1f MB %8s solids"
+                % (case_id, result["time"], result["peak_rss_mb"], result["solids"])
+            )
+
+    return results
+
+
+def compare_results(results, baseline, tolerance):
+    """
+    Compares benchmark results against a baseline.
+
+    Parameters:
+        results - The measurements of this run.
+        baseline - The measurements of the baseline run.
+        tolerance - The fraction that a benchmark may be slower than the baseline.
+
+    Returns:
+        A list of descriptions of the regressions that were found.
+    """
+
+    regressions = []
+
+    for case_id, result in results.items():
+        if case_id not in baseline:
+            continue
+        base = baseline[case_id]
+
+        ratio = result["time"] / base["time"] if base["time"] else 1.0
+        print("%-50s %6.2fx" % (case_id, ratio))
+
+        if ratio > 1.0 + tolerance:
+            regressions.append("%s is %.2fx slower" % (case_id, ratio))
+        if result["solids"] != base["solids"]:
+            regressions.append(
+                "%s builds %s solids instead of %s"
+                % (case_id, result["solids"], base["solids"])
+            )
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks cq-annotate.")
+    parser.add_argument("--filter", help="Only run benchmarks containing this text")
+    parser.add_argument("--max-size", type=int, help="Largest part or hole count")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark")
+    parser.add_argument("--output", help="File to save the results to")
+    parser.add_argument("--compare", help="Baseline results file to compare with")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.25, help="Allowed slowdown fraction"
+    )
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.filter, args.max_size, args.repeat)
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "cadquery": cq.__version__,
+                    "results": results,
+                },
+                output_file,
+                indent=2,
+            )
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+
+        regressions = compare_results(results, baseline, args.tolerance)
+        for regression in regressions:
+            print("REGRESSION: " + regression)
+
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+import math
+import cadquery as cq
+
+
+def synthetic_part():
+    """
+    Builds a small part with faces tagged for assembly arrows and assembly lines.
+
+    Returns:
+        The tagged part.
+    """
+
+    part = cq.Workplane().box(10, 10, 10)
+    part.faces(">Z").tag("arrow")
+    part.faces("<Z").tag("assembly_line")
+
+    return part
+
+
+def synthetic_assembly(parts, depth=1):
+    """
+    Builds an assembly of tagged parts laid out in a grid. The parts are spread over nested
+    sub-assemblies so that the leaves of the tree are the requested depth below the root.
+
+    Parameters:
+        parts - The number of parts in the assembly.
+        depth - The depth of the assembly tree, where 1 means that all parts are direct children.
+
+    Returns:
+        The assembly.
+    """
+
+    part = synthetic_part()
+    columns = math.ceil(math.sqrt(parts))
+
+    # Spread the parts evenly over the levels of the tree
+    branching = max(2, math.ceil(parts ** (1.0 / depth)))
+
+    def build(level, indices):
+        assy = cq.Assembly(name="level_%d_%d" % (level, indices[0]))
+
+        if level == depth:
+            for i in indices:
+                x = (i % columns) * 20.0
+                y = (i // columns) * 20.0
+                assy.add(
+                    part,
+                    name="part_%d" % i,
+                    loc=cq.Location((x, y, 0)),
+                    metadata={"explode_loc": cq.Location((0, 0, 15))},
+                )
+        else:
+            group_size = max(1, math.ceil(len(indices) / branching))
+            for start in range(0, len(indices), group_size):
+                assy.add(
+                    build(level + 1, indices[start : start + group_size]),
+                    metadata={"explode_loc": cq.Location((0, 0, 5))},
+                )
+
+        return assy
+
+    return build(1, list(range(parts)))
+
+
+def synthetic_plate(holes):
+    """
+    Builds a plate with a grid of holes, with the top edge of each hole tagged for a radius dimension.
+
+    Parameters:
+        holes - The number of holes in the plate.
+
+    Returns:
+        The tagged plate.
+    """
+
+    columns = math.ceil(math.sqrt(holes))
+    size = columns * 10.0 + 10.0
+
+    points = [
+        (
+            (i % columns) * 10.0 - size / 2.0 + 10.0,
+            (i // columns) * 10.0 - size / 2.0 + 10.0,
+        )
+        for i in range(holes)
+    ]
+    plate = cq.Workplane().box(size, size, 5.0)
+    plate = plate.faces(">Z").workplane().pushPoints(points).hole(4.0)
+
+    # Tag every hole edge on its own
+    edges = plate.faces(">Z").edges("%CIRCLE")
+    for i, edge in enumerate(edges.vals()):
+        edges.newObject([edge]).tag("radius_%d" % i)
+
+    return plate
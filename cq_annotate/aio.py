@@ -0,0 +1,495 @@
+import asyncio
+import contextvars
+import os
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import cadquery as cq
+from cadquery.occ_impl import geom, shapes
+from .callouts import (
+    _restore_shape_types,
+    add_assembly_arrows,
+    add_assembly_lines,
+)
+from .dimensioning import DEFAULT_PATTERN_TOLERANCE, add_circular_dimensions
+from .instrumentation import count
+from .overlays import (
+    _icons,
+    _init_overlay_worker,
+    add_safety_warning,
+    add_safety_warning_data,
+)
+from .tags import invalidate_tag_index
+
+# The default number of calls that run at the same time
+DEFAULT_CONCURRENCY = min(4, os.cpu_count() or 1)
+
+# The default number of calls that may be waiting or running before callers are held back
+DEFAULT_MAX_PENDING = 64
+
+
+# Whether the multimethods of CadQuery are ready to be called from several threads
+_multimethods_ready = False
+
+
+def _prepare_multimethods():
+    """
+    Resolves the pending type hints of the CadQuery multimethods, such as `Solid.extrudeLinear`.
+    The multimethod package does this on the first call, and a thread that calls a multimethod
+    while another thread is resolving it finds no methods, so this is done once up front for
+    every multimethod of the CadQuery shape and geometry modules.
+
+    Returns:
+        Nothing
+    """
+
+    global _multimethods_ready
+
+    if _multimethods_ready:
+        return
+
+    for module in (geom, shapes):
+        for obj in list(vars(module).values()):
+            # Skip what the module imported from elsewhere
+            if getattr(obj, "__module__", None) != module.__name__:
+                continue
+
+            members = vars(obj).values() if isinstance(obj, type) else (obj,)
+            for method in members:
+                # Class methods such as Solid.extrudeLinear wrap the multimethod
+                method = getattr(method, "__func__", method)
+
+                # Only multimethods have type hints left to resolve
+                evaluate = getattr(method, "evaluate", None)
+                if callable(evaluate):
+                    evaluate()
+
+    _multimethods_ready = True
+
+
+def _run_in_worker(func, model, args, kwargs):
+    """
+    Runs an annotation function on a model that was sent to a worker process.
+
+    Parameters:
+        func - The function to run.
+        model - The unpickled assembly or workplane that is passed to the function first.
+        args - Other positional arguments of the function.
+        kwargs - Keyword arguments of the function.
+
+    Returns:
+        The assembly that the function returned.
+    """
+
+    _restore_shape_types(model)
+
+    result = func(model, *args, **kwargs)
+
+    # The tag index is rebuilt cheaply and would only add to the data sent back
+    if isinstance(result, cq.Assembly):
+        invalidate_tag_index(result)
+
+    return result
+
+
+class AnnotationRunner:
+    """
+    Runs the blocking annotation functions on an executor so that they can be awaited from an
+    event loop without stalling it. A limited number of calls run at the same time, and a limited
+    number may be waiting, after which new calls wait for room, or fail with asyncio.QueueFull
+    when `block=False`, so that a busy service pushes back on its callers.
+    Example: `assy = await AnnotationRunner(max_concurrency=2).run(add_assembly_arrows, assy)`
+
+    The limits apply per event loop. Cancelling a call that has not started yet drops it, while a
+    call that is already running on the executor keeps its slot until it finishes.
+
+    The calls run in worker processes by default, because OCCT holds the GIL for the length of
+    each operation, so a call on a thread stalls the event loop and every other thread until the
+    operation returns. A ThreadPoolExecutor can be passed in for work that does not reach OCCT,
+    such as the SVG overlays, or to annotate the model in place instead of a copy.
+    """
+
+    def __init__(
+        self,
+        executor=None,
+        max_concurrency=DEFAULT_CONCURRENCY,
+        max_pending=DEFAULT_MAX_PENDING,
+        block=True,
+    ):
+        """
+        Parameters:
+            executor - The concurrent.futures executor to run the calls on, or None for a pool of max_concurrency worker processes.
+            max_concurrency - The number of calls that run at the same time.
+            max_pending - The number of calls that may be waiting or running at the same time.
+            block - Whether calls over the max_pending limit wait for room instead of raising asyncio.QueueFull.
+        """
+
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency has to be at least 1")
+        if max_pending < max_concurrency:
+            raise ValueError("max_pending has to be at least max_concurrency")
+
+        self.executor = executor
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.block = block
+
+        # The executor is only shut down by close() when it was created here
+        self._owns_executor = executor is None
+
+        # The admission and running semaphores of each event loop that the runner is used from
+        self._limits = weakref.WeakKeyDictionary()
+
+    def _get_executor(self):
+        """
+        Gets the executor, creating the default process pool on first use.
+
+        Returns:
+            The executor.
+        """
+
+        # The icons registered so far are sent along for the safety warnings
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.max_concurrency,
+                initializer=_init_overlay_worker,
+                initargs=(dict(_icons),),
+            )
+
+        # Worker processes call the multimethods on their own, threads share them
+        if not isinstance(self.executor, ProcessPoolExecutor):
+            _prepare_multimethods()
+
+        return self.executor
+
+    def _loop_limits(self, loop):
+        """
+        Gets the semaphores that limit the calls made from an event loop.
+
+        Parameters:
+            loop - The running event loop.
+
+        Returns:
+            A tuple of the admission and running semaphores.
+        """
+
+        limits = self._limits.get(loop)
+        if limits is None:
+            limits = (
+                asyncio.Semaphore(self.max_pending),
+                asyncio.Semaphore(self.max_concurrency),
+            )
+            self._limits[loop] = limits
+
+        return limits
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Runs a blocking function on the executor once there is room for it.
+
+        Parameters:
+            func - The function to run.
+            args - Positional arguments of the function.
+            kwargs - Keyword arguments of the function.
+
+        Returns:
+            The result of the function.
+        """
+
+        loop = asyncio.get_running_loop()
+        admission, running = self._loop_limits(loop)
+
+        if not self.block and admission.locked():
+            count("aio.rejected")
+            raise asyncio.QueueFull("Too many annotation calls are pending")
+
+        async with admission:
+            await running.acquire()
+
+            try:
+                executor = self._get_executor()
+                call = partial(func, *args, **kwargs)
+
+                # Threads run the call in a copy of the caller's context, so that a collect()
+                # block around the await records the stats of this call and no others
+                if not isinstance(executor, ProcessPoolExecutor):
+                    call = partial(contextvars.copy_context().run, call)
+
+                work = executor.submit(call)
+            except BaseException:
+                running.release()
+                raise
+
+            # The slot is given back when the work is really done, not when the caller stops waiting
+            def release(_):
+                if not loop.is_closed():
+                    loop.call_soon_threadsafe(running.release)
+
+            work.add_done_callback(release)
+            count("aio.calls")
+
+            try:
+                return await asyncio.shield(asyncio.wrap_future(work))
+            except asyncio.CancelledError:
+                # This only stops the work if the executor has not started it yet
+                if work.cancel():
+                    count("aio.cancelled")
+                raise
+
+    async def run_model(self, func, model, *args, **kwargs):
+        """
+        Runs a blocking function that takes an assembly or workplane first and returns an assembly.
+        With a process pool the model is sent to a worker process, so the assembly that is returned
+        is a copy.
+
+        Parameters:
+            func - The function to run.
+            model - The assembly or workplane that is passed to the function first.
+            args - Other positional arguments of the function.
+            kwargs - Keyword arguments of the function.
+
+        Returns:
+            The assembly that the function returned.
+        """
+
+        if not isinstance(self._get_executor(), ProcessPoolExecutor):
+            return await self.run(func, model, *args, **kwargs)
+
+        # Do not send the cached tag index along with the model
+        invalidate_tag_index(model)
+
+        result = await self.run(_run_in_worker, func, model, args, kwargs)
+
+        if isinstance(result, cq.Assembly):
+            _restore_shape_types(result)
+
+        return result
+
+    def close(self, wait=True):
+        """
+        Shuts down the executor if the runner created it.
+
+        Parameters:
+            wait - Whether to wait for running calls to finish.
+
+        Returns:
+            Nothing
+        """
+
+        if self._owns_executor and self.executor is not None:
+            self.executor.shutdown(wait=wait)
+            self.executor = None
+
+
+# The runner that the async functions use when none is passed to them
+_default_runner = None
+
+
+def configure_async(
+    executor=None,
+    max_concurrency=DEFAULT_CONCURRENCY,
+    max_pending=DEFAULT_MAX_PENDING,
+    block=True,
+):
+    """
+    Sets up the runner that the async annotation functions use by default.
+    Example: `configure_async(max_concurrency=2, max_pending=16, block=False)`
+
+    Parameters:
+        executor - The concurrent.futures executor to run the calls on, or None for a pool of max_concurrency worker processes.
+        max_concurrency - The number of calls that run at the same time.
+        max_pending - The number of calls that may be waiting or running at the same time.
+        block - Whether calls over the max_pending limit wait for room instead of raising asyncio.QueueFull.
+
+    Returns:
+        The new default AnnotationRunner.
+    """
+
+    global _default_runner
+
+    if _default_runner is not None:
+        _default_runner.close(wait=False)
+
+    _default_runner = AnnotationRunner(executor, max_concurrency, max_pending, block)
+
+    return _default_runner
+
+
+def _get_runner(runner):
+    """
+    Gets the runner to use for a call.
+
+    Parameters:
+        runner - The runner that was passed in, or None for the default runner.
+
+    Returns:
+        The AnnotationRunner.
+    """
+
+    if runner is not None:
+        return runner
+
+    if _default_runner is None:
+        configure_async()
+
+    return _default_runner
+
+
+async def add_assembly_arrows_async(
+    assy, arrow_scale_factor=1.0, annotation_layer=False, segments=None, runner=None
+):
+    """
+    Awaitable version of `callouts.add_assembly_arrows`.
+
+    Parameters:
+        assy - The assembly with faces tagged with "arrow".
+        arrow_scale_factor - Allows arrows to be scaled up and down so that they match the size of the view
+        annotation_layer - Puts the arrows in a sibling "annotations" subassembly
+        segments - Builds low detail arrows with this many sides, or "auto".
+        runner - The AnnotationRunner to use, or None for the default one.
+
+    Returns:
+        The assembly with the arrows added, which is a copy when the runner uses a process pool
+    """
+
+    return await _get_runner(runner).run_model(
+        add_assembly_arrows, assy, arrow_scale_factor, annotation_layer, segments
+    )
+
+
+async def add_assembly_lines_async(
+    assy,
+    line_diameter=0.5,
+    line_length=None,
+    selective_list=None,
+    annotation_layer=False,
+    segments=None,
+    runner=None,
+):
+    """
+    Awaitable version of `callouts.add_assembly_lines`.
+
+    Parameters:
+        assy - The assembly with faces tagged with "assembly_line".
+        line_diameter - Allows lines to be scaled up and down so that they match the size of the view
+        line_length - Allows the length of the assembly lines to be specified rather than relying on automated methods
+        selective_list - A list of the names of the parts to add lines to, or None for all of them.
+        annotation_layer - Puts the lines in a sibling "annotations" subassembly
+        segments - Builds low detail lines with this many sides, or "auto".
+        runner - The AnnotationRunner to use, or None for the default one.
+
+    Returns:
+        The assembly with the lines added, which is a copy when the runner uses a process pool
+    """
+
+    return await _get_runner(runner).run_model(
+        add_assembly_lines,
+        assy,
+        line_diameter,
+        line_length,
+        selective_list,
+        annotation_layer,
+        segments=segments,
+    )
+
+
+async def add_circular_dimensions_async(
+    obj,
+    arrow_scale_factor=1.0,
+    font_size=4,
+    text_depth=1.0,
+    font="Arial",
+    group_patterns=False,
+    tolerance=DEFAULT_PATTERN_TOLERANCE,
+    auto=False,
+    runner=None,
+):
+    """
+    Awaitable version of `dimensioning.add_circular_dimensions`.
+
+    Parameters:
+        obj - Object that has circular edges tagged for dimensions.
+        arrow_scale_factor - Allows arrows to be scaled up and down so to match the scale of the object.
+        font_size - Font size of the dimension labels.
+        text_depth - Distance that the dimension label text is extruded.
+        font - Name of the font to use for the dimension labels.
+        group_patterns - Gives each hole pattern a single "n× R" dimension, see `add_circular_dimensions`.
+        tolerance - How far the radii and planes of the edges in a pattern may differ.
+        auto - Dimensions every full circle of the object instead of the tagged edges, see `dimensioning.find_circular_edges`.
+        runner - The AnnotationRunner to use, or None for the default one.
+
+    Returns:
+        An assembly containing the object along with its dimensions.
+    """
+
+    return await _get_runner(runner).run_model(
+        add_circular_dimensions,
+        obj,
+        arrow_scale_factor,
+        font_size,
+        text_depth,
+        font,
+        group_patterns,
+        tolerance,
+        auto,
+    )
+
+
+async def add_safety_warning_async(
+    svg_path,
+    text,
+    use_icon=True,
+    font_size=24,
+    icon="safety_warning",
+    icon_scale=0.4,
+    runner=None,
+):
+    """
+    Awaitable version of `overlays.add_safety_warning`.
+
+    Parameters:
+        svg_path - File path to the SVG to add the safety warning to.
+        text - String that should be displayed as the safety warning.
+        use_icon - Whether or not to display a stock safety icon with the text warning.
+        font_size - Font size to use for the warning text.
+        icon - Name of the icon to display, either the stock "safety_warning" or one added with `register_icon`.
+        icon_scale - Scale factor that is applied to the icon.
+        runner - The AnnotationRunner to use, or None for the default one.
+
+    Returns:
+        Nothing, modifies the SVG file in-place
+    """
+
+    await _get_runner(runner).run(
+        add_safety_warning, svg_path, text, use_icon, font_size, icon, icon_scale
+    )
+
+
+async def add_safety_warning_data_async(
+    svg,
+    text,
+    use_icon=True,
+    font_size=24,
+    icon="safety_warning",
+    icon_scale=0.4,
+    runner=None,
+):
+    """
+    Awaitable version of `overlays.add_safety_warning_data`.
+
+    Parameters:
+        svg - The SVG content as a str, bytes or a file-like object to read it from.
+        text - String that should be displayed as the safety warning.
+        use_icon - Whether or not to display a stock safety icon with the text warning.
+        font_size - Font size to use for the warning text.
+        icon - Name of the icon to display, either the stock "safety_warning" or one added with `register_icon`.
+        icon_scale - Scale factor that is applied to the icon.
+        runner - The AnnotationRunner to use, or None for the default one.
+
+    Returns:
+        The SVG content with the safety warning added, as the same type that was passed in.
+    """
+
+    return await _get_runner(runner).run(
+        add_safety_warning_data, svg, text, use_icon, font_size, icon, icon_scale
+    )
@@ -1,8 +1,509 @@
+import io
+import os
 import cadquery as cq
-from math import degrees, sqrt
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from math import cos, pi, radians, sin, sqrt, tan
+from .instrumentation import cache_call, count, stage
+from .orientation import locations, normal_rotations
+from .shape_cache import cached_shape
+from .specs import AnnotationSpec
+from .tags import get_tag_index, invalidate_tag_index
+from .vector import ArrowPrimitive, LinePrimitive, world_direction, world_point
+from .views import get_explode_location
 
+# The number of distinct arrow sizes that are kept for reuse before the least recently used is evicted
+ARROW_CACHE_SIZE = 32
 
-def add_assembly_arrows(assy, arrow_scale_factor=1.0):
+# The number of distinct assembly line sizes that are kept for reuse before the least recently used is evicted
+LINE_CACHE_SIZE = 256
+
+# Name of the sibling subassembly that holds generated annotations when the annotation layer is used
+ANNOTATION_LAYER_NAME = "annotations"
+
+# The number of annotations from which segments="auto" switches to low detail annotations
+LOD_AUTO_THRESHOLD = 100
+
+# The segment counts that segments="auto" picks from, by the size of the annotations relative to
+# the size of the assembly, largest first
+LOD_LEVELS = ((0.05, 16), (0.01, 8), (0.0, 6))
+
+
+def _section(wp, radius, segments):
+    """
+    Draws the cross section of an annotation, either as a true circle or as a regular polygon.
+
+    Parameters:
+        wp - The workplane to draw on.
+        radius - Radius of the section.
+        segments - The number of sides of the polygon, or None for a circle.
+
+    Returns:
+        The workplane with the section drawn on it.
+    """
+
+    if segments is None:
+        return wp.circle(radius)
+
+    return wp.polygon(segments, radius * 2.0)
+
+
+def _polygon_frustum(bottom_radius, top_radius, height, segments):
+    """
+    Builds a regular polygonal frustum along +Z out of flat faces.
+
+    Parameters:
+        bottom_radius - Radius of the polygon at the bottom.
+        top_radius - Radius of the polygon at the top.
+        height - Height of the frustum.
+        segments - The number of sides of the polygon.
+
+    Returns:
+        The frustum solid.
+    """
+
+    angles = [2.0 * pi * i / segments for i in range(segments)]
+    bottom = [
+        cq.Vector(bottom_radius * cos(a), bottom_radius * sin(a), 0) for a in angles
+    ]
+    top = [cq.Vector(top_radius * cos(a), top_radius * sin(a), height) for a in angles]
+
+    faces = [
+        cq.Face.makeFromWires(cq.Wire.makePolygon(bottom, close=True)),
+        cq.Face.makeFromWires(cq.Wire.makePolygon(top, close=True)),
+    ]
+    for i in range(segments):
+        j = (i + 1) % segments
+        side = [bottom[i], bottom[j], top[j], top[i]]
+        faces.append(cq.Face.makeFromWires(cq.Wire.makePolygon(side, close=True)))
+
+    return cq.Solid.makeSolid(cq.Shell.makeShell(faces))
+
+
+def _lod_segments(segments, annotation_count, size, assy):
+    """
+    Resolves the segments option of the annotation builders.
+
+    Parameters:
+        segments - None for curved annotations, the number of sides of the low detail annotations, or "auto".
+        annotation_count - The number of annotations that will be added.
+        size - Size of the annotation cross section.
+        assy - The assembly being annotated, whose size sets the scale of the view.
+
+    Returns:
+        The number of sides of the annotations, or None for curved annotations.
+    """
+
+    if segments != "auto":
+        return segments
+
+    # Small numbers of annotations are cheap enough to keep at full detail
+    if annotation_count < LOD_AUTO_THRESHOLD:
+        return None
+
+    # Annotations that are small compared to the whole assembly need fewer sides to look round
+    with stage("callouts.lod"):
+        diagonal = assy.toCompound().BoundingBox().DiagonalLength
+    ratio = size / diagonal if diagonal else 1.0
+    for min_ratio, level in LOD_LEVELS:
+        if ratio >= min_ratio:
+            return level
+
+    return LOD_LEVELS[-1][1]
+
+
+def _build_arrow(tip_circle, head_circle, head_length, segments=None):
+    """
+    Builds the arrow solid for a given set of proportions.
+
+    Parameters:
+        tip_circle - Radius of the tip of the arrow head.
+        head_circle - Radius of the shaft of the arrow.
+        head_length - Length of both the arrow head and the shaft.
+        segments - The number of sides of a low detail arrow, or None for a curved arrow.
+
+    Returns:
+        A solid with the arrow tip at the origin, pointing in the -Z direction.
+    """
+
+    with stage("callouts.arrow_build"):
+        if segments is None:
+            arrow = cq.Workplane().circle(tip_circle).extrude(head_length, taper=-30)
+        else:
+            # A tapered extrude would round the corners of the polygon, so the head is built from flat faces
+            flare = tip_circle + head_length * tan(radians(30))
+            head = _polygon_frustum(tip_circle, flare, head_length, segments)
+            arrow = cq.Workplane(obj=head)
+        arrow = arrow.faces(">Z").workplane(centerOption="CenterOfBoundBox")
+        arrow = _section(arrow, head_circle, segments).extrude(head_length)
+        count("shapes_built")
+
+    return arrow.val()
+
+
+@lru_cache(maxsize=ARROW_CACHE_SIZE)
+def _arrow_prototype(tip_circle, head_circle, head_length, segments=None):
+    """
+    Gets the arrow solid for a given set of proportions. The result is cached so that all
+    arrows of the same size share one B-rep, which is then placed with a location.
+
+    Parameters:
+        tip_circle - Radius of the tip of the arrow head.
+        head_circle - Radius of the shaft of the arrow.
+        head_length - Length of both the arrow head and the shaft.
+        segments - The number of sides of a low detail arrow, or None for a curved arrow.
+
+    Returns:
+        A solid with the arrow tip at the origin, pointing in the -Z direction.
+    """
+
+    return cached_shape(
+        "arrow", (tip_circle, head_circle, head_length, segments), _build_arrow
+    )
+
+
+def _build_line(line_diameter, length, segments=None):
+    """
+    Builds the assembly line solid for a given diameter and length.
+
+    Parameters:
+        line_diameter - Diameter of the line.
+        length - Length of the line.
+        segments - The number of sides of a low detail line, or None for a cylinder.
+
+    Returns:
+        A cylinder that starts at the origin and extends along +Z.
+    """
+
+    with stage("callouts.line_build"):
+        line = _section(cq.Workplane(), line_diameter / 2.0, segments)
+        line = line.extrude(length)
+        count("shapes_built")
+
+    return line.val()
+
+
+@lru_cache(maxsize=LINE_CACHE_SIZE)
+def _line_prototype(line_diameter, length, segments=None):
+    """
+    Gets the assembly line solid for a given diameter and length. The result is cached so that
+    all lines of the same size share one B-rep, which is then placed with a location.
+
+    Parameters:
+        line_diameter - Diameter of the line.
+        length - Length of the line.
+        segments - The number of sides of a low detail line, or None for a cylinder.
+
+    Returns:
+        A cylinder that starts at the origin and extends along +Z.
+    """
+
+    return cached_shape("line", (line_diameter, length, segments), _build_line)
+
+
+def _line_location(plane):
+    """
+    Works out where an assembly line is placed so that it extends from the plane of a tagged
+    face against the normal of the plane.
+
+    Parameters:
+        plane - The plane of the tagged workplane.
+
+    Returns:
+        The location of the line relative to the part that holds the tagged face.
+    """
+
+    return cq.Location(cq.Plane(plane.origin, plane.xDir, -plane.zDir))
+
+
+def _line_brep(params):
+    """
+    Builds an assembly line in a worker process and serializes it so that it can be sent back.
+
+    Parameters:
+        params - Tuple of the diameter, length and segments of the line.
+
+    Returns:
+        The line solid as BREP bytes.
+    """
+
+    brep = io.BytesIO()
+    _line_prototype(*params).exportBrep(brep)
+
+    return brep.getvalue()
+
+
+def _build_lines(line_params, max_workers):
+    """
+    Builds the distinct assembly lines of a list, in parallel when more than one worker is requested.
+
+    Parameters:
+        line_params - A list of (diameter, length, segments) tuples, one per line.
+        max_workers - The number of worker processes, 1 to build in this process or None for
+                      the number of CPUs.
+
+    Returns:
+        A list of line solids in the same order as line_params, where lines of the same size are the same solid.
+    """
+
+    # Each size only needs to be built once
+    sizes = list(dict.fromkeys(line_params))
+
+    if max_workers == 1 or len(sizes) < 2:
+        lines = [
+            cache_call("callouts.line_cache", _line_prototype, *size) for size in sizes
+        ]
+    else:
+        # Lines are returned as BREP bytes, and executor.map keeps them in the order they were sent
+        max_workers = max_workers or os.cpu_count() or 1
+        chunk_size = max(1, len(sizes) // (max_workers * 4))
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            breps = list(executor.map(_line_brep, sizes, chunksize=chunk_size))
+
+        lines = []
+        for brep in breps:
+            lines.append(cq.Shape.importBrep(io.BytesIO(brep)))
+            count("shapes_built")
+
+    by_size = dict(zip(sizes, lines))
+
+    return [by_size[params] for params in line_params]
+
+
+# The metadata keys that hold the explode transform of a part, see `views.explode_assembly`
+EXPLODE_KEYS = ("explode_loc", "explode_translation")
+
+# The metadata keys that the length of an assembly line can be worked out from
+LINE_LENGTH_KEYS = ("assembly_line_length", "explode_loc", "explode_translation")
+
+
+def _path_nodes(assy, entry):
+    """
+    Finds the assembly nodes along the path from the root down to the node holding a tagged face.
+
+    Parameters:
+        assy - The assembly that the tag index was built from.
+        entry - The TagEntry of the tagged face.
+
+    Returns:
+        A list of the nodes, outermost first.
+    """
+
+    nodes = []
+    node = assy
+    for name in entry.path:
+        node = next((child for child in node.children if child.name == name), None)
+        if node is None:
+            break
+        nodes.append(node)
+
+    return nodes
+
+
+def _line_metadata(assy, entry):
+    """
+    Finds the explode settings that apply to a tagged face. A part inside a sub-assembly that
+    is exploded as a whole has no settings of its own, so the nearest ancestor with some is used.
+
+    Parameters:
+        assy - The assembly that the tag index was built from.
+        entry - The TagEntry of the tagged face.
+
+    Returns:
+        The metadata holding the explode settings, or None if neither the part nor its ancestors have any.
+    """
+
+    for node in reversed(_path_nodes(assy, entry)):
+        if any(key in node.metadata for key in LINE_LENGTH_KEYS):
+            return node.metadata
+
+    return None
+
+
+def _annotation_metadata(assy, entry, loc):
+    """
+    Copies the metadata of the part holding a tagged face for an annotation that is placed at a
+    location relative to the part. The explode transforms of the part and of the sub-assemblies
+    above it are folded into one "explode_loc" in the frame of the annotation, so that
+    `views.explode_assembly` moves the annotation along with the part instead of along its own axes.
+
+    Parameters:
+        assy - The assembly that the tag index was built from.
+        entry - The TagEntry of the tagged face.
+        loc - Location of the annotation relative to the part, such as the turn of an arrow onto its face.
+
+    Returns:
+        The metadata for the annotation.
+    """
+
+    metadata = {
+        key: value
+        for key, value in entry.node.metadata.items()
+        if key not in EXPLODE_KEYS
+    }
+
+    # Where the part sits at rest, and where it ends up once every level above it is exploded
+    rest = cq.Location()
+    exploded = cq.Location()
+    moved = False
+    for node in _path_nodes(assy, entry):
+        rest = rest * node.loc
+        exploded = exploded * node.loc
+
+        explode_loc = get_explode_location(node)
+        if explode_loc is not None:
+            exploded = exploded * explode_loc
+            moved = True
+
+    if moved:
+        metadata["explode_loc"] = loc.inverse * rest.inverse * exploded * loc
+
+    return metadata
+
+
+def _line_length(metadata, line_length):
+    """
+    Works out the length of an assembly line from the explode settings of its part.
+
+    Parameters:
+        metadata - Metadata holding the explode settings of the part, see `_line_metadata`.
+        line_length - Length requested by the user, or None to use the explode settings.
+
+    Returns:
+        The length of the line, or None if there is no length to use.
+    """
+
+    if line_length is not None:
+        return line_length
+
+    if metadata is None:
+        return None
+
+    # Allow the user to set a custom line length
+    if "assembly_line_length" in metadata.keys():
+        return sqrt(sum([i**2 for i in metadata["assembly_line_length"]]))
+
+    # Get the explode translation tuple
+    explode_translation = (
+        metadata["explode_loc"]
+        if "explode_loc" in metadata.keys()
+        else metadata["explode_translation"]
+    )
+    explode_translation = explode_translation.toTuple()[0]
+
+    # Calculate the length of the assembly line based on the amount of translation
+    return sqrt(sum([i**2 for i in explode_translation]))
+
+
+def _annotation_layer(assy):
+    """
+    Finds the annotation layer of an assembly, creating an empty one if it does not exist yet.
+
+    Parameters:
+        assy - The assembly that the annotation layer belongs to.
+
+    Returns:
+        The annotation layer subassembly.
+    """
+
+    for child in assy.children:
+        if child.name == ANNOTATION_LAYER_NAME:
+            return child
+
+    # Attach the layer directly so that it does not need to be copied by Assembly.add
+    layer = cq.Assembly(name=ANNOTATION_LAYER_NAME)
+    layer.parent = assy
+    assy.children.append(layer)
+    assy.objects[layer.name] = layer
+
+    return layer
+
+
+def _add_annotation(assy, obj, name, loc, color, metadata):
+    """
+    Adds a generated annotation to the annotation layer of an assembly. An annotation that
+    already exists with the same name is replaced, so that the layer can be regenerated.
+
+    The layer is a sibling of the parts, so the location is a copy of where the part sat when
+    it was annotated. Exploding afterwards is fine because the explode of the part is carried
+    over in the metadata, but parts have to be positioned before they are annotated, or the
+    layer regenerated after they are moved.
+
+    Parameters:
+        assy - The assembly that is being annotated.
+        obj - The annotation geometry.
+        name - Name of the annotation within the layer.
+        loc - Location of the annotation relative to the assembly.
+        color - Color of the annotation.
+        metadata - Metadata to attach to the annotation.
+
+    Returns:
+        Nothing, modifies the assembly in-place
+    """
+
+    layer = _annotation_layer(assy)
+    path = layer.name + "/" + name
+
+    # Replace the annotation from any previous run
+    if name in layer.objects:
+        layer.remove(name)
+        assy.objects.pop(path, None)
+
+    layer.add(obj, name=name, loc=loc, color=color, metadata=metadata)
+
+    # Keep the assembly's name lookup in sync with the layer
+    assy.objects[path] = layer.children[-1]
+
+
+def _tagged_by_child(assy, tag):
+    """
+    Looks up the faces with a given tag in the tag index of an assembly and groups them by
+    the top level part that they belong to. The annotation layer is left out.
+
+    Parameters:
+        assy - The assembly to search.
+        tag - Name of the tag to look up.
+
+    Returns:
+        A dictionary mapping the names of the top level parts to lists of TagEntry objects.
+    """
+
+    with stage("callouts.tag_lookup"):
+        index = get_tag_index(assy)
+
+    by_child = {}
+    for entry in index.get(tag, []):
+        # Only faces have the normal that annotations are lined up with
+        if entry.normal is None:
+            continue
+
+        if entry.path and entry.path[0] != ANNOTATION_LAYER_NAME:
+            by_child.setdefault(entry.path[0], []).append(entry)
+
+    return by_child
+
+
+def remove_annotation_layer(assy):
+    """
+    Removes the annotation layer, and all annotations that were added to it, from an assembly.
+    The parts of the assembly are not affected.
+
+    Parameters:
+        assy - The assembly to remove the annotation layer from.
+
+    Returns:
+        The same assembly without the annotation layer
+    """
+
+    if ANNOTATION_LAYER_NAME in assy.objects:
+        assy.remove(ANNOTATION_LAYER_NAME)
+
+    return assy
+
+
+def add_assembly_arrows(
+    assy, arrow_scale_factor=1.0, annotation_layer=False, segments=None
+):
     """
     Adds 3D arrows to the assembly at the locations of faces tagged with "arrow".
     Example: `my_object.faces(">Y").tag("arrow")`
@@ -10,71 +511,115 @@ def add_assembly_arrows(assy, arrow_scale_factor=1.0):
     Parameters:
         assy - The assembly that may have locations tagged for arrows.
         arrow_scale_factor - Allows arrows to be scaled up and down so that they match the size of the view
+        annotation_layer - Puts the arrows in a sibling "annotations" subassembly instead of pairing each
+                           arrow with a copy of its part, which leaves the parts of the assembly untouched.
+                           The arrows are placed where the parts are now, so position the parts first.
+        segments - Builds low detail arrows with this many sides instead of curved arrows, which keeps
+                   tessellation cheap for large assemblies. "auto" picks a number of sides from the number
+                   of arrows and their size relative to the assembly.
 
     Returns:
         The same assembly with the arrows added at the proper location
     """
 
-    # Search each assembly part for a face tagged "arrow"
-    for i, child in enumerate(assy.children):
-        try:
-            # Get the face location so that we can offset the arrow properly
-            face = child._query(child.name + "?arrow")
-            face_center = face[1].Center()
-            face_loc = cq.Location((face_center.x, face_center.y, face_center.z))
+    # Find the faces tagged "arrow" at any depth of the assembly in one pass
+    tagged_faces = _tagged_by_child(assy, "arrow")
 
-            # Create the arrow object
-            tip_circle = 0.5 * arrow_scale_factor
-            head_circle = 2.5 * arrow_scale_factor
-            head_length = 10.0 * arrow_scale_factor
-            arrow = cq.Workplane().circle(tip_circle).extrude(head_length, taper=-30)
-            arrow = (
-                arrow.faces(">Z")
-                .workplane(centerOption="CenterOfBoundBox")
-                .circle(head_circle)
-                .extrude(head_length)
-            )
+    # Get the shared arrow object for this size
+    tip_circle = 0.5 * arrow_scale_factor
+    head_circle = 2.5 * arrow_scale_factor
+    head_length = 10.0 * arrow_scale_factor
+    segments = _lod_segments(
+        segments,
+        sum(len(entries) for entries in tagged_faces.values()),
+        head_circle * 2.0,
+        assy,
+    )
+    arrow = cache_call(
+        "callouts.arrow_cache",
+        _arrow_prototype,
+        tip_circle,
+        head_circle,
+        head_length,
+        segments,
+    )
 
-            # Figure out the angle between the normal vector of the face and the length axis of the arrow
-            face_normal = face[1].normalAt(cq.Vector(0, 0, 0))
-            rotation_angle = face_normal.wrapped.AngleWithRef(
-                cq.Vector(0, 0, 1).wrapped, cq.Vector(-1, -1, -1).wrapped
+    # Work out the orientation of every arrow in one batch, in the same order as the loop below
+    entries = [
+        entry for child in assy.children for entry in tagged_faces.get(child.name, [])
+    ]
+    with stage("callouts.rotation"):
+        # Turn each arrow so that it points back at its face, against the face normal
+        arrow_locs = iter(
+            locations(
+                normal_rotations([entry.normal.toTuple() for entry in entries]),
+                [entry.center.toTuple() for entry in entries],
             )
-            rotation_angle = degrees(rotation_angle)
+        )
 
-            # Rotate the arrow around its tip so that it will be in the correct position
-            arrow = arrow.rotate((-10, 0, 0), (10, 0, 0), rotation_angle)
+    for i, child in enumerate(list(assy.children)):
+        # Skip parts that do not have any faces tagged for arrows
+        if child.name not in tagged_faces:
+            continue
 
-            # This holds the object-arrow subassembly that is created
-            sub_assy = cq.Assembly()
+        # This holds the object-arrow subassembly that is created
+        sub_assy = cq.Assembly()
 
-            # Make the original child and the sub-assembly one entity
-            sub_assy.add(
-                child,
-                name=child.name,
-                loc=child.loc,
-                color=child.color,
-                metadata=child.metadata,
-            )
+        # Make the original child and the sub-assembly one entity
+        if not annotation_layer:
+            with stage("callouts.copy"):
+                sub_assy.add(
+                    child,
+                    name=child.name,
+                    loc=child.loc,
+                    color=child.color,
+                    metadata=child.metadata,
+                )
+                count("copies_made")
+
+        for entry in tagged_faces[child.name]:
+            arrow_loc = next(arrow_locs)
+
+            # The arrow explodes along with its part, not along its own turned axes
+            metadata = _annotation_metadata(assy, entry, arrow_loc)
+
+            # Add the arrow to the annotation layer without touching the part
+            if annotation_layer:
+                _add_annotation(
+                    assy,
+                    arrow,
+                    "arrow_" + "_".join(entry.path),
+                    entry.loc * arrow_loc,
+                    cq.Color(0.0, 0.0, 0.0, 1.0),
+                    metadata,
+                )
+                continue
 
             # Make the assembly arrow part of the assembly
             sub_assy.add(
                 arrow,
-                name="arrow_" + str(i),
-                loc=child.loc * face_loc,
+                name="_".join(("arrow", str(i)) + entry.path[1:]),
+                loc=entry.loc * arrow_loc,
                 color=cq.Color(0.0, 0.0, 0.0, 1.0),
-                metadata=child.metadata,
+                metadata=metadata,
             )
 
-            # Replace the previous single child with the child plus the arrow
-            assy.children[i] = sub_assy._copy()
-        except Exception as err:
-            pass
+        # Replace the previous single child with the child plus the arrows
+        if not annotation_layer:
+            assy.children[i] = sub_assy
 
     return assy
 
 
-def add_assembly_lines(assy, line_diameter=0.5, line_length=None, selective_list=None):
+def add_assembly_lines(
+    assy,
+    line_diameter=0.5,
+    line_length=None,
+    selective_list=None,
+    annotation_layer=False,
+    max_workers=1,
+    segments=None,
+):
     """
     Adds 3D lines (cylinders) to the assembly at the locations of faces tagged with "assembly_line".
     The lines will utilize the explode_loc distance to determine the length of the line.
@@ -84,75 +629,360 @@ def add_assembly_lines(assy, line_diameter=0.5, line_length=None, selective_list
         assy - The assembly that may have locations tagged for assembly lines.
         line_diameter - Allows lines to be scaled up and down so that they match the size of the view
         line_length - ALlows the length of the assembly line to be specified rather than relying on automated methods
+        annotation_layer - Puts the lines in a sibling "annotations" subassembly instead of pairing each
+                           line with a copy of its part, which leaves the parts of the assembly untouched.
+                           The lines are placed where the parts are now, so position the parts first.
+        max_workers - The number of processes that build the lines, 1 to build them in this process
+                      or None for the number of CPUs
+        segments - Builds low detail lines with this many sides instead of cylinders, which keeps
+                   tessellation cheap for large assemblies. "auto" picks a number of sides from the number
+                   of lines and their size relative to the assembly.
 
     Returns:
         The same assembly with the line added at the proper location
     """
 
-    # Search each assembly part for a face tagged "assembly_line"
-    for i, child in enumerate(assy.children):
+    # Find the faces tagged "assembly_line" at any depth of the assembly in one pass
+    tagged_faces = _tagged_by_child(assy, "assembly_line")
+
+    # Work out every line up front so that the solids can be built together
+    jobs = []
+    for i, child in enumerate(list(assy.children)):
+        # Skip parts that do not have any faces tagged for assembly lines
+        if child.name not in tagged_faces:
+            continue
+
         # Filter out parts that are not in the selective explode list
         if selective_list is not None and child.name not in selective_list:
             continue
 
-        # Get the face location so that we can offset the line properly
-        try:
-            face = child._query(child.name + "?assembly_line")
-        except:
-            continue
-        face_center = face[1].Center()
-        face_loc = cq.Location((face_center.x, face_center.y, face_center.z))
-
-        # Figure out the correct line length
-        if line_length is None:
-            # Get the explode translation tuple
-            explode_translation = (
-                child.metadata["explode_loc"]
-                if "explode_loc" in child.metadata.keys()
-                else child.metadata["explode_translation"]
-            )
-            explode_translation = explode_translation.toTuple()[0]
-
-            # Allow the user to set a custom line length
-            if "assembly_line_length" in child.metadata.keys():
-                line_length_tuple = child.metadata["assembly_line_length"]
-                line_length = sqrt(sum([i**2 for i in line_length_tuple]))
-            else:
-                # Calculate the length of the assembly line based on the amount of translation
-                line_length = sqrt(sum([i**2 for i in explode_translation]))
-
-        # Create the line object
-        line = cq.Workplane(child.obj.workplaneFromTagged("assembly_line").plane)
-        line.zDir = face[1].normalAt(cq.Vector(0, 0, 0))
-        line = (
-            line.workplane(invert=True).circle(line_diameter / 2.0).extrude(line_length)
-        )
+        for entry in tagged_faces[child.name]:
+            # Figure out the correct line length, skipping parts that are not exploded
+            length = _line_length(_line_metadata(assy, entry), line_length)
+            if length is None:
+                continue
 
-        # This holds the object-line subassembly that is created
-        sub_assy = cq.Assembly()
+            # The shared line is placed on the plane of the tagged workplane
+            plane_loc = _line_location(entry.workplane.plane)
+            jobs.append((i, child, entry, length, plane_loc))
 
-        # Make the original child and the sub-assembly one entity
-        sub_assy.add(
-            child,
-            name=child.name,
-            loc=child.loc,
-            color=child.color,
-            metadata=child.metadata,
-        )
+    # Create the line objects
+    segments = _lod_segments(segments, len(jobs), line_diameter, assy)
+    lines = _build_lines(
+        [(line_diameter, length, segments) for _, _, _, length, _ in jobs],
+        max_workers,
+    )
 
-        # Make the assembly line part of the assembly
-        new_meta = child.metadata.copy()
+    # Merge the lines back into the assembly in the order of its children
+    sub_assemblies = {}
+    for (i, child, entry, length, plane_loc), line in zip(jobs, lines):
+        line_loc = entry.loc * plane_loc
+
+        # The line settings that make it show up in red, and explode it along with its part
+        new_meta = _annotation_metadata(assy, entry, plane_loc)
         new_meta["edge_color"] = cq.Color(1.0, 0.0, 0.0, 1.0)
         new_meta["edge_width"] = (
             3  # Anything less than 3 will cause the custom color to be ignored
         )
+
+        # Add the line to the annotation layer without touching the part
+        if annotation_layer:
+            _add_annotation(
+                assy,
+                line,
+                "assembly_line_" + "_".join(entry.path),
+                line_loc,
+                cq.Color(1.0, 0.0, 0.0, 1.0),
+                new_meta,
+            )
+            continue
+
+        # This holds the object-line subassembly that is created
+        sub_assy = sub_assemblies.get(i)
+        if sub_assy is None:
+            sub_assy = cq.Assembly()
+            sub_assemblies[i] = sub_assy
+
+            # Make the original child and the sub-assembly one entity
+            with stage("callouts.copy"):
+                sub_assy.add(
+                    child,
+                    name=child.name,
+                    loc=child.loc,
+                    color=child.color,
+                    metadata=child.metadata,
+                )
+                count("copies_made")
+
+        # Make the assembly line part of the assembly
         sub_assy.add(
             line,
-            name="assembly_line_" + str(i),
-            loc=child.loc,
+            name="_".join(("assembly_line", str(i)) + entry.path[1:]),
+            loc=line_loc,
             color=cq.Color(1.0, 0.0, 0.0, 1.0),
             metadata=new_meta,
         )
 
-        # Replace the previous single child with the child plus the line
-        assy.children[i] = sub_assy._copy()
+    # Replace the previous single children with the children plus the lines
+    for i, sub_assy in sub_assemblies.items():
+        assy.children[i] = sub_assy
+
+    return assy
+
+
+def get_assembly_arrow_specs(assy, arrow_scale_factor=1.0):
+    """
+    Finds the arrows that `add_assembly_arrows` would add, as lightweight AnnotationSpec records
+    that hold no geometry. The solids can be built later with `deferred.DeferredAnnotations`,
+    or never, if the arrows are not displayed.
+
+    Parameters:
+        assy - The assembly that may have faces tagged for arrows.
+        arrow_scale_factor - Allows arrows to be scaled up and down so that they match the size of the view
+
+    Returns:
+        A list of AnnotationSpec objects, in the coordinates of the assembly.
+    """
+
+    tagged_faces = _tagged_by_child(assy, "arrow")
+
+    specs = []
+    for child in assy.children:
+        for entry in tagged_faces.get(child.name, []):
+            # The arrow points back at the face, against its normal
+            normal = world_direction(entry.loc, entry.normal)
+            specs.append(
+                AnnotationSpec(
+                    "arrow",
+                    world_point(entry.loc, entry.center),
+                    tuple(-n for n in normal),
+                    size=arrow_scale_factor,
+                    length=20.0 * arrow_scale_factor,
+                    name="arrow_" + "_".join(entry.path),
+                )
+            )
+
+    return specs
+
+
+def get_assembly_line_specs(
+    assy, line_diameter=0.5, line_length=None, selective_list=None
+):
+    """
+    Finds the lines that `add_assembly_lines` would add, as lightweight AnnotationSpec records
+    that hold no geometry. The solids can be built later with `deferred.DeferredAnnotations`,
+    or never, if the lines are not displayed.
+
+    Parameters:
+        assy - The assembly that may have faces tagged for assembly lines.
+        line_diameter - Allows lines to be scaled up and down so that they match the size of the view
+        line_length - Allows the length of the assembly line to be specified rather than relying on automated methods
+        selective_list - Names of the only parts that should get lines, or None for all parts.
+
+    Returns:
+        A list of AnnotationSpec objects, in the coordinates of the assembly.
+    """
+
+    tagged_faces = _tagged_by_child(assy, "assembly_line")
+
+    specs = []
+    for child in assy.children:
+        # Filter out parts that are not in the selective explode list
+        if selective_list is not None and child.name not in selective_list:
+            continue
+
+        for entry in tagged_faces.get(child.name, []):
+            # Skip parts that are not exploded, like add_assembly_lines
+            length = _line_length(_line_metadata(assy, entry), line_length)
+            if length is None:
+                continue
+
+            # The line runs from the tagged workplane against its normal, like the solid line
+            plane = entry.workplane.plane
+            specs.append(
+                AnnotationSpec(
+                    "line",
+                    world_point(entry.loc, plane.origin),
+                    world_direction(entry.loc, -plane.zDir),
+                    size=line_diameter,
+                    length=length,
+                    name="assembly_line_" + "_".join(entry.path),
+                )
+            )
+
+    return specs
+
+
+def get_assembly_arrow_primitives(assy, arrow_scale_factor=1.0):
+    """
+    Finds the arrows that `add_assembly_arrows` would add, as 2D vector primitives that can be
+    drawn on an SVG view with `vector.add_vector_annotations` instead of being built as solids.
+
+    Parameters:
+        assy - The assembly that may have faces tagged for arrows.
+        arrow_scale_factor - Allows arrows to be scaled up and down so that they match the size of the view
+
+    Returns:
+        A list of ArrowPrimitive objects, in the coordinates of the assembly.
+    """
+
+    return [
+        ArrowPrimitive(spec.anchor, spec.direction, spec.length)
+        for spec in get_assembly_arrow_specs(assy, arrow_scale_factor)
+    ]
+
+
+def get_assembly_line_primitives(assy, line_length=None, selective_list=None):
+    """
+    Finds the lines that `add_assembly_lines` would add, as 2D vector primitives that can be
+    drawn on an SVG view with `vector.add_vector_annotations` instead of being built as solids.
+
+    Parameters:
+        assy - The assembly that may have faces tagged for assembly lines.
+        line_length - Allows the length of the assembly line to be specified rather than relying on automated methods
+        selective_list - Names of the only parts that should get lines, or None for all parts.
+
+    Returns:
+        A list of LinePrimitive objects, in the coordinates of the assembly.
+    """
+
+    return [
+        LinePrimitive(spec.anchor, spec.direction, spec.length)
+        for spec in get_assembly_line_specs(
+            assy, line_length=line_length, selective_list=selective_list
+        )
+    ]
+
+
+def _restore_shape_types(assy):
+    """
+    Pickled shapes come back holding a generic TopoDS_Shape, which the face and edge methods of
+    CadQuery do not accept. This casts the shapes of an assembly back to their own types.
+
+    Parameters:
+        assy - The assembly, or workplane, that was unpickled.
+
+    Returns:
+        Nothing, modifies the assembly in-place
+    """
+
+    def cast(objects):
+        return [
+            cq.Shape.cast(obj.wrapped) if isinstance(obj, cq.Shape) else obj
+            for obj in objects
+        ]
+
+    def restore_workplane(wp):
+        wp.objects = cast(wp.objects)
+        for tagged in wp.ctx.tags.values():
+            tagged.objects = cast(tagged.objects)
+
+    if isinstance(assy, cq.Workplane):
+        restore_workplane(assy)
+        return
+
+    stack = [assy]
+    while stack:
+        node = stack.pop()
+
+        if isinstance(node.obj, cq.Shape):
+            node.obj = cq.Shape.cast(node.obj.wrapped)
+        elif isinstance(node.obj, cq.Workplane):
+            restore_workplane(node.obj)
+
+        stack.extend(node.children)
+
+
+def _annotate_assembly(job):
+    """
+    Annotates one assembly of a batch in a worker process.
+
+    Parameters:
+        job - Tuple of the assembly and the annotate_assemblies options.
+
+    Returns:
+        The annotated assembly.
+    """
+
+    (
+        assy,
+        arrows,
+        lines,
+        arrow_scale_factor,
+        line_diameter,
+        annotation_layer,
+        segments,
+    ) = job
+    _restore_shape_types(assy)
+
+    if arrows:
+        add_assembly_arrows(assy, arrow_scale_factor, annotation_layer, segments)
+    if lines:
+        add_assembly_lines(
+            assy, line_diameter, annotation_layer=annotation_layer, segments=segments
+        )
+
+    # The tag index is rebuilt cheaply and would only add to the data sent back
+    invalidate_tag_index(assy)
+
+    return assy
+
+
+def annotate_assemblies(
+    assemblies,
+    arrows=True,
+    lines=True,
+    arrow_scale_factor=1.0,
+    line_diameter=0.5,
+    annotation_layer=False,
+    max_workers=None,
+    segments=None,
+):
+    """
+    Adds assembly arrows and assembly lines to many independent assemblies in parallel, using
+    a pool of processes.
+
+    Parameters:
+        assemblies - The assemblies to annotate.
+        arrows - Whether to add the arrows of faces tagged with "arrow".
+        lines - Whether to add the lines of faces tagged with "assembly_line".
+        arrow_scale_factor - Allows arrows to be scaled up and down so that they match the size of the view
+        line_diameter - Allows lines to be scaled up and down so that they match the size of the view
+        annotation_layer - Puts the annotations in a sibling "annotations" subassembly of each assembly
+        max_workers - The number of worker processes, defaulting to the number of CPUs.
+        segments - Builds low detail annotations with this many sides, or "auto", see `add_assembly_arrows`.
+
+    Returns:
+        A list of the annotated assemblies, in the same order as they were given. These are
+        copies when more than one worker is used, since the assemblies are sent between processes.
+    """
+
+    jobs = []
+    for assy in assemblies:
+        # Do not send the cached tag index along with the assembly
+        invalidate_tag_index(assy)
+        jobs.append(
+            (
+                assy,
+                arrows,
+                lines,
+                arrow_scale_factor,
+                line_diameter,
+                annotation_layer,
+                segments,
+            )
+        )
+
+    if max_workers == 1 or len(jobs) < 2:
+        return [_annotate_assembly(job) for job in jobs]
+
+    # executor.map keeps the results in the order that the assemblies were given in
+    max_workers = max_workers or os.cpu_count() or 1
+    chunk_size = max(1, len(jobs) // (max_workers * 4))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(_annotate_assembly, jobs, chunksize=chunk_size))
+
+    for assy in results:
+        _restore_shape_types(assy)
+
+    return results
@@ -0,0 +1,307 @@
+import cadquery as cq
+from .callouts import (
+    ANNOTATION_LAYER_NAME,
+    _add_annotation,
+    _arrow_prototype,
+    _line_prototype,
+    get_assembly_arrow_specs,
+    get_assembly_line_specs,
+)
+from .dimensioning import (
+    DEFAULT_PATTERN_TOLERANCE,
+    _label_prototype,
+    _leader_prototype,
+    get_circular_dimension_specs,
+)
+from .instrumentation import cache_call, count, stage
+from .orientation import spec_locations
+from .specs import specs_from_json, specs_to_json
+
+# The colors that annotations are built with, by kind
+ARROW_COLOR = (0.0, 0.0, 0.0, 1.0)
+LINE_COLOR = (1.0, 0.0, 0.0, 1.0)
+
+
+class DeferredAnnotations:
+    """
+    A set of annotations that are kept as AnnotationSpec records and only built into solids when
+    they are asked for, such as by `toCompound`, `to_assembly` or `export`. Specs that are
+    filtered out, or sets that are only serialized or drawn as SVG vectors, never build any geometry.
+    Example: `DeferredAnnotations.from_assembly(assy).export("annotations.step")`
+    """
+
+    def __init__(self, specs, segments=None, font="Arial"):
+        """
+        Parameters:
+            specs - The AnnotationSpec objects.
+            segments - Builds low detail arrows and lines with this many sides, or None for curved ones.
+            font - Name of the font to use for labels.
+        """
+
+        self.specs = list(specs)
+        self.segments = segments
+        self.font = font
+
+        # The assembly of solids, once it has been built
+        self._assembly = None
+
+    @classmethod
+    def from_assembly(
+        cls,
+        assy,
+        arrows=True,
+        lines=True,
+        arrow_scale_factor=1.0,
+        line_diameter=0.5,
+        line_length=None,
+        segments=None,
+    ):
+        """
+        Collects the arrows and lines that `add_assembly_arrows` and `add_assembly_lines` would
+        add to an assembly, without building them.
+
+        Parameters:
+            assy - The assembly with faces tagged with "arrow" and "assembly_line".
+            arrows - Whether to collect the arrows.
+            lines - Whether to collect the lines.
+            arrow_scale_factor - Allows arrows to be scaled up and down so that they match the size of the view
+            line_diameter - Allows lines to be scaled up and down so that they match the size of the view
+            line_length - Allows the length of the assembly lines to be specified rather than relying on automated methods
+            segments - Builds low detail arrows and lines with this many sides, or None for curved ones.
+
+        Returns:
+            The DeferredAnnotations.
+        """
+
+        specs = []
+        if arrows:
+            specs.extend(get_assembly_arrow_specs(assy, arrow_scale_factor))
+        if lines:
+            specs.extend(get_assembly_line_specs(assy, line_diameter, line_length))
+
+        return cls(specs, segments)
+
+    @classmethod
+    def from_dimensions(
+        cls,
+        obj,
+        arrow_scale_factor=1.0,
+        font_size=4,
+        text_depth=1.0,
+        font="Arial",
+        group_patterns=False,
+        tolerance=DEFAULT_PATTERN_TOLERANCE,
+        auto=False,
+    ):
+        """
+        Collects the radius dimensions of the tagged circular edges of an object, without building them.
+
+        Parameters:
+            obj - Object that has circular edges tagged for dimensions.
+            arrow_scale_factor - Allows arrows to be scaled up and down so to match the scale of the object.
+            font_size - Font size of the dimension labels.
+            text_depth - Distance that the dimension label text is extruded.
+            font - Name of the font to use for the dimension labels.
+            group_patterns - Gives each hole pattern a single "n× R" dimension, see `dimensioning.add_circular_dimensions`.
+            tolerance - How far the radii and planes of the edges in a pattern may differ.
+            auto - Dimensions every full circle of the object instead of the tagged edges, see `dimensioning.find_circular_edges`.
+
+        Returns:
+            The DeferredAnnotations.
+        """
+
+        specs = get_circular_dimension_specs(
+            obj,
+            arrow_scale_factor,
+            font_size,
+            text_depth,
+            font,
+            group_patterns,
+            tolerance,
+            auto,
+        )
+
+        return cls(specs or [], font=font)
+
+    @classmethod
+    def from_json(cls, text, segments=None, font="Arial"):
+        """
+        Reads annotations that were written by `to_json`.
+
+        Parameters:
+            text - The JSON text.
+            segments - Builds low detail arrows and lines with this many sides, or None for curved ones.
+            font - Name of the font to use for labels.
+
+        Returns:
+            The DeferredAnnotations.
+        """
+
+        return cls(specs_from_json(text), segments, font)
+
+    def to_json(self):
+        """
+        Writes the annotation specs as JSON, without building any geometry.
+
+        Returns:
+            The JSON text.
+        """
+
+        return specs_to_json(self.specs)
+
+    def __len__(self):
+        return len(self.specs)
+
+    def __iter__(self):
+        return iter(self.specs)
+
+    def filter(self, keep):
+        """
+        Picks out the annotations that should be displayed, so that the others are never built.
+
+        Parameters:
+            keep - Function that is passed each AnnotationSpec and returns whether to keep it.
+
+        Returns:
+            A new DeferredAnnotations with the kept specs.
+        """
+
+        return DeferredAnnotations(
+            [spec for spec in self.specs if keep(spec)], self.segments, self.font
+        )
+
+    def _build(self, spec):
+        """
+        Gets the shared prototype solid of an annotation.
+
+        Parameters:
+            spec - The AnnotationSpec.
+
+        Returns:
+            A tuple of the solid, its color and its metadata.
+        """
+
+        if spec.kind == "arrow":
+            scale = spec.size
+            solid = cache_call(
+                "callouts.arrow_cache",
+                _arrow_prototype,
+                0.5 * scale,
+                2.5 * scale,
+                10.0 * scale,
+                self.segments,
+            )
+
+            return solid, cq.Color(*ARROW_COLOR), {}
+
+        if spec.kind == "leader":
+            solid = cache_call(
+                "dimensioning.leader_cache",
+                _leader_prototype,
+                0.5 * spec.size,
+                10.0 * spec.size,
+            )
+
+            return solid, None, {}
+
+        if spec.kind == "line":
+            solid = cache_call(
+                "callouts.line_cache",
+                _line_prototype,
+                spec.size,
+                spec.length,
+                self.segments,
+            )
+
+            # Anything less than 3 will cause the custom edge color to be ignored
+            metadata = {"edge_color": cq.Color(*LINE_COLOR), "edge_width": 3}
+
+            return solid, cq.Color(*LINE_COLOR), metadata
+
+        if spec.kind == "label":
+            solid = cache_call(
+                "dimensioning.label_cache",
+                _label_prototype,
+                spec.label,
+                "XY",
+                spec.size,
+                spec.length,
+                self.font,
+            )
+
+            return solid, None, {}
+
+        raise ValueError("Unknown annotation kind %r" % (spec.kind,))
+
+    def to_assembly(self):
+        """
+        Builds the solids of the annotations into an assembly. Annotations of the same kind and
+        size share one solid. The assembly is built once and then reused.
+
+        Returns:
+            An assembly named "annotations" with a node for each annotation.
+        """
+
+        if self._assembly is not None:
+            return self._assembly
+
+        assy = cq.Assembly(name=ANNOTATION_LAYER_NAME)
+        with stage("deferred.materialize"):
+            locs = spec_locations(self.specs)
+            for i, (spec, loc) in enumerate(zip(self.specs, locs)):
+                solid, color, metadata = self._build(spec)
+                assy.add(
+                    solid,
+                    name=spec.name or "%s_%d" % (spec.kind, i),
+                    loc=loc,
+                    color=color,
+                    metadata=metadata,
+                )
+                count("deferred.materialized")
+
+        self._assembly = assy
+
+        return assy
+
+    def add_to(self, assy):
+        """
+        Builds the annotations into the annotation layer of an assembly, see `callouts.remove_annotation_layer`.
+
+        Parameters:
+            assy - The assembly that the specs were collected from.
+
+        Returns:
+            The same assembly with the annotations added to its annotation layer
+        """
+
+        for node in self.to_assembly().children:
+            _add_annotation(
+                assy, node.obj, node.name, node.loc, node.color, node.metadata
+            )
+
+        return assy
+
+    def toCompound(self):
+        """
+        Builds the annotations and combines them into one compound, like `cq.Assembly.toCompound`.
+
+        Returns:
+            The compound of the located annotation solids.
+        """
+
+        return self.to_assembly().toCompound()
+
+    def export(self, path, exportType=None, **kwargs):
+        """
+        Builds the annotations and exports them, like `cq.Assembly.export`.
+
+        Parameters:
+            path - Path of the file to write.
+            exportType - Format of the file, or None to infer it from the path.
+            kwargs - Other options that are passed on to `cq.Assembly.export`.
+
+        Returns:
+            Nothing
+        """
+
+        self.to_assembly().export(path, exportType, **kwargs)
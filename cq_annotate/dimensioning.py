@@ -1,118 +1,762 @@
-from math import radians, cos
+from collections import namedtuple
+from functools import lru_cache
+from math import radians, cos, sin, tan
+import numpy as np
 import cadquery as cq
+from .instrumentation import cache_call, count, stage
+from .orientation import frame_rotations, spec_locations
+from .shape_cache import cached_shape
+from .spatial import GridIndex
+from .specs import AnnotationSpec
+from .tags import get_tag_index
+from .vector import ArrowPrimitive, TextPrimitive
 
+# How far the radii and planes of the edges of a hole pattern may differ by default
+DEFAULT_PATTERN_TOLERANCE = 1e-3
 
-def add_circular_dimensions(obj, arrow_scale_factor=1.0):
+# Circular edges that get one dimension together
+#   name - The tag of the edge that the dimension points at, or a generated name for found edges
+#   edge - The edge that the dimension points at
+#   center - Center of the edge, as a tuple
+#   x_dir - X direction of the plane that the dimension is drawn on, as a tuple
+#   normal - Normal of the plane of the edge, as a tuple
+#   radius - Radius of the edges
+#   count - The number of edges in the group
+DimensionGroup = namedtuple(
+    "DimensionGroup", ["name", "edge", "center", "x_dir", "normal", "radius", "count"]
+)
+
+# The full circles of a shape that can be dimensioned, as parallel arrays
+#   edges - A list of the edges, one for each circle
+#   centers - An (n, 3) array of the centers of the circles
+#   axes - An (n, 3) array of the unit normals of the circles, flipped so that their largest component is positive
+#   x_dirs - An (n, 3) array of the X directions of the planes that the dimensions are drawn on
+#   radii - An (n,) array of the radii of the circles
+CircleCandidates = namedtuple(
+    "CircleCandidates", ["edges", "centers", "axes", "x_dirs", "radii"]
+)
+
+# The number of distinct dimension leader sizes that are kept for reuse before the least recently used is evicted
+LEADER_CACHE_SIZE = 32
+
+# The number of distinct dimension labels that are kept for reuse before the least recently used is evicted
+LABEL_CACHE_SIZE = 256
+
+# The straight path of a dimension leader behind its arrow head, and the bent end that runs towards the label
+LEADER_PATH_LENGTH = 10.0
+LEADER_BEND_LENGTH = 5.0
+
+# The angle that the arrow head of a dimension leader widens at
+LEADER_TAPER = 30.0
+
+# The room that a character of a label is given, as a fraction of the font size, which is more than
+# the characters of common fonts take up, so that labels are placed apart without building their text
+LABEL_CHAR_WIDTH = 0.6
+LABEL_HEIGHT = 1.0
+
+
+def _build_label(label, plane_name, font_size, depth, font):
+    """
+    Builds the extruded text solid for a dimension label.
+
+    Parameters:
+        label - Text of the label.
+        plane_name - Name of the plane that the text is drawn on.
+        font_size - Size of the font.
+        depth - Distance that the text is extruded.
+        font - Name of the font.
+
+    Returns:
+        A shape holding the extruded text.
+    """
+
+    with stage("dimensioning.text_build"):
+        text = (
+            cq.Workplane(plane_name)
+            .workplane(centerOption="CenterOfBoundBox")
+            .text(label, fontsize=font_size, distance=depth, font=font)
+        )
+        count("shapes_built")
+
+    return text.val()
+
+
+@lru_cache(maxsize=LABEL_CACHE_SIZE)
+def _label_prototype(label, plane_name, font_size, depth, font):
+    """
+    Gets the extruded text solid for a dimension label. The result is cached so that all
+    labels with the same text share one B-rep, which is then placed with a location.
+
+    Parameters:
+        label - Text of the label.
+        plane_name - Name of the plane that the text is drawn on.
+        font_size - Size of the font.
+        depth - Distance that the text is extruded.
+        font - Name of the font.
+
+    Returns:
+        A shape holding the extruded text.
+    """
+
+    return cached_shape(
+        "label", (label, plane_name, font_size, depth, font), _build_label
+    )
+
+
+def _build_leader(tip_circle, head_length):
+    """
+    Builds the dimension leader, an arrow head with a path that bends up towards the text.
+
+    Parameters:
+        tip_circle - Radius of the tip of the arrow head and of the path.
+        head_length - Length of the arrow head.
+
+    Returns:
+        A solid with the arrow tip at the origin and the path running out along the diagonal
+        between the X and Y axes, bending towards X at its end.
+    """
+
+    with stage("dimensioning.arrow_build"):
+        arrow = (
+            cq.Workplane("XY")
+            .circle(tip_circle)
+            .extrude(head_length, taper=-LEADER_TAPER)
+        )
+        arrow = arrow.rotate((0, 0, 0), (0, 1, 0), 90)
+        arrow = (
+            arrow.faces(">X")
+            .workplane(centerOption="CenterOfBoundBox")
+            .circle(tip_circle)
+            .extrude(LEADER_PATH_LENGTH, combine=True)
+            .faces(">X")
+            .workplane(centerOption="CenterOfBoundBox")
+            .transformed(rotate=(0.0, -45.0, 0.0))
+            .circle(tip_circle)
+            .extrude(LEADER_BEND_LENGTH)
+        )
+        arrow = arrow.rotate((0, 0, 0), (0, 0, 1), 45)
+        count("shapes_built")
+
+    return arrow.val()
+
+
+@lru_cache(maxsize=LEADER_CACHE_SIZE)
+def _leader_prototype(tip_circle, head_length):
+    """
+    Gets the dimension leader for a given size. The result is cached so that all leaders of
+    the same size share one B-rep, which is placed on the plane of each edge with a location.
+
+    Parameters:
+        tip_circle - Radius of the tip of the arrow head and of the path.
+        head_length - Length of the arrow head.
+
+    Returns:
+        A solid with the arrow tip at the origin and the path running out along the diagonal
+        between the X and Y axes, bending towards X at its end.
+    """
+
+    return cached_shape("leader", (tip_circle, head_length), _build_leader)
+
+
+def _leader_extents(tip_circle, head_length):
+    """
+    Works out a rectangle on the XY plane that holds the dimension leader of `_build_leader`,
+    without building it. Each piece of the leader is bounded by spheres around its ends, so the
+    rectangle is a little larger than the leader.
+
+    Parameters:
+        tip_circle - Radius of the tip of the arrow head and of the path.
+        head_length - Length of the arrow head.
+
+    Returns:
+        A tuple of the (xmin, ymin, xmax, ymax) of the leader.
+    """
+
+    # The ends of the pieces before the leader is turned onto the diagonal, with their radii
+    head_circle = tip_circle + head_length * tan(radians(LEADER_TAPER))
+    path_end = head_length + LEADER_PATH_LENGTH
+    bend = LEADER_BEND_LENGTH * cos(radians(45))
+    ends = np.array(
+        [
+            (0.0, 0.0, tip_circle),
+            (head_length, 0.0, head_circle),
+            (path_end, 0.0, tip_circle),
+            (path_end + bend, -bend, tip_circle),
+        ]
+    )
+
+    # Turn the ends onto the diagonal between the X and Y axes
+    c = cos(radians(45))
+    s = sin(radians(45))
+    x = c * ends[:, 0] - s * ends[:, 1]
+    y = s * ends[:, 0] + c * ends[:, 1]
+    r = ends[:, 2]
+
+    return (
+        float((x - r).min()),
+        float((y - r).min()),
+        float((x + r).max()),
+        float((y + r).max()),
+    )
+
+
+def _label_extents(label, font_size):
+    """
+    Works out a rectangle on the XY plane that holds the text of `_build_label`, which is centered
+    on the origin, from the length of the label instead of building the text.
+
+    Parameters:
+        label - Text of the label.
+        font_size - Size of the font.
+
+    Returns:
+        A tuple of the (xmin, ymin, xmax, ymax) of the text.
+    """
+
+    width = LABEL_CHAR_WIDTH * font_size * len(label)
+    height = LABEL_HEIGHT * font_size
+
+    return (-width / 2.0, -height / 2.0, width / 2.0, height / 2.0)
+
+
+def _shapes_of(obj):
+    """
+    Gets the shapes held by an object.
+
+    Parameters:
+        obj - Shape or workplane holding the objects.
+
+    Returns:
+        A list of the shapes.
+    """
+
+    if isinstance(obj, cq.Shape):
+        return [obj]
+
+    return [val for val in obj.vals() if isinstance(val, cq.Shape)]
+
+
+def _first_in_groups(keys, order):
+    """
+    Picks one row out of each group of rows that have the same key.
+
+    Parameters:
+        keys - An (n, m) integer array with the key of each row.
+        order - An (n,) array, where the row with the smallest value in each group is picked.
+
+    Returns:
+        A sorted array of the indices of the picked rows.
+    """
+
+    _, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+
+    # Sort by group and then by order, so that the first row of each run is the one to keep
+    sort = np.lexsort((order, inverse))
+    first = np.ones(len(sort), dtype=bool)
+    first[1:] = inverse[sort][1:] != inverse[sort][:-1]
+
+    return np.sort(sort[first])
+
+
+def find_circular_edges(
+    obj, tolerance=DEFAULT_PATTERN_TOLERANCE, min_radius=0.0, max_radius=None
+):
+    """
+    Finds the circles of an object that can be given a radius dimension, without any tags, so that
+    imported parts can be dimensioned. The edges are walked once and the circles are then filtered
+    as arrays. Arcs only count if they close into a full circle together, like the halves of a hole
+    that was split at a seam, and the circles at both ends of a hole only count once, at the end
+    that its axis points to.
+
+    Parameters:
+        obj - Shape or workplane holding the object.
+        tolerance - How far the centers, axes and radii of two circles may differ and still be the same circle.
+        min_radius - Circles smaller than this are left out.
+        max_radius - Circles larger than this are left out, or None to keep them all.
+
+    Returns:
+        A CircleCandidates with one row for each circle that can be dimensioned.
+    """
+
+    # Pull the circle of each circular edge out in one walk over the edges
+    edges = []
+    rows = []
+    with stage("dimensioning.edge_scan"):
+        for shape in _shapes_of(obj):
+            for edge in shape.Edges():
+                if edge.geomType() != "CIRCLE":
+                    continue
+
+                curve = edge._geomAdaptor()
+                circ = curve.Circle()
+                loc = circ.Location()
+                axis = circ.Axis().Direction()
+                edges.append(edge)
+                rows.append(
+                    (
+                        loc.X(),
+                        loc.Y(),
+                        loc.Z(),
+                        axis.X(),
+                        axis.Y(),
+                        axis.Z(),
+                        circ.Radius(),
+                        curve.LastParameter() - curve.FirstParameter(),
+                    )
+                )
+        count("dimensioning.circles_scanned", len(rows))
+
+    data = np.array(rows, dtype=float).reshape(-1, 8)
+    centers, axes, radii, spans = data[:, :3], data[:, 3:6], data[:, 6], data[:, 7]
+
+    with stage("dimensioning.candidate_filter"):
+        # Flip each axis so that circles facing opposite ways compare equal
+        largest = np.argmax(np.abs(axes), axis=1)
+        signs = np.where(axes[np.arange(len(axes)), largest] < 0.0, -1.0, 1.0)
+        axes = axes * signs[:, None] + 0.0
+
+        keep = radii >= min_radius
+        if max_radius is not None:
+            keep &= radii <= max_radius
+
+        # Add up the arcs of each circle, which only counts once it is closed
+        circle_keys = np.round(
+            np.column_stack((centers, axes, radii)) / tolerance
+        ).astype(np.int64)
+        _, inverse = np.unique(circle_keys, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        covered = np.zeros(inverse.max() + 1 if len(inverse) else 0)
+        np.add.at(covered, inverse, spans)
+        keep &= covered[inverse] >= 2.0 * np.pi - tolerance
+        picked = np.flatnonzero(keep)
+        picked = picked[_first_in_groups(circle_keys[picked], picked)]
+
+        # Keep one of the circles along the same axis with the same radius, furthest along the axis
+        heights = np.einsum("ij,ij->i", centers[picked], axes[picked])
+        offsets = centers[picked] - heights[:, None] * axes[picked]
+        hole_keys = np.round(
+            np.column_stack((offsets, axes[picked], radii[picked])) / tolerance
+        ).astype(np.int64)
+        picked = picked[_first_in_groups(hole_keys, -heights)]
+
+        # Draw each dimension on a plane whose X direction is square to Z, or along X for circles facing Z
+        x_dirs = np.cross((0.0, 0.0, 1.0), axes[picked])
+        lengths = np.linalg.norm(x_dirs, axis=1)
+        flat = lengths < tolerance
+        x_dirs[flat] = (1.0, 0.0, 0.0)
+        lengths[flat] = 1.0
+        x_dirs = x_dirs / lengths[:, None]
+
+        count("dimensioning.candidates", len(picked))
+
+    return CircleCandidates(
+        [edges[i] for i in picked],
+        centers[picked],
+        axes[picked],
+        x_dirs,
+        radii[picked],
+    )
+
+
+def _radius_entries(obj):
+    """
+    Looks up the edges that are tagged for radius dimensions in the tag index of an object.
+
+    Parameters:
+        obj - Object that has circular edges tagged for dimensions.
+
+    Returns:
+        A list of TagEntry objects for the tags starting with "radius".
+    """
+
+    with stage("dimensioning.tag_lookup"):
+        index = get_tag_index(obj)
+
+    rad_edges = []
+    for key, entries in index.items():
+        if key.startswith("radius"):
+            rad_edges.extend(entries)
+
+    return rad_edges
+
+
+def _dimension_groups(
+    obj, group_patterns=False, tolerance=DEFAULT_PATTERN_TOLERANCE, auto=False
+):
+    """
+    Finds the circular edges of an object that get a dimension, optionally grouping the
+    edges of hole patterns so that each group gets a single dimension.
+
+    Parameters:
+        obj - Object that has circular edges tagged for dimensions.
+        group_patterns - Whether to group edges that have the same radius and lie in the same plane.
+        tolerance - How far the radii and planes of the edges in a group may differ.
+        auto - Whether to dimension the circles found by `find_circular_edges` instead of the tagged edges.
+
+    Returns:
+        A list of DimensionGroup objects, or None if a tag selects more than one edge.
+    """
+
+    features = []
+    if auto:
+        candidates = find_circular_edges(obj, tolerance)
+        for i, edge in enumerate(candidates.edges):
+            features.append(
+                DimensionGroup(
+                    "circle_%d" % i,
+                    edge,
+                    tuple(candidates.centers[i].tolist()),
+                    tuple(candidates.x_dirs[i].tolist()),
+                    tuple(candidates.axes[i].tolist()),
+                    float(candidates.radii[i]),
+                    1,
+                )
+            )
+    else:
+        for rad_edge in _radius_entries(obj):
+            # Check to make sure the user only selected one edge
+            edgs = rad_edge.workplane.edges()
+            if len(edgs.all()) > 1:
+                print("Please make sure that only 1 edge is tagged by the selector.")
+                return None
+
+            edge = edgs.val()
+            features.append(
+                DimensionGroup(
+                    rad_edge.tag,
+                    edge,
+                    edge.Center().toTuple(),
+                    edgs.plane.xDir.toTuple(),
+                    edgs.plane.zDir.toTuple(),
+                    edge.radius(),
+                    1,
+                )
+            )
+
+    if not group_patterns:
+        return features
+
+    groups = []
+
+    # The normal and the distance from the origin of the plane of each group
+    planes = []
+
+    with stage("dimensioning.grouping"):
+        for feature in features:
+            normal = cq.Vector(feature.normal)
+            offset = normal.dot(cq.Vector(feature.center))
+
+            for i, group in enumerate(groups):
+                group_normal, group_offset = planes[i]
+                if (
+                    abs(group.radius - feature.radius) <= tolerance
+                    and (group_normal - normal).Length <= tolerance
+                    and abs(group_offset - offset) <= tolerance
+                ):
+                    groups[i] = group._replace(count=group.count + 1)
+                    count("dimensioning.grouped_edges")
+                    break
+            else:
+                groups.append(feature)
+                planes.append((normal, offset))
+
+    return groups
+
+
+def _dimension_label(group):
+    """
+    Works out the text of the label of a dimension.
+
+    Parameters:
+        group - The DimensionGroup being dimensioned.
+
+    Returns:
+        The label, such as "R 2.5" or "4× R 2.5" for a group of four edges.
+    """
+
+    label = "R " + str(group.radius)
+    if group.count > 1:
+        label = "%d× %s" % (group.count, label)
+
+    return label
+
+
+def add_circular_dimensions(
+    obj,
+    arrow_scale_factor=1.0,
+    font_size=4,
+    text_depth=1.0,
+    font="Arial",
+    group_patterns=False,
+    tolerance=DEFAULT_PATTERN_TOLERANCE,
+    auto=False,
+):
     """
     Adds 3D arrows, leader lines and text to create diameter
-    and radius dimensions.
+    and radius dimensions. Each label is moved to the free slot nearest
+    to the tail of its leader so that labels do not overlap.
 
     Parameters:
         obj - Object that has circular edges tagged for dimensions.
         arrow_scale_factor - Allows arrows to be scaled up and down so to match the scale of the object.
+        font_size - Font size of the dimension labels.
+        text_depth - Distance that the dimension label text is extruded.
+        font - Name of the font to use for the dimension labels.
+        group_patterns - Gives the edges of a hole pattern, which have the same radius and lie in the
+                         same plane, a single "n× R" dimension that points at the first edge of the pattern.
+        tolerance - How far the radii and planes of the edges in a pattern may differ.
+        auto - Dimensions every full circle of the object, as found by `find_circular_edges`, instead
+               of the tagged edges, which suits imported parts that have no tags.
 
     Returns:
         An assembly containing the object along with the arrows, leader lines and text added at the proper location.
     """
 
-    # Get the face location so that we can offset the arrow properly
-    rad_edges = []
-    for key, value in obj.ctx.tags.items():
-        if key.startswith("radius"):
-            rad_edges.append(key)
+    # Work out where every leader and label goes
+    specs = get_circular_dimension_specs(
+        obj,
+        arrow_scale_factor,
+        font_size,
+        text_depth,
+        font,
+        group_patterns,
+        tolerance,
+        auto,
+    )
+    if specs is None:
+        return None
 
     # Build the base assembly
     assy = cq.Assembly()
     assy.add(obj)
 
-    # Create the arrow head that points to each circular edge
-    for rad_edge in rad_edges:
-        # rad = edgs.val().BoundingBox().ylen / 2.0
-        # length = obj.val().BoundingBox().xlen
-
-        # Check to make sure the user only selected one edge
-        edgs = obj.edges(tag=rad_edge)
-        if len(edgs.all()) > 1:
-            print("Please make sure that only 1 edge is tagged by the selector.")
-            return None
-
-        # Figure out the radius based on the dimensions of the edge
-        rad = obj.edges(tag=rad_edge).val().radius()
-
-        # Set the proportions of the arrow head
-        tip_circle = 0.5 * arrow_scale_factor
-        head_circle = 2.5 * arrow_scale_factor
-        head_length = 10.0 * arrow_scale_factor
-
-        # Figure out how the plane is oriented
-        x_dir = obj.edges(tag=rad_edge).plane.xDir
-        z_dir = obj.edges(tag=rad_edge).plane.zDir
-        if x_dir == cq.Vector(1.0, 0.0, 0.0) and z_dir == cq.Vector(0.0, 0.0, 1.0):
-            plane_name = "XY"
-            extrude_sel = ">X"
-            radial_vec = (0, 1, 0)
-            circumference_vec = (0, 0, 1)
-            rot_x = 0.0
-            rot_y = -45.0
-            rot_z = 0.0
-            offset = obj.edges(tag=rad_edge).val().Center().z
-            loc_vec = (
-                rad * cos(radians(45)),
-                rad * cos(radians(45)),
-                offset,
+    # Add the shared leader and text solids at the locations of their specs
+    with stage("dimensioning.placement"):
+        locs = spec_locations(specs)
+    for spec, loc in zip(specs, locs):
+        if spec.kind == "leader":
+            solid = cache_call(
+                "dimensioning.leader_cache",
+                _leader_prototype,
+                0.5 * spec.size,
+                10.0 * spec.size,
             )
-        elif x_dir == cq.Vector(0, 1, 0) and z_dir == cq.Vector(1, 0, 0):
-            plane_name = "YZ"
-            extrude_sel = ">Y"
-            radial_vec = (0, 0, 1)
-            circumference_vec = (1, 0, 0)
-            rot_x = 45.0
-            rot_y = 0.0
-            rot_z = 0.0
-            offset = obj.edges(tag=rad_edge).val().Center().x
-            loc_vec = (
-                offset,
-                rad * cos(radians(45)),
-                rad * cos(radians(45)),
+        else:
+            solid = cache_call(
+                "dimensioning.label_cache",
+                _label_prototype,
+                spec.label,
+                "XY",
+                spec.size,
+                spec.length,
+                font,
             )
+        assy.add(solid, loc=loc)
 
-        # Create the arrow head and path up to the text
-        arrow = (
-            cq.Workplane(plane_name).circle(tip_circle).extrude(head_length, taper=-30)
+    return assy
+
+
+def get_circular_dimension_specs(
+    obj,
+    arrow_scale_factor=1.0,
+    font_size=4,
+    text_depth=1.0,
+    font="Arial",
+    group_patterns=False,
+    tolerance=DEFAULT_PATTERN_TOLERANCE,
+    auto=False,
+):
+    """
+    Finds the radius dimensions of the circular edges of an object as lightweight AnnotationSpec
+    records, which `add_circular_dimensions` and `deferred.DeferredAnnotations` build their solids
+    from. Each dimension is a leader pointing at the edge from outside, 45 degrees around from the
+    X direction of its plane, and a label in the nearest free slot beside the tail of the leader.
+    The slots are found from the size of the leader and the length of each label, so no geometry is
+    built here.
+
+    Parameters:
+        obj - Object that has circular edges tagged for dimensions.
+        arrow_scale_factor - Allows arrows to be scaled up and down so to match the scale of the object.
+        font_size - Font size of the dimension labels.
+        text_depth - Distance that the dimension label text is extruded.
+        font - Name of the font of the labels, which leaves their slots unchanged.
+        group_patterns - Gives each hole pattern a single "n× R" dimension, see `add_circular_dimensions`.
+        tolerance - How far the radii and planes of the edges in a pattern may differ.
+        auto - Dimensions every full circle of the object instead of the tagged edges, see `find_circular_edges`.
+
+    Returns:
+        A list of AnnotationSpec objects with a leader and a label for each dimension, or None if a
+        tag selects more than one edge.
+    """
+
+    # Get the edges tagged for dimensions from the tag index of the object, or find them
+    groups = _dimension_groups(obj, group_patterns, tolerance, auto)
+    if groups is None:
+        return None
+
+    # The room taken up by the leader, an arrow head with a bent path up to the text, for this size
+    leader_bb = _leader_extents(0.5 * arrow_scale_factor, 10.0 * arrow_scale_factor)
+
+    # Place every leader in one batch on the plane of its edge, pointing at the edge from
+    # 45 degrees around from the X direction of the plane
+    with stage("dimensioning.placement"):
+        centers = np.array([group.center for group in groups], dtype=float).reshape(
+            -1, 3
         )
-        arrow = arrow.rotate((0, 0, 0), radial_vec, 90)
-        arrow = (
-            arrow.faces(extrude_sel)
-            .workplane(centerOption="CenterOfBoundBox")
-            .circle(tip_circle)
-            .extrude(10.0, combine=True)
-            .faces(extrude_sel)
-            .workplane(centerOption="CenterOfBoundBox")
-            .transformed(rotate=(rot_x, rot_y, rot_z))
-            .circle(tip_circle)
-            .extrude(5.0)
+        x_dirs = np.array([group.x_dir for group in groups], dtype=float).reshape(-1, 3)
+        z_dirs = np.array([group.normal for group in groups], dtype=float).reshape(
+            -1, 3
         )
-        arrow = arrow.rotate((0, 0, 0), circumference_vec, 45)
-
-        # Add the arrow to the assembly
-        assy.add(arrow, loc=cq.Location(loc_vec))
-
-        # Calculate the correct position of the text
-        if plane_name == "YZ":
-            lr = assy.toCompound().BoundingBox().ylen / 2.0
-            tb = assy.toCompound().BoundingBox().zlen / 2.0
-            loc_tup = (offset, tb, lr)
-        elif plane_name == "XY":
-            lr = assy.toCompound().BoundingBox().xlen / 2.0
-            tb = assy.toCompound().BoundingBox().ylen / 2.0
-            loc_tup = (lr, tb, offset)
-
-        # Create the text that will display the radius value
-        text = (
-            cq.Workplane(plane_name)
-            .workplane(centerOption="CenterOfBoundBox")
-            .text("R " + str(rad), fontsize=4, distance=1.0)
+        rotations = frame_rotations(x_dirs, z_dirs)
+        radial = rotations[:, :, 0] + rotations[:, :, 1]
+        radii = np.array([group.radius for group in groups], dtype=float)
+        origins = centers + (radii * cos(radians(45)))[:, None] * radial
+
+        # The position of each leader in the 2D coordinates of its plane, and of the plane along its normal
+        plane_u = np.einsum("ij,ij->i", origins, rotations[:, :, 0])
+        plane_v = np.einsum("ij,ij->i", origins, rotations[:, :, 1])
+        plane_w = np.einsum("ij,ij->i", origins, rotations[:, :, 2])
+
+    # The labels and leaders that were placed so far, per view direction, so that new labels can be
+    # moved to the nearest free slot instead of being stacked on top of each other
+    label_grids = {}
+    group_grids = []
+    for rotation in rotations:
+        key = tuple(np.round(rotation[:, [0, 2]].T.reshape(-1), 6).tolist())
+        grid = label_grids.get(key)
+        if grid is None:
+            grid = GridIndex(2.0 * font_size)
+            label_grids[key] = grid
+        group_grids.append(grid)
+
+    # Keep every leader free of labels, including the leaders of dimensions that are labelled later
+    leader_rects = []
+    for grid, u, v in zip(group_grids, plane_u.tolist(), plane_v.tolist()):
+        arrow_rect = (
+            u + leader_bb[0],
+            v + leader_bb[1],
+            u + leader_bb[2],
+            v + leader_bb[3],
         )
-        assy.add(text, loc=cq.Location((loc_tup[0], loc_tup[1] + 15.0, loc_tup[2])))
+        grid.insert(arrow_rect)
+        leader_rects.append(arrow_rect)
 
-    return assy
+    # Place the label of each dimension in the nearest free slot beside the tail of its leader
+    labels = []
+    label_origins = []
+    for group, grid, arrow_rect, w in zip(
+        groups, group_grids, leader_rects, plane_w.tolist()
+    ):
+        # The text that will display the radius value, which is drawn on XY and then turned
+        # onto the plane of the edge
+        label = _dimension_label(group)
+        labels.append(label)
+
+        text_bb = _label_extents(label, font_size)
+        width = text_bb[2] - text_bb[0]
+        height = text_bb[3] - text_bb[1]
+        gap = 0.25 * font_size
+        with stage("dimensioning.label_placement"):
+            corner = grid.place(
+                width,
+                height,
+                (arrow_rect[2] + gap, arrow_rect[3] - height / 2.0),
+                gap,
+            )
+
+        # Move the text so that its bounding box starts at the corner of the slot
+        label_origins.append((corner[0] - text_bb[0], corner[1] - text_bb[1], w))
+
+    # Turn the label positions from plane coordinates into the coordinates of the object
+    label_origins = np.einsum(
+        "ijk,ik->ij", rotations, np.array(label_origins, dtype=float).reshape(-1, 3)
+    )
+
+    specs = []
+    for group, rotation, origin, label, label_origin in zip(
+        groups, rotations, origins.tolist(), labels, label_origins.tolist()
+    ):
+        x_dir = tuple(rotation[:, 0].tolist())
+        normal = tuple(rotation[:, 2].tolist())
+
+        specs.append(
+            AnnotationSpec(
+                "leader",
+                origin,
+                x_dir,
+                normal=normal,
+                size=arrow_scale_factor,
+                length=20.0 * arrow_scale_factor,
+                name="radius_leader_" + group.name,
+            )
+        )
+        specs.append(
+            AnnotationSpec(
+                "label",
+                label_origin,
+                x_dir,
+                normal=normal,
+                size=font_size,
+                length=text_depth,
+                label=label,
+                name="radius_label_" + group.name,
+            )
+        )
+
+    return specs
+
+
+def get_circular_dimension_primitives(
+    obj,
+    arrow_scale_factor=1.0,
+    font_size=4,
+    font="Arial",
+    group_patterns=False,
+    tolerance=DEFAULT_PATTERN_TOLERANCE,
+    auto=False,
+):
+    """
+    Finds the radius dimensions of the tagged circular edges of an object as 2D vector primitives,
+    which can be drawn on an SVG view with `vector.add_vector_annotations` instead of being built
+    as solids. Each dimension is a straight arrow along the leader of `add_circular_dimensions`,
+    pointing at the edge from outside, with the radius label where that function places it.
+
+    Parameters:
+        obj - Object that has circular edges tagged for dimensions.
+        arrow_scale_factor - Allows arrows to be scaled up and down so to match the scale of the object.
+        font_size - Font size of the dimension labels.
+        font - Name of the font of the labels, which leaves their placement unchanged.
+        group_patterns - Gives each hole pattern a single "n× R" dimension, see `add_circular_dimensions`.
+        tolerance - How far the radii and planes of the edges in a pattern may differ.
+        auto - Dimensions every full circle of the object instead of the tagged edges, see `find_circular_edges`.
+
+    Returns:
+        A list of ArrowPrimitive and TextPrimitive objects.
+    """
+
+    specs = get_circular_dimension_specs(
+        obj,
+        arrow_scale_factor,
+        font_size,
+        font=font,
+        group_patterns=group_patterns,
+        tolerance=tolerance,
+        auto=auto,
+    )
+    if specs is None:
+        return None
+
+    primitives = []
+    for spec in specs:
+        if spec.kind == "leader":
+            # The leader runs out from its tip diagonally between the axes of its plane
+            x_dir = cq.Vector(spec.direction)
+            diagonal = (x_dir + cq.Vector(spec.normal).cross(x_dir)).normalized()
+            primitives.append(
+                ArrowPrimitive(spec.anchor, (-diagonal).toTuple(), spec.length)
+            )
+        else:
+            primitives.append(TextPrimitive(spec.anchor, spec.label, spec.size))
+
+    return primitives
@@ -0,0 +1,83 @@
+import hashlib
+import io
+import cadquery as cq
+from .instrumentation import count, stage
+
+
+def share_geometry(assy):
+    """
+    Makes a copy of an assembly in which identical shapes are replaced by one shared shape that
+    is placed with the location of each node. CadQuery's glTF and STEP exporters write each
+    shared shape once and reference it from every node, so the file size and the tessellation
+    time depend on the number of distinct shapes instead of the number of annotations.
+
+    Only nodes that hold a bare shape, which is how the annotations are added, are shared.
+    Parts held in workplanes are left as they are.
+
+    Parameters:
+        assy - The annotated assembly.
+
+    Returns:
+        A copy of the assembly that shares identical shapes, while the original is left untouched.
+    """
+
+    shared = assy._copy()
+
+    # Maps the B-rep digest of each distinct shape to the one shape that all copies will use
+    by_digest = {}
+
+    # Remembers the digest of shapes that are already shared, so that they are not exported again
+    digests = {}
+
+    with stage("export.share"):
+        stack = [shared]
+        while stack:
+            node = stack.pop()
+            stack.extend(node.children)
+
+            if not isinstance(node.obj, cq.Shape):
+                continue
+
+            # Move the placement of the shape onto the node so that only the geometry is compared
+            placement = node.obj.location()
+            bare = node.obj.located(cq.Location())
+
+            digest = digests.get(bare)
+            if digest is None:
+                brep = io.BytesIO()
+                bare.exportBrep(brep)
+                digest = hashlib.sha1(brep.getvalue()).digest()
+                digests[bare] = digest
+
+            if digest not in by_digest:
+                by_digest[digest] = bare
+                count("export.distinct_shapes")
+            count("export.instances")
+
+            node.obj = by_digest[digest]
+            node.loc = node.loc * placement
+
+    return shared
+
+
+def export_instanced(assy, path, exportType=None, **kwargs):
+    """
+    Exports an annotated assembly with identical annotation shapes written once and placed
+    as instances. This works with any format that `cq.Assembly.export` supports, and is most
+    useful for glTF and STEP.
+    Example: `export_instanced(assy, "annotated.glb")`
+
+    Parameters:
+        assy - The annotated assembly.
+        path - Path of the file to write.
+        exportType - Format of the file, or None to infer it from the path.
+        kwargs - Other options that are passed on to `cq.Assembly.export`.
+
+    Returns:
+        Nothing
+    """
+
+    shared = share_geometry(assy)
+
+    with stage("export.write"):
+        shared.export(path, exportType, **kwargs)
@@ -0,0 +1,201 @@
+import json
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+# The collectors that are active in the current context, which is empty unless instrumentation is
+# turned on. Each thread and asyncio task has its own, so concurrent collect() blocks stay apart.
+_collectors = ContextVar("cq_annotate_collectors", default=())
+
+# Handed out by stage() while nothing is collecting, so that disabled stages cost only a call
+_NULL_STAGE = nullcontext()
+
+
+class Stats:
+    """
+    Holds the timers and counters that were collected while instrumentation was turned on.
+    """
+
+    def __init__(self, on_event=None):
+        """
+        Parameters:
+            on_event - Optional function that is called with the name, start time and duration
+                       in seconds of each stage as it finishes.
+        """
+
+        self.on_event = on_event
+        self.stages = {}
+        self.counters = Counter()
+        self.events = []
+        self.start = time.perf_counter()
+
+    def add_event(self, name, start, duration):
+        """
+        Records one finished stage.
+
+        Parameters:
+            name - Name of the stage.
+            start - The time.perf_counter() value when the stage started.
+            duration - How long the stage took in seconds.
+
+        Returns:
+            Nothing
+        """
+
+        calls, total = self.stages.get(name, (0, 0.0))
+        self.stages[name] = (calls + 1, total + duration)
+        self.events.append((name, start, duration, threading.get_ident()))
+
+        if self.on_event is not None:
+            self.on_event(name, start, duration)
+
+    def to_dict(self):
+        """
+        Exports the collected timers and counters as plain data.
+
+        Returns:
+            A dictionary with the number of calls and total seconds of each stage and the counters.
+        """
+
+        return {
+            "stages": {
+                name: {"calls": calls, "seconds": total}
+                for name, (calls, total) in self.stages.items()
+            },
+            "counters": dict(self.counters),
+        }
+
+    def to_chrome_trace(self):
+        """
+        Exports the collected stages in the Chrome trace event format, which can be loaded
+        into chrome://tracing or Perfetto.
+
+        Returns:
+            The trace as a JSON string.
+        """
+
+        pid = os.getpid()
+        events = [
+            {
+                "name": name,
+                "ph": "X",
+                "ts": (start - self.start) * 1e6,
+                "dur": duration * 1e6,
+                "pid": pid,
+                "tid": tid,
+            }
+            for name, start, duration, tid in self.events
+        ]
+
+        # Report the final counter values at the end of the trace
+        end = (time.perf_counter() - self.start) * 1e6
+        events.extend(
+            {"name": name, "ph": "C", "ts": end, "pid": pid, "args": {name: value}}
+            for name, value in self.counters.items()
+        )
+
+        return json.dumps({"traceEvents": events})
+
+
+class _Stage:
+    """
+    Times one run of a stage for every active collector.
+    """
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter() - self.start
+        for stats in _collectors.get():
+            stats.add_event(self.name, self.start, duration)
+        return False
+
+
+@contextmanager
+def collect(on_event=None):
+    """
+    Turns instrumentation on for the duration of a with block.
+    Example: `with collect() as stats: add_assembly_arrows(assy)`
+
+    Parameters:
+        on_event - Optional function that is called with the name, start time and duration
+                   in seconds of each stage as it finishes.
+
+    Returns:
+        A Stats object that holds the timers and counters collected inside the block
+    """
+
+    stats = Stats(on_event)
+    token = _collectors.set(_collectors.get() + (stats,))
+    try:
+        yield stats
+    finally:
+        _collectors.reset(token)
+
+
+def stage(name):
+    """
+    Times a stage of the annotation pipeline when instrumentation is turned on.
+    Example: `with stage("callouts.arrow_build"): ...`
+
+    Parameters:
+        name - Name of the stage.
+
+    Returns:
+        A context manager that times the stage, which does nothing when instrumentation is off
+    """
+
+    if not _collectors.get():
+        return _NULL_STAGE
+
+    return _Stage(name)
+
+
+def count(name, amount=1):
+    """
+    Increments a counter when instrumentation is turned on.
+
+    Parameters:
+        name - Name of the counter.
+        amount - How much to add to the counter.
+
+    Returns:
+        Nothing
+    """
+
+    for stats in _collectors.get():
+        stats.counters[name] += amount
+
+
+def cache_call(name, func, *args):
+    """
+    Calls a function wrapped with functools.lru_cache and counts whether the result came from
+    the cache when instrumentation is turned on.
+
+    Parameters:
+        name - Prefix of the "hits" and "misses" counters.
+        func - The cached function.
+        args - Arguments to pass to the function.
+
+    Returns:
+        The result of the function
+    """
+
+    if not _collectors.get():
+        return func(*args)
+
+    hits = func.cache_info().hits
+    result = func(*args)
+    count(name + ".hits" if func.cache_info().hits > hits else name + ".misses")
+
+    return result
@@ -0,0 +1,126 @@
+import numpy as np
+import cadquery as cq
+from OCP.gp import gp_Trsf
+
+# How close a normal may come to -Z before it is treated as pointing straight down
+ANTIPARALLEL_TOLERANCE = 1e-9
+
+
+def normal_rotations(normals):
+    """
+    Works out, for many normals at once, the smallest rotation that turns the +Z axis to each normal.
+    A normal that points along -Z has no smallest rotation, so it is turned half way around the X axis.
+
+    Parameters:
+        normals - An (n, 3) array of normals, which do not need to be unit length.
+
+    Returns:
+        An (n, 3, 3) array of rotation matrices.
+    """
+
+    normals = np.asarray(normals, dtype=float).reshape(-1, 3)
+    normals = normals / np.linalg.norm(normals, axis=1, keepdims=True)
+    x, y, z = normals.T
+
+    # Rodrigues' formula for the rotation about Z x n = (-y, x, 0), which simplifies because Z is a unit axis
+    flipped = z < -1.0 + ANTIPARALLEL_TOLERANCE
+    k = np.where(flipped, 0.0, 1.0 / np.where(flipped, 1.0, 1.0 + z))
+
+    rotations = np.empty((len(normals), 3, 3))
+    rotations[:, 0, 0] = 1.0 - k * x * x
+    rotations[:, 0, 1] = -k * x * y
+    rotations[:, 0, 2] = x
+    rotations[:, 1, 0] = -k * x * y
+    rotations[:, 1, 1] = 1.0 - k * y * y
+    rotations[:, 1, 2] = y
+    rotations[:, 2, 0] = -x
+    rotations[:, 2, 1] = -y
+    rotations[:, 2, 2] = z
+
+    rotations[flipped] = np.diag((1.0, -1.0, -1.0))
+
+    return rotations
+
+
+def frame_rotations(x_dirs, z_dirs):
+    """
+    Works out, for many planes at once, the rotation that turns the X and Z axes to the axes of each plane.
+
+    Parameters:
+        x_dirs - An (n, 3) array of the X directions of the planes.
+        z_dirs - An (n, 3) array of the normals of the planes.
+
+    Returns:
+        An (n, 3, 3) array of rotation matrices.
+    """
+
+    x_dirs = np.asarray(x_dirs, dtype=float).reshape(-1, 3)
+    z_dirs = np.asarray(z_dirs, dtype=float).reshape(-1, 3)
+    x_dirs = x_dirs / np.linalg.norm(x_dirs, axis=1, keepdims=True)
+    z_dirs = z_dirs / np.linalg.norm(z_dirs, axis=1, keepdims=True)
+
+    # The axes of each plane are the columns of its rotation
+    return np.stack((x_dirs, np.cross(z_dirs, x_dirs), z_dirs), axis=2)
+
+
+def locations(rotations, origins):
+    """
+    Turns rotations and origins into CadQuery locations, so that one shared shape can be placed
+    at many positions without transforming its B-rep.
+
+    Parameters:
+        rotations - An (n, 3, 3) array of rotation matrices.
+        origins - An (n, 3) array of the positions that the origin of the shape is moved to.
+
+    Returns:
+        A list of cq.Location objects.
+    """
+
+    origins = np.asarray(origins, dtype=float).reshape(-1, 3)
+    matrices = np.concatenate((rotations, origins[:, :, None]), axis=2)
+
+    result = []
+    for matrix in matrices.tolist():
+        trsf = gp_Trsf()
+        trsf.SetValues(*matrix[0], *matrix[1], *matrix[2])
+        result.append(cq.Location(trsf))
+
+    return result
+
+
+def spec_locations(specs):
+    """
+    Works out, in one batch, the locations that place the shared prototype solid of each annotation.
+    Specs with a normal are placed on their plane, the others are turned to point along their direction.
+
+    Parameters:
+        specs - The AnnotationSpec objects.
+
+    Returns:
+        A list of cq.Location objects, one for each spec.
+    """
+
+    rotations = np.empty((len(specs), 3, 3))
+
+    # Labels and dimension leaders are laid out on their plane, while arrows and lines only need their axis turned
+    planar = [i for i, spec in enumerate(specs) if spec.normal is not None]
+    axial = [i for i, spec in enumerate(specs) if spec.normal is None]
+
+    if planar:
+        rotations[planar] = frame_rotations(
+            [specs[i].direction for i in planar], [specs[i].normal for i in planar]
+        )
+    if axial:
+        # The arrow prototype points along -Z from its tip, the line prototype runs along +Z
+        rotations[axial] = normal_rotations(
+            [
+                (
+                    tuple(-d for d in specs[i].direction)
+                    if specs[i].kind == "arrow"
+                    else specs[i].direction
+                )
+                for i in axial
+            ]
+        )
+
+    return locations(rotations, [spec.anchor for spec in specs])
@@ -1,9 +1,160 @@
+import argparse
+import copy
+import glob
+import io
 import os
+import sys
+import tempfile
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+from lxml import etree
 import svgutils.transform as sg
 from svgutils.compose import Unit
+from .instrumentation import cache_call, count, stage
 
+# The number of distinct overlays that are kept for reuse before the least recently used is evicted
+OVERLAY_CACHE_SIZE = 128
 
-def add_safety_warning(svg_path, text, use_icon=True, font_size=24):
+# The permissions given to output files that do not exist yet
+NEW_FILE_MODE = 0o644
+
+# The outcome of adding an overlay to one file in a batch
+#   path - Path of the SVG file that was read
+#   output_path - Path that the result was written to, or None if it failed
+#   error - Description of the error if the file failed, otherwise None
+OverlayResult = namedtuple("OverlayResult", ["path", "output_path", "error"])
+
+# Icons that can be used in overlays, mapped to the path of their SVG file or their SVG content
+_icons = {
+    "safety_warning": os.path.join(
+        os.path.dirname(os.path.realpath(__file__)), "icons", "safety_warning.svg"
+    ),
+}
+
+
+@lru_cache(maxsize=None)
+def _icon_template(name):
+    """
+    Parses a registered icon once so that it can be reused by all overlays.
+
+    Parameters:
+        name - Name that the icon was registered under.
+
+    Returns:
+        The group element holding the contents of the icon.
+    """
+
+    source = _icons[name]
+
+    # Icons can be registered with their content or with a path to their file
+    if isinstance(source, bytes):
+        source = source.decode("utf-8")
+    with stage("overlays.icon_parse"):
+        if source.lstrip().startswith("<"):
+            icon = sg.fromstring(source)
+        else:
+            icon = sg.fromfile(source)
+
+    return icon.getroot().root
+
+
+def register_icon(name, svg):
+    """
+    Registers an icon so that it can be used in overlays by name. This is meant to be done
+    once at startup, and registering an icon under an existing name replaces that icon.
+
+    Parameters:
+        name - Name to register the icon under.
+        svg - File path to the SVG of the icon, or the SVG content as a str or bytes.
+
+    Returns:
+        Nothing
+    """
+
+    _icons[name] = svg
+
+    # Drop anything that was built from a previous icon of the same name
+    _icon_template.cache_clear()
+    _overlay_template.cache_clear()
+    _overlay_markup.cache_clear()
+
+
+@lru_cache(maxsize=OVERLAY_CACHE_SIZE)
+def _overlay_template(text, icon, font_size, icon_scale):
+    """
+    Builds a safety warning overlay as a single SVG group. The result is cached and must not
+    be modified, use `_overlay_group` to get a copy that can be added to a drawing.
+
+    Parameters:
+        text - String that should be displayed as the safety warning.
+        icon - Name of the registered icon to display with the text warning, or None.
+        font_size - Font size to use for the warning text.
+        icon_scale - Scale factor that is applied to the icon.
+
+    Returns:
+        The group element of the overlay.
+    """
+
+    count("overlays_built")
+
+    # Use SVG as the default namespace so that the group fits into a drawing without prefixes
+    group = etree.Element(sg.SVG + "g", nsmap={None: sg.SVG_NAMESPACE})
+
+    # Add text labels
+    txt1 = sg.TextElement(45, 35, text, size=font_size, weight="bold")
+    group.append(txt1.root)
+
+    if icon is not None:
+        icon_element = sg.FigureElement(copy.deepcopy(_icon_template(icon)))
+        icon_element.moveto(5, 5, scale_x=icon_scale, scale_y=icon_scale)
+        group.append(icon_element.root)
+
+    return group
+
+
+def _overlay_group(text, icon, font_size, icon_scale):
+    """
+    Gets a copy of a cached safety warning overlay that can be added to a drawing.
+
+    Parameters:
+        text - String that should be displayed as the safety warning.
+        icon - Name of the registered icon to display with the text warning, or None.
+        font_size - Font size to use for the warning text.
+        icon_scale - Scale factor that is applied to the icon.
+
+    Returns:
+        The svgutils element of the overlay group.
+    """
+
+    return sg.FigureElement(
+        copy.deepcopy(_overlay_template(text, icon, font_size, icon_scale))
+    )
+
+
+@lru_cache(maxsize=OVERLAY_CACHE_SIZE)
+def _overlay_markup(text, icon, font_size, icon_scale):
+    """
+    Serializes a cached safety warning overlay.
+
+    Parameters:
+        text - String that should be displayed as the safety warning.
+        icon - Name of the registered icon to display with the text warning, or None.
+        font_size - Font size to use for the warning text.
+        icon_scale - Scale factor that is applied to the icon.
+
+    Returns:
+        The UTF-8 encoded markup of the overlay group.
+    """
+
+    return etree.tostring(
+        _overlay_template(text, icon, font_size, icon_scale), encoding="utf-8"
+    )
+
+
+def add_safety_warning(
+    svg_path, text, use_icon=True, font_size=24, icon="safety_warning", icon_scale=0.4
+):
     """
     Adds a safety warning to an SVG file. The warning can be a text message with an optional icon.
 
@@ -12,20 +163,18 @@ def add_safety_warning(svg_path, text, use_icon=True, font_size=24):
         text - String that should be displayed as the safety warning.
         use_icon - Whether or not to display a stock safety icon with the text warning.
         font_size - Font size to use for the warning text.
+        icon - Name of the icon to display, either the stock "safety_warning" or one added with `register_icon`.
+        icon_scale - Scale factor that is applied to the icon.
 
     Returns:
         Nothing, modifies the SVG file in-place
     """
 
     # Load the SVG that we want to annotate
-    view = sg.fromfile(svg_path)
-    view_size = view.get_size()
-    view = view.getroot()
-
-    if use_icon:
-        cur_dir = os.path.dirname(os.path.realpath(__file__))
-        icon = sg.fromfile(os.path.join(cur_dir, "icons/safety_warning.svg")).getroot()
-        icon.moveto(5, 5, scale_x=0.4, scale_y=0.4)
+    with stage("overlays.parse"):
+        view = sg.fromfile(svg_path)
+        view_size = view.get_size()
+        view = view.getroot()
 
     # Create an SVG to put the result in
     fig = sg.SVGFigure(
@@ -33,14 +182,304 @@ def add_safety_warning(svg_path, text, use_icon=True, font_size=24):
         Unit(str(view_size[1].split(".")[0]) + "px"),
     )
 
-    # Add text labels
-    txt1 = sg.TextElement(45, 35, text, size=font_size, weight="bold")
-
     # Build the final SVG
-    imgs = [view, txt1]
-    if use_icon:
-        imgs.append(icon)
-    fig.append(imgs)
+    overlay = _overlay_group(text, icon if use_icon else None, font_size, icon_scale)
+    fig.append([view, overlay])
 
     # Save the SVG
-    fig.save(svg_path)
+    with stage("overlays.write"):
+        fig.save(svg_path)
+
+
+def add_safety_warning_data(
+    svg, text, use_icon=True, font_size=24, icon="safety_warning", icon_scale=0.4
+):
+    """
+    Adds a safety warning to SVG content that is held in memory, such as the output of
+    `cq.exporters.getSVG`. The drawing is not parsed. The overlay group is inserted just
+    before the closing tag of the drawing, so that the cost does not grow with the size
+    of the drawing. The overlay is placed in the coordinates of the root of the drawing.
+
+    Parameters:
+        svg - The SVG content as a str, bytes or a file-like object to read it from.
+        text - String that should be displayed as the safety warning.
+        use_icon - Whether or not to display a stock safety icon with the text warning.
+        font_size - Font size to use for the warning text.
+        icon - Name of the icon to display, either the stock "safety_warning" or one added with `register_icon`.
+        icon_scale - Scale factor that is applied to the icon.
+
+    Returns:
+        The annotated SVG content as the same type that was passed in. File-like objects
+        are returned as a new in-memory file positioned at the start.
+    """
+
+    overlay = cache_call(
+        "overlays.markup_cache",
+        _overlay_markup,
+        text,
+        icon if use_icon else None,
+        font_size,
+        icon_scale,
+    )
+
+    return insert_markup(svg, overlay)
+
+
+def insert_markup(svg, markup):
+    """
+    Inserts SVG markup as the last element of a drawing without parsing the drawing.
+
+    Parameters:
+        svg - The SVG content as a str, bytes or a file-like object to read it from.
+        markup - The markup to insert, as bytes.
+
+    Returns:
+        The SVG content with the markup inserted, as the same type that was passed in. File-like
+        objects are returned as a new in-memory file positioned at the start.
+    """
+
+    # Read the content from file-like objects
+    is_file = hasattr(svg, "read")
+    data = svg.read() if is_file else svg
+
+    # Work in bytes so that the markup does not need to be decoded and encoded again
+    is_text = isinstance(data, str)
+    if is_text:
+        data = data.encode("utf-8")
+
+    # Insert the markup just before the closing tag of the drawing
+    end = data.rfind(b"</svg>")
+    if end == -1:
+        raise ValueError("The SVG content does not have a closing </svg> tag")
+    with stage("overlays.splice"):
+        data = data[:end] + markup + data[end:]
+
+    if is_text:
+        data = data.decode("utf-8")
+
+    if is_file:
+        return io.StringIO(data) if is_text else io.BytesIO(data)
+
+    return data
+
+
+def _write_atomic(path, data):
+    """
+    Writes data to a file so that readers only ever see the old or the complete new content.
+
+    Parameters:
+        path - Path of the file to write.
+        data - The bytes to write.
+
+    Returns:
+        Nothing
+    """
+
+    # Keep the permissions of a file that is overwritten, and give new files the usual ones
+    # instead of the private mode that temporary files are created with. The process umask is
+    # not consulted, because reading it means setting it for every thread at once.
+    try:
+        mode = os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        mode = NEW_FILE_MODE
+
+    # The temporary file has to be on the same file system for the rename to be atomic
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(data)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _init_overlay_worker(icons):
+    """
+    Makes the icons registered in the parent process available to a worker process.
+
+    Parameters:
+        icons - The icon registry of the parent process.
+
+    Returns:
+        Nothing
+    """
+
+    for name, svg in icons.items():
+        if _icons.get(name) != svg:
+            register_icon(name, svg)
+
+
+def _overlay_chunk(jobs):
+    """
+    Adds overlays to a chunk of SVG files in a worker process.
+
+    Parameters:
+        jobs - A list of (SVG path, output path, overlay spec) tuples.
+
+    Returns:
+        A list with an OverlayResult for each job.
+    """
+
+    results = []
+    for svg_path, output_path, spec in jobs:
+        try:
+            with open(svg_path, "rb") as svg_file:
+                data = svg_file.read()
+            _write_atomic(output_path, add_safety_warning_data(data, **spec))
+            results.append(OverlayResult(svg_path, output_path, None))
+        except Exception as err:
+            # Errors are sent back as text since not all exceptions can be pickled
+            results.append(
+                OverlayResult(svg_path, None, "%s: %s" % (type(err).__name__, err))
+            )
+
+    return results
+
+
+def add_safety_warnings(
+    svg_paths, spec, output_dir=None, max_workers=None, chunk_size=None
+):
+    """
+    Adds safety warnings to many SVG files in parallel, using a pool of processes. Each file
+    is processed like `add_safety_warning_data` and the result is written atomically, so a
+    failed or interrupted run never leaves a partially written file behind.
+
+    Parameters:
+        svg_paths - A glob pattern, or a list of file paths and glob patterns, of the SVGs to process.
+        spec - A dictionary of keyword arguments for `add_safety_warning_data`, such as "text" and
+               "use_icon", or a function that returns such a dictionary for a given file path.
+        output_dir - Directory to write the results to, or None to modify the files in-place.
+        max_workers - The number of worker processes, defaulting to the number of CPUs.
+        chunk_size - The number of files that are sent to a worker at once, or None to pick
+                     a size that keeps all of the workers busy.
+
+    Returns:
+        A generator yielding an OverlayResult for each file as it is finished, in completion order.
+        It raises a ValueError before any file is written if two of the files have the same name
+        and would be written to the same place in output_dir.
+    """
+
+    # Expand any glob patterns while keeping the order the files were given in
+    if isinstance(svg_paths, str):
+        svg_paths = [svg_paths]
+    paths = []
+    for svg_path in svg_paths:
+        if glob.has_magic(svg_path):
+            paths.extend(sorted(glob.glob(svg_path)))
+        else:
+            paths.append(svg_path)
+
+    # Resolve the overlay spec and output path of each file up front
+    jobs = []
+    sources = {}
+    for path in paths:
+        file_spec = spec(path) if callable(spec) else spec
+        if output_dir is None:
+            output_path = path
+        else:
+            output_path = os.path.join(output_dir, os.path.basename(path))
+
+        # Files from different directories with the same name would overwrite each other's results
+        output_key = os.path.normcase(os.path.abspath(output_path))
+        source = sources.setdefault(output_key, os.path.realpath(path))
+        if source != os.path.realpath(path):
+            raise ValueError(
+                "%s and %s would both be written to %s"
+                % (source, os.path.realpath(path), output_path)
+            )
+
+        jobs.append((path, output_path, file_spec))
+
+    if not jobs:
+        return
+
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+
+    # Several small chunks per worker keep the load balanced without sending one file at a time
+    max_workers = max_workers or os.cpu_count() or 1
+    if chunk_size is None:
+        chunk_size = max(1, len(jobs) // (max_workers * 4))
+    chunks = [jobs[i : i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+
+    executor = ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_init_overlay_worker,
+        initargs=(dict(_icons),),
+    )
+    try:
+        futures = [executor.submit(_overlay_chunk, chunk) for chunk in chunks]
+        for future in as_completed(futures):
+            for result in future.result():
+                yield result
+    finally:
+        # Stop any remaining work if the caller stops consuming the results early
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def main(argv=None):
+    """
+    Command line entry point that adds safety warnings to a batch of SVG files.
+
+    Parameters:
+        argv - The command line arguments, defaulting to the arguments of the process.
+
+    Returns:
+        The exit code, which is 1 if any of the files failed
+    """
+
+    parser = argparse.ArgumentParser(
+        description="Adds a safety warning overlay to SVG files."
+    )
+    parser.add_argument("svgs", nargs="+", help="SVG files or glob patterns")
+    parser.add_argument("--text", required=True, help="Text of the safety warning")
+    parser.add_argument(
+        "--no-icon", action="store_true", help="Do not add the safety icon"
+    )
+    parser.add_argument("--font-size", type=float, default=24, help="Font size")
+    parser.add_argument(
+        "--icon",
+        default="safety_warning",
+        help="Name of a registered icon or path to an icon SVG",
+    )
+    parser.add_argument(
+        "--icon-scale", type=float, default=0.4, help="Scale factor of the icon"
+    )
+    parser.add_argument(
+        "--output-dir", help="Directory to write to instead of modifying in-place"
+    )
+    parser.add_argument("--workers", type=int, help="Number of worker processes")
+    parser.add_argument("--chunk-size", type=int, help="Files sent to a worker at once")
+    args = parser.parse_args(argv)
+
+    # Custom icons are registered under their path
+    if args.icon not in _icons:
+        register_icon(args.icon, args.icon)
+
+    spec = {
+        "text": args.text,
+        "use_icon": not args.no_icon,
+        "font_size": args.font_size,
+        "icon": args.icon,
+        "icon_scale": args.icon_scale,
+    }
+
+    failed = 0
+    for result in add_safety_warnings(
+        args.svgs,
+        spec,
+        output_dir=args.output_dir,
+        max_workers=args.workers,
+        chunk_size=args.chunk_size,
+    ):
+        if result.error is None:
+            print("%s -> %s" % (result.path, result.output_path))
+        else:
+            failed += 1
+            print("%s failed: %s" % (result.path, result.error), file=sys.stderr)
+
+    return 1 if failed else 0
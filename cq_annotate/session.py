@@ -0,0 +1,312 @@
+import hashlib
+import io
+import weakref
+import cadquery as cq
+from .callouts import (
+    ANNOTATION_LAYER_NAME,
+    _add_annotation,
+    add_assembly_arrows,
+    add_assembly_lines,
+    remove_annotation_layer,
+)
+from .dimensioning import DEFAULT_PATTERN_TOLERANCE, add_circular_dimensions
+from .instrumentation import count, stage
+
+# The metadata entries that the generated annotations depend on
+HASHED_METADATA = ("explode_loc", "explode_translation", "assembly_line_length")
+
+
+class AnnotationSession:
+    """
+    Keeps the annotations generated for an assembly so that, when the model is regenerated,
+    only the parts whose shapes, location, tags or explode metadata changed are annotated again.
+    Example: `session = AnnotationSession(); session.annotate(build_model())`
+
+    Shapes are compared by identity and location by default, which is cheap, so only parts that
+    were rebuilt are annotated again. With `hash_geometry=True` the B-rep of each shape is hashed
+    instead, so rebuilt parts with unchanged geometry keep their annotations too.
+
+    The annotations are kept in the annotation layer of the assembly, see `remove_annotation_layer`.
+    """
+
+    def __init__(
+        self,
+        arrows=True,
+        lines=True,
+        arrow_scale_factor=1.0,
+        line_diameter=0.5,
+        line_length=None,
+        hash_geometry=False,
+    ):
+        """
+        Parameters:
+            arrows - Whether to add the arrows of faces tagged with "arrow".
+            lines - Whether to add the lines of faces tagged with "assembly_line".
+            arrow_scale_factor - Allows arrows to be scaled up and down so that they match the size of the view
+            line_diameter - Allows lines to be scaled up and down so that they match the size of the view
+            line_length - Allows the length of the assembly lines to be specified rather than relying on automated methods
+            hash_geometry - Compares shapes by the digest of their B-rep instead of their identity and
+                            location, which reuses more annotations but exports every shape on each call
+        """
+
+        self.arrows = arrows
+        self.lines = lines
+        self.arrow_scale_factor = arrow_scale_factor
+        self.line_diameter = line_diameter
+        self.line_length = line_length
+        self.hash_geometry = hash_geometry
+
+        # Maps the name of each top level part to its digest and the annotations built for it
+        self._annotations = {}
+
+        # The digest and result of the last circular dimensioning run
+        self._dimensions = None
+
+        # BREP digests of shapes that were already hashed, dropped along with the shapes
+        self._shape_digests = weakref.WeakKeyDictionary()
+
+        # The shapes behind the kept digests of the parts and of the dimensions. Shapes are hashed by
+        # identity, so they are kept alive to stop a new shape from reusing the identity of an old one.
+        self._part_shapes = []
+        self._dimension_shapes = []
+
+    def _update_shape(self, digest, shape, shapes):
+        """
+        Adds a shape to a digest, by its identity and location or by its B-rep with `hash_geometry`.
+
+        Parameters:
+            digest - The hashlib object being updated.
+            shape - The shape to hash.
+            shapes - List that the shape is added to so that it is kept alive.
+
+        Returns:
+            Nothing
+        """
+
+        if not self.hash_geometry:
+            shapes.append(shape)
+            digest.update(
+                repr((hash(shape.wrapped), int(shape.wrapped.Orientation()))).encode()
+            )
+            return
+
+        shape_digest = self._shape_digests.get(shape)
+        if shape_digest is None:
+            brep = io.BytesIO()
+            shape.exportBrep(brep)
+            shape_digest = hashlib.sha1(brep.getvalue()).digest()
+            self._shape_digests[shape] = shape_digest
+
+        digest.update(shape_digest)
+
+    def _update_workplane(self, digest, wp, shapes):
+        """
+        Adds the shapes and the tagged shapes of a workplane to a digest.
+
+        Parameters:
+            digest - The hashlib object being updated.
+            wp - The workplane to hash.
+            shapes - List that the hashed shapes are added to so that they are kept alive.
+
+        Returns:
+            Nothing
+        """
+
+        for obj in wp.vals():
+            if isinstance(obj, cq.Shape):
+                self._update_shape(digest, obj, shapes)
+
+        for tag in sorted(wp.ctx.tags):
+            digest.update(tag.encode())
+            for obj in wp.ctx.tags[tag].vals():
+                if isinstance(obj, cq.Shape):
+                    self._update_shape(digest, obj, shapes)
+
+    def _child_digest(self, child, shapes):
+        """
+        Hashes everything that the annotations of a top level part depend on.
+
+        Parameters:
+            child - The top level part, or subassembly, of the assembly.
+            shapes - List that the hashed shapes are added to so that they are kept alive.
+
+        Returns:
+            The digest as bytes.
+        """
+
+        digest = hashlib.sha1()
+
+        stack = [child]
+        while stack:
+            node = stack.pop()
+
+            digest.update(repr((node.name, node.loc.toTuple())).encode())
+
+            if isinstance(node.obj, cq.Workplane):
+                self._update_workplane(digest, node.obj, shapes)
+            elif isinstance(node.obj, cq.Shape):
+                self._update_shape(digest, node.obj, shapes)
+
+            for key in HASHED_METADATA:
+                value = node.metadata.get(key)
+                if isinstance(value, cq.Location):
+                    value = value.toTuple()
+                digest.update(repr((key, value)).encode())
+
+            stack.extend(reversed(node.children))
+
+        return digest.digest()
+
+    def _build_annotations(self, child):
+        """
+        Generates the annotations of one top level part.
+
+        Parameters:
+            child - The top level part, or subassembly, of the assembly.
+
+        Returns:
+            A list of the annotation nodes that were generated.
+        """
+
+        # Attach the part directly to a scratch assembly so that it is not copied
+        scratch = cq.Assembly()
+        scratch.children.append(child)
+        scratch.objects[child.name] = child
+
+        if self.arrows:
+            add_assembly_arrows(scratch, self.arrow_scale_factor, annotation_layer=True)
+        if self.lines:
+            add_assembly_lines(
+                scratch,
+                self.line_diameter,
+                self.line_length,
+                annotation_layer=True,
+            )
+
+        if ANNOTATION_LAYER_NAME not in scratch.objects:
+            return []
+
+        return list(scratch.objects[ANNOTATION_LAYER_NAME].children)
+
+    def annotate(self, assy):
+        """
+        Adds the assembly arrows and lines to the annotation layer of an assembly, only
+        regenerating the annotations of parts that changed since the last call.
+
+        Parameters:
+            assy - The assembly to annotate.
+
+        Returns:
+            The same assembly with the annotation layer updated
+        """
+
+        # The layer is rebuilt from the kept annotations so that removed parts drop out
+        remove_annotation_layer(assy)
+
+        annotations = {}
+        shapes = []
+        for child in list(assy.children):
+            with stage("session.hash"):
+                digest = self._child_digest(child, shapes)
+
+            kept = self._annotations.get(child.name)
+            if kept is not None and kept[0] == digest:
+                count("session.reused")
+                nodes = kept[1]
+            else:
+                count("session.rebuilt")
+                nodes = self._build_annotations(child)
+
+            annotations[child.name] = (digest, nodes)
+
+            for node in nodes:
+                _add_annotation(
+                    assy, node.obj, node.name, node.loc, node.color, node.metadata
+                )
+
+        self._annotations = annotations
+        self._part_shapes = shapes
+
+        return assy
+
+    def add_circular_dimensions(
+        self,
+        obj,
+        arrow_scale_factor=1.0,
+        font_size=4,
+        text_depth=1.0,
+        font="Arial",
+        group_patterns=False,
+        tolerance=DEFAULT_PATTERN_TOLERANCE,
+        auto=False,
+    ):
+        """
+        Adds circular dimensions like `dimensioning.add_circular_dimensions`, returning the
+        result of the last call again when neither the object nor the settings changed.
+
+        Parameters:
+            obj - The object with tagged circular edges.
+            arrow_scale_factor - Allows arrows to be scaled up and down so that they match the size of the view
+            font_size - Size of the dimension text.
+            text_depth - Depth of the dimension text.
+            font - Font of the dimension text.
+            group_patterns - Gives each hole pattern a single "n× R" dimension, see `dimensioning.add_circular_dimensions`.
+            tolerance - How far the radii and planes of the edges in a pattern may differ.
+            auto - Dimensions every full circle of the object instead of the tagged edges, see `dimensioning.find_circular_edges`.
+
+        Returns:
+            An assembly holding the object and its dimensions, which is shared with earlier calls
+            that returned the same result
+        """
+
+        with stage("session.hash"):
+            digest = hashlib.sha1()
+            shapes = []
+            self._update_workplane(digest, obj, shapes)
+            digest.update(
+                repr(
+                    (
+                        arrow_scale_factor,
+                        font_size,
+                        text_depth,
+                        font,
+                        group_patterns,
+                        tolerance,
+                        auto,
+                    )
+                ).encode()
+            )
+            digest = digest.digest()
+
+        if self._dimensions is not None and self._dimensions[0] == digest:
+            count("session.reused")
+            return self._dimensions[1]
+
+        count("session.rebuilt")
+        assy = add_circular_dimensions(
+            obj,
+            arrow_scale_factor,
+            font_size,
+            text_depth,
+            font,
+            group_patterns,
+            tolerance,
+            auto,
+        )
+        self._dimensions = (digest, assy)
+        self._dimension_shapes = shapes
+
+        return assy
+
+    def clear(self):
+        """
+        Forgets all kept annotations so that the next calls regenerate everything.
+
+        Returns:
+            Nothing
+        """
+
+        self._annotations = {}
+        self._dimensions = None
+        self._part_shapes = []
+        self._dimension_shapes = []
@@ -0,0 +1,201 @@
+import hashlib
+import os
+import tempfile
+import cadquery as cq
+from .instrumentation import count, stage
+
+# Bumped whenever the generated geometry changes so that older cache entries are not reused
+CACHE_VERSION = 1
+
+# The default size cap of the cache directory in bytes
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+# Environment variables that turn the cache on, which are also seen by worker processes
+CACHE_DIR_ENV = "CQ_ANNOTATE_CACHE_DIR"
+CACHE_SIZE_ENV = "CQ_ANNOTATE_CACHE_SIZE"
+
+# The directory and size cap of the cache, where a directory of None turns the cache off
+_cache_dir = os.environ.get(CACHE_DIR_ENV) or None
+_max_size = int(os.environ.get(CACHE_SIZE_ENV, DEFAULT_MAX_SIZE))
+
+
+def configure_shape_cache(directory, max_size=DEFAULT_MAX_SIZE):
+    """
+    Turns the persistent cache of generated annotation shapes on or off. The cache can also be
+    turned on by setting the CQ_ANNOTATE_CACHE_DIR environment variable, and optionally
+    CQ_ANNOTATE_CACHE_SIZE, which is also picked up by worker processes.
+    Example: `configure_shape_cache("~/.cache/cq-annotate")`
+
+    Parameters:
+        directory - The directory to keep the BREP files in, or None to turn the cache off.
+        max_size - The size in bytes that the directory is trimmed to, by removing the least recently used files.
+
+    Returns:
+        Nothing
+    """
+
+    global _cache_dir, _max_size
+
+    _cache_dir = os.path.expanduser(directory) if directory is not None else None
+    _max_size = max_size
+
+
+def clear_shape_cache():
+    """
+    Removes all files from the persistent shape cache.
+
+    Returns:
+        Nothing
+    """
+
+    if _cache_dir is None or not os.path.isdir(_cache_dir):
+        return
+
+    for entry in os.scandir(_cache_dir):
+        if entry.name.endswith(".brep"):
+            _remove(entry.path)
+
+
+def _remove(path):
+    """
+    Removes a cache file, ignoring files that another process already removed.
+    """
+
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _cache_path(kind, params):
+    """
+    Works out the file that a generated shape is kept in.
+
+    Parameters:
+        kind - The kind of shape, such as "arrow".
+        params - Tuple of the parameters that the shape was generated from.
+
+    Returns:
+        The path of the BREP file.
+    """
+
+    key = hashlib.sha1(repr((CACHE_VERSION, kind, params)).encode()).hexdigest()
+
+    return os.path.join(_cache_dir, kind + "-" + key + ".brep")
+
+
+def _read(path):
+    """
+    Reads a cached shape and marks it as recently used.
+
+    Parameters:
+        path - The path of the BREP file.
+
+    Returns:
+        The shape, or None if it is not in the cache or could not be read.
+    """
+
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with stage("shape_cache.read"):
+            shape = cq.Shape.importBrep(path)
+    except (OSError, ValueError):
+        # The file may have been evicted by another process in the meantime
+        return None
+
+    # The modification time is what eviction goes by
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+    return shape
+
+
+def _write(path, shape):
+    """
+    Writes a shape to the cache atomically, so that other processes never read a partial file,
+    and then trims the cache to its size cap.
+
+    Parameters:
+        path - The path of the BREP file.
+        shape - The shape to write.
+
+    Returns:
+        Nothing
+    """
+
+    with stage("shape_cache.write"):
+        os.makedirs(_cache_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=_cache_dir)
+        try:
+            with os.fdopen(fd, "wb") as brep_file:
+                shape.exportBrep(brep_file)
+            os.replace(temp_path, path)
+        except BaseException:
+            _remove(temp_path)
+            raise
+
+    _evict()
+
+
+def _evict():
+    """
+    Removes the least recently used files until the cache fits within its size cap.
+
+    Returns:
+        Nothing
+    """
+
+    files = []
+    total = 0
+    for entry in os.scandir(_cache_dir):
+        if not entry.name.endswith(".brep"):
+            continue
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, entry.path))
+        total += stat.st_size
+
+    files.sort()
+    for _, size, path in files:
+        if total <= _max_size:
+            break
+        _remove(path)
+        total -= size
+        count("shape_cache.evictions")
+
+
+def cached_shape(kind, params, build):
+    """
+    Gets a generated shape from the persistent cache, building and storing it on a miss.
+    When the cache is turned off the shape is always built.
+
+    Parameters:
+        kind - The kind of shape, such as "arrow".
+        params - Tuple of the parameters that the shape is generated from, which are passed to build.
+        build - Function that builds the shape from the parameters.
+
+    Returns:
+        The shape
+    """
+
+    if _cache_dir is None:
+        return build(*params)
+
+    path = _cache_path(kind, params)
+
+    shape = _read(path)
+    if shape is not None:
+        count("shape_cache.hits")
+        return shape
+
+    count("shape_cache.misses")
+    shape = build(*params)
+    _write(path, shape)
+
+    return shape
@@ -0,0 +1,362 @@
+from functools import lru_cache
+from math import floor
+import numpy as np
+from .instrumentation import count, stage
+
+# The number of boxes that are kept in a leaf of the tree instead of being split further
+LEAF_SIZE = 8
+
+
+def _boxes_overlap(boxes, box, tolerance):
+    """
+    Tests many axis aligned boxes against one box at once.
+
+    Parameters:
+        boxes - An (n, 6) array of boxes as (xmin, ymin, zmin, xmax, ymax, zmax) rows.
+        box - The box to test against, as a sequence of six values.
+        tolerance - Distance that boxes may be apart and still count as overlapping, either one
+                    value or one value per axis.
+
+    Returns:
+        A boolean array that is true for the boxes that overlap the box.
+    """
+
+    box = np.asarray(box, dtype=float)
+    tolerance = np.asarray(tolerance, dtype=float)
+
+    return np.all(boxes[:, :3] <= box[3:] + tolerance, axis=1) & np.all(
+        boxes[:, 3:] >= box[:3] - tolerance, axis=1
+    )
+
+
+class AABBTree:
+    """
+    A bounding volume hierarchy over axis aligned bounding boxes, which finds the boxes that
+    overlap a query box in about O(log n) time instead of testing every box.
+    Example: `AABBTree(boxes).query((0, 0, 0, 1, 1, 1))`
+    """
+
+    def __init__(self, boxes, leaf_size=LEAF_SIZE):
+        """
+        Parameters:
+            boxes - An (n, 6) array of boxes as (xmin, ymin, zmin, xmax, ymax, zmax) rows.
+            leaf_size - The number of boxes that are kept in a leaf instead of being split further.
+        """
+
+        self.boxes = np.asarray(boxes, dtype=float).reshape(-1, 6)
+        self.leaf_size = leaf_size
+
+        # The box indices in tree order, so that every node covers one slice of them
+        self.order = np.arange(len(self.boxes))
+
+        # Per node, its bounding box, its slice of the order and its two children, where -1 marks a leaf
+        self.node_boxes = []
+        self.node_ranges = []
+        self.node_children = []
+
+        with stage("spatial.build"):
+            self._build()
+
+        # Plain floats are much quicker than tiny arrays for testing one node at a time
+        self._node_bounds = [tuple(node_box.tolist()) for node_box in self.node_boxes]
+
+    def _build(self):
+        """
+        Splits the boxes at the median of the longest axis of their centers until the leaves are small.
+
+        Returns:
+            Nothing
+        """
+
+        if len(self.boxes) == 0:
+            return
+
+        centers = (self.boxes[:, :3] + self.boxes[:, 3:]) / 2.0
+
+        # Children are filled in once they are created, so nodes are pushed with their own id
+        stack = [(self._add_node(0, len(self.boxes)), 0, len(self.boxes))]
+        while stack:
+            node, start, end = stack.pop()
+            if end - start <= self.leaf_size:
+                continue
+
+            indices = self.order[start:end]
+            spread = centers[indices].max(axis=0) - centers[indices].min(axis=0)
+            axis = int(np.argmax(spread))
+
+            # Put the half with the smaller centers first
+            middle = (end - start) // 2
+            split = np.argpartition(centers[indices, axis], middle)
+            self.order[start:end] = indices[split]
+
+            left = self._add_node(start, start + middle)
+            right = self._add_node(start + middle, end)
+            self.node_children[node] = (left, right)
+            stack.append((left, start, start + middle))
+            stack.append((right, start + middle, end))
+
+    def _add_node(self, start, end):
+        """
+        Adds a leaf node covering a slice of the box order.
+
+        Returns:
+            The id of the node.
+        """
+
+        boxes = self.boxes[self.order[start:end]]
+        self.node_boxes.append(
+            np.concatenate((boxes[:, :3].min(axis=0), boxes[:, 3:].max(axis=0)))
+        )
+        self.node_ranges.append((start, end))
+        self.node_children.append((-1, -1))
+
+        return len(self.node_boxes) - 1
+
+    def query(self, box, tolerance=0.0):
+        """
+        Finds the boxes that overlap a box.
+
+        Parameters:
+            box - The box to search with, as (xmin, ymin, zmin, xmax, ymax, zmax).
+            tolerance - Distance that boxes may be apart and still count as overlapping, either one
+                        value or one value per axis.
+
+        Returns:
+            A sorted array of the indices of the overlapping boxes.
+        """
+
+        if not self.node_boxes:
+            return np.zeros(0, dtype=int)
+
+        box = np.asarray(box, dtype=float)
+        tolerance = np.broadcast_to(np.asarray(tolerance, dtype=float), (3,))
+
+        # The query box grown by the tolerance, as plain floats
+        x0, y0, z0 = (box[:3] - tolerance).tolist()
+        x1, y1, z1 = (box[3:] + tolerance).tolist()
+
+        found = []
+        visited = 0
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            visited += 1
+
+            nx0, ny0, nz0, nx1, ny1, nz1 = self._node_bounds[node]
+            if nx0 > x1 or ny0 > y1 or nz0 > z1 or nx1 < x0 or ny1 < y0 or nz1 < z0:
+                continue
+
+            left, right = self.node_children[node]
+            if left == -1:
+                start, end = self.node_ranges[node]
+                indices = self.order[start:end]
+                found.append(
+                    indices[_boxes_overlap(self.boxes[indices], box, tolerance)]
+                )
+            else:
+                stack.extend((left, right))
+
+        count("spatial.nodes_visited", visited)
+
+        if not found:
+            return np.zeros(0, dtype=int)
+
+        return np.sort(np.concatenate(found))
+
+    def overlapping_pairs(self, tolerance=0.0):
+        """
+        Finds every pair of boxes that overlap or touch, such as parts that are in contact.
+
+        Parameters:
+            tolerance - Distance that boxes may be apart and still count as overlapping.
+
+        Returns:
+            A list of (i, j) index pairs with i < j.
+        """
+
+        pairs = []
+        for i, box in enumerate(self.boxes):
+            for j in self.query(box, tolerance):
+                if j > i:
+                    pairs.append((i, int(j)))
+
+        return pairs
+
+
+class GridIndex:
+    """
+    A uniform grid over 2D rectangles in a view plane, which is used to place labels where they do
+    not collide with other labels or leaders. Each rectangle is filed under the grid cells that it
+    covers, so a collision test only looks at the few rectangles near the one being tested.
+    Example: `GridIndex(5.0).place(12.0, 4.0, (0.0, 0.0))`
+    """
+
+    def __init__(self, cell_size):
+        """
+        Parameters:
+            cell_size - Width and height of the grid cells, which works best at about the size of a label.
+        """
+
+        self.cell_size = float(cell_size)
+
+        # Maps each (column, row) cell to the indices of the rectangles that cover it
+        self.cells = {}
+        self.rects = []
+
+        # Rectangles that were already added, since many leaders can cover the same spot
+        self._known = set()
+
+        # Where the search of each preferred position stopped, so that repeated requests for the
+        # same spot continue from there instead of testing the taken slots again
+        self._resume = {}
+
+    def _cell_range(self, rect):
+        """
+        Works out the cells that a rectangle covers.
+
+        Parameters:
+            rect - The rectangle as (umin, vmin, umax, vmax).
+
+        Returns:
+            The first and last column and row.
+        """
+
+        return (
+            int(floor(rect[0] / self.cell_size)),
+            int(floor(rect[1] / self.cell_size)),
+            int(floor(rect[2] / self.cell_size)),
+            int(floor(rect[3] / self.cell_size)),
+        )
+
+    def insert(self, rect):
+        """
+        Adds a rectangle to the index.
+
+        Parameters:
+            rect - The rectangle as (umin, vmin, umax, vmax).
+
+        Returns:
+            Nothing
+        """
+
+        rect = tuple(rect)
+        if rect in self._known:
+            return
+        self._known.add(rect)
+
+        index = len(self.rects)
+        self.rects.append(rect)
+
+        col0, row0, col1, row1 = self._cell_range(rect)
+        for col in range(col0, col1 + 1):
+            for row in range(row0, row1 + 1):
+                self.cells.setdefault((col, row), []).append(index)
+
+    def collides(self, rect, gap=0.0):
+        """
+        Tests whether a rectangle comes within a gap of any rectangle in the index.
+
+        Parameters:
+            rect - The rectangle as (umin, vmin, umax, vmax).
+            gap - Distance that has to be kept between the rectangles.
+
+        Returns:
+            True if the rectangle collides with another one.
+        """
+
+        u0, v0, u1, v1 = rect[0] - gap, rect[1] - gap, rect[2] + gap, rect[3] + gap
+
+        tested = 0
+        hit = False
+        col0, row0, col1, row1 = self._cell_range((u0, v0, u1, v1))
+        for col in range(col0, col1 + 1):
+            for row in range(row0, row1 + 1):
+                for index in self.cells.get((col, row), ()):
+                    tested += 1
+                    ou0, ov0, ou1, ov1 = self.rects[index]
+                    if ou0 < u1 and ov0 < v1 and ou1 > u0 and ov1 > v0:
+                        hit = True
+                        break
+                if hit:
+                    break
+            if hit:
+                break
+
+        count("spatial.rects_tested", tested)
+
+        return hit
+
+    def place(self, width, height, preferred, gap=0.0, max_rings=1000):
+        """
+        Finds the free slot nearest to a preferred position for a rectangle and adds the rectangle
+        there. Slots are tried on a lattice of the rectangle size, ring by ring around the preferred
+        position and nearest first within each ring.
+
+        Parameters:
+            width - Width of the rectangle.
+            height - Height of the rectangle.
+            preferred - The preferred position of the lower left corner of the rectangle, as (u, v).
+            gap - Distance that has to be kept to the other rectangles.
+            max_rings - How far the search goes before giving up and using the preferred position.
+
+        Returns:
+            The position of the lower left corner of the rectangle, as (u, v).
+        """
+
+        step_u = width + gap
+        step_v = height + gap
+
+        # Slots only ever fill up, so the search for the same spot can continue where it stopped
+        key = (round(preferred[0], 6), round(preferred[1], 6), width, height, gap)
+        ring, position = self._resume.get(key, (0, 0))
+
+        corner = None
+        while corner is None and ring <= max_rings:
+            slots = _ring_offsets(ring)
+            while position < len(slots):
+                i, j = slots[position]
+                u = preferred[0] + i * step_u
+                v = preferred[1] + j * step_v
+                if not self.collides((u, v, u + width, v + height), gap):
+                    corner = (u, v)
+                    break
+                position += 1
+            else:
+                ring += 1
+                position = 0
+
+        if corner is None:
+            count("spatial.placements_failed")
+            corner = tuple(preferred)
+            ring, position = 0, 0
+
+        self._resume[key] = (ring, position)
+        self.insert((corner[0], corner[1], corner[0] + width, corner[1] + height))
+
+        return corner
+
+
+@lru_cache(maxsize=256)
+def _ring_offsets(ring):
+    """
+    Lists the lattice offsets on the square ring at a distance from the origin, nearest first and
+    then up and to the right first, which is away from the part for the dimension leaders.
+
+    Parameters:
+        ring - The distance of the ring in lattice steps.
+
+    Returns:
+        A tuple of (i, j) offsets.
+    """
+
+    if ring == 0:
+        return ((0, 0),)
+
+    offsets = [
+        (i, j)
+        for i in range(-ring, ring + 1)
+        for j in range(-ring, ring + 1)
+        if max(abs(i), abs(j)) == ring
+    ]
+
+    return tuple(sorted(offsets, key=lambda o: (o[0] ** 2 + o[1] ** 2, -o[1], -o[0])))
@@ -0,0 +1,131 @@
+import json
+
+# The version of the JSON layout written by `specs_to_json`
+SPEC_FORMAT_VERSION = 1
+
+
+class AnnotationSpec:
+    """
+    A lightweight description of one annotation, which holds where the annotation goes and how
+    big it is, but no geometry. Solids are only built from it when they are needed, see
+    `deferred.DeferredAnnotations`.
+    Example: `AnnotationSpec("arrow", (0, 0, 5), (0, 0, -1), size=1.0, length=20.0)`
+    """
+
+    __slots__ = (
+        "kind",
+        "anchor",
+        "direction",
+        "normal",
+        "size",
+        "length",
+        "label",
+        "name",
+    )
+
+    def __init__(
+        self,
+        kind,
+        anchor,
+        direction,
+        normal=None,
+        size=1.0,
+        length=0.0,
+        label=None,
+        name=None,
+    ):
+        """
+        Parameters:
+            kind - The kind of annotation, "arrow", "line", "leader" or "label". A leader is the bent
+                   arrow of a dimension, which lies in a plane like a label.
+            anchor - Tip of an arrow or a leader, start of a line or origin of a label, as a tuple in the coordinates of the assembly.
+            direction - Unit vector that an arrow points in, that a line extends in, or the X direction of the plane of a leader or a label.
+            normal - Unit vector that the plane of a leader or a label faces, or None for arrows and lines.
+            size - Scale factor of an arrow or a leader, diameter of a line or font size of a label.
+            length - Length of an arrow, a leader or a line, or the depth of the text of a label.
+            label - Text of a label.
+            name - Name of the annotation in the assembly that it is built into.
+        """
+
+        self.kind = kind
+        self.anchor = tuple(anchor)
+        self.direction = tuple(direction)
+        self.normal = tuple(normal) if normal is not None else None
+        self.size = size
+        self.length = length
+        self.label = label
+        self.name = name
+
+    def to_dict(self):
+        """
+        Converts the spec to a dictionary of plain values that can be written as JSON.
+
+        Returns:
+            A dictionary with an entry for each field.
+        """
+
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Creates a spec from a dictionary made by `to_dict`, such as one read back from JSON.
+
+        Parameters:
+            data - The dictionary.
+
+        Returns:
+            The AnnotationSpec.
+        """
+
+        return cls(**{field: data[field] for field in cls.__slots__ if field in data})
+
+    def __eq__(self, other):
+        if not isinstance(other, AnnotationSpec):
+            return NotImplemented
+
+        return self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return "AnnotationSpec(%s)" % ", ".join(
+            "%s=%r" % (field, getattr(self, field)) for field in self.__slots__
+        )
+
+
+def specs_to_json(specs):
+    """
+    Writes annotation specs as JSON.
+
+    Parameters:
+        specs - The AnnotationSpec objects.
+
+    Returns:
+        The JSON text.
+    """
+
+    return json.dumps(
+        {
+            "version": SPEC_FORMAT_VERSION,
+            "annotations": [spec.to_dict() for spec in specs],
+        }
+    )
+
+
+def specs_from_json(text):
+    """
+    Reads annotation specs that were written by `specs_to_json`.
+
+    Parameters:
+        text - The JSON text.
+
+    Returns:
+        A list of AnnotationSpec objects.
+    """
+
+    data = json.loads(text)
+    if data.get("version") != SPEC_FORMAT_VERSION:
+        raise ValueError(
+            "Unsupported annotation spec version %r" % (data.get("version"),)
+        )
+
+    return [AnnotationSpec.from_dict(entry) for entry in data["annotations"]]
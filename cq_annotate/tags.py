@@ -0,0 +1,174 @@
+from collections import namedtuple
+import cadquery as cq
+
+# One tagged object found while indexing an assembly or workplane
+#   tag - Name of the tag
+#   path - Names of the assembly children leading from the root to the node holding the tag
+#   node - The assembly node holding the tagged object, or None when a workplane was indexed
+#   workplane - The tagged workplane
+#   shape - The first shape of the tagged workplane
+#   loc - Location of the node relative to the root of the assembly
+#   center - Center of the tagged shape in the coordinates of the node
+#   normal - Normal of the tagged shape if it is a face, otherwise None
+TagEntry = namedtuple(
+    "TagEntry", ["tag", "path", "node", "workplane", "shape", "loc", "center", "normal"]
+)
+
+# Attribute that a built index is kept under on its assembly or workplane, so that it is dropped along with it
+_INDEX_ATTR = "_tag_index"
+
+
+def _tree_signature(obj):
+    """
+    Collects the objects that the tag index of an assembly or workplane depends on, so that it
+    can be detected when the tree has changed without querying any tags.
+
+    Parameters:
+        obj - The assembly or workplane that was indexed.
+
+    Returns:
+        A list of the nodes, objects, locations and tags of the tree.
+    """
+
+    if isinstance(obj, cq.Workplane):
+        return [obj] + _tag_signature(obj)
+
+    signature = []
+    stack = [obj]
+    while stack:
+        node = stack.pop()
+        signature.extend((node, node.obj, node.loc, len(node.children)))
+        if isinstance(node.obj, cq.Workplane):
+            signature.extend(_tag_signature(node.obj))
+        stack.extend(node.children)
+
+    return signature
+
+
+def _tag_signature(wp):
+    """
+    Collects the tags of a workplane along with what they point at, so that moving a tag to a
+    different shape under the same name is noticed.
+
+    Parameters:
+        wp - The workplane whose tags should be collected.
+
+    Returns:
+        A list with the number of tags, followed by the name, tagged workplane and tagged
+        objects of each tag.
+    """
+
+    signature = [len(wp.ctx.tags)]
+    for tag, tagged in wp.ctx.tags.items():
+        signature.extend((tag, tagged, len(tagged.objects)))
+        signature.extend(tagged.objects)
+
+    return signature
+
+
+def _index_workplane(index, wp, path, node, loc):
+    """
+    Adds all tagged shapes of a workplane to a tag index.
+
+    Parameters:
+        index - The index being built.
+        wp - The workplane whose tags should be indexed.
+        path - Names of the assembly children leading to the node holding the workplane.
+        node - The assembly node holding the workplane, or None.
+        loc - Location of the node relative to the root of the assembly.
+
+    Returns:
+        Nothing, modifies the index in-place
+    """
+
+    for tag, tagged in wp.ctx.tags.items():
+        shape = tagged.val()
+
+        # Tags can also be set on workplanes without any geometry
+        if not isinstance(shape, cq.Shape):
+            continue
+
+        center = shape.Center()
+        normal = (
+            shape.normalAt(cq.Vector(0, 0, 0)) if isinstance(shape, cq.Face) else None
+        )
+
+        index.setdefault(tag, []).append(
+            TagEntry(tag, path, node, tagged, shape, loc, center, normal)
+        )
+
+
+def build_tag_index(obj):
+    """
+    Walks an assembly, at any depth, or a workplane once and collects every tagged shape.
+
+    Parameters:
+        obj - The assembly or workplane to index.
+
+    Returns:
+        A dictionary mapping each tag name to a list of TagEntry objects, in tree order.
+    """
+
+    index = {}
+
+    if isinstance(obj, cq.Workplane):
+        _index_workplane(index, obj, (), None, cq.Location())
+        return index
+
+    # The root location is left out so that entries are relative to the assembly
+    stack = [(obj, (), cq.Location())]
+    while stack:
+        node, path, loc = stack.pop()
+
+        if isinstance(node.obj, cq.Workplane):
+            _index_workplane(index, node.obj, path, node, loc)
+
+        stack.extend(
+            (child, path + (child.name,), loc * child.loc)
+            for child in reversed(node.children)
+        )
+
+    return index
+
+
+def get_tag_index(obj):
+    """
+    Gets the tag index of an assembly or workplane, only rebuilding it when the tree has
+    changed since the index was last built.
+
+    Parameters:
+        obj - The assembly or workplane to index.
+
+    Returns:
+        A dictionary mapping each tag name to a list of TagEntry objects, in tree order.
+    """
+
+    signature = _tree_signature(obj)
+
+    cached = vars(obj).get(_INDEX_ATTR)
+    if cached is not None:
+        cached_signature, index = cached
+        if len(cached_signature) == len(signature) and all(
+            a is b or (isinstance(a, (int, str)) and a == b)
+            for a, b in zip(cached_signature, signature)
+        ):
+            return index
+
+    index = build_tag_index(obj)
+    setattr(obj, _INDEX_ATTR, (signature, index))
+
+    return index
+
+
+def invalidate_tag_index(obj):
+    """
+    Drops the cached tag index of an assembly or workplane so that it is rebuilt on next use.
+
+    Parameters:
+        obj - The assembly or workplane that was indexed.
+
+    Returns:
+        Nothing
+    """
+
+    vars(obj).pop(_INDEX_ATTR, None)
@@ -0,0 +1,224 @@
+import io
+import re
+from collections import namedtuple
+from math import sqrt
+from xml.sax.saxutils import escape
+from OCP.gp import gp_Ax2, gp_Dir, gp_Pnt, gp_Pnt2d
+from OCP.HLRAlgo import HLRAlgo_Projector
+from .instrumentation import count, stage
+from .overlays import insert_markup
+
+# An arrow that is drawn as lines instead of a solid
+#   anchor - Position of the arrow tip, as a tuple in the coordinates of the assembly
+#   direction - Unit vector that the arrow points in, as a tuple
+#   length - Length of the arrow from its tail to its tip
+ArrowPrimitive = namedtuple("ArrowPrimitive", ["anchor", "direction", "length"])
+
+# A line, such as an assembly line or a dimension leader
+#   anchor - Position of the start of the line, as a tuple in the coordinates of the assembly
+#   direction - Unit vector that the line extends in, as a tuple
+#   length - Length of the line
+LinePrimitive = namedtuple("LinePrimitive", ["anchor", "direction", "length"])
+
+# A text label
+#   anchor - Position of the start of the text baseline, as a tuple in the coordinates of the assembly
+#   text - The text to display
+#   size - Height of the text, in the units of the model
+TextPrimitive = namedtuple("TextPrimitive", ["anchor", "text", "size"])
+
+# The default view direction of cq.exporters.getSVG
+DEFAULT_PROJECTION_DIR = (-1.75, 1.1, 5)
+
+# The transform that cq.exporters.getSVG places the drawing in, "scale(s, -s) translate(x,y)"
+_VIEW_TRANSFORM = re.compile(
+    rb'<g\s+transform="\s*scale\(\s*([^,\s]+)\s*,\s*-?([^)\s]+)\s*\)\s*'
+    rb"translate\(\s*([^,\s]+)\s*,\s*([^)\s]+)\s*\)"
+)
+
+
+def world_point(loc, vec):
+    """
+    Moves a point from the coordinates of an assembly node to the coordinates of the assembly.
+
+    Parameters:
+        loc - Location of the node relative to the assembly.
+        vec - The point, as a cq.Vector.
+
+    Returns:
+        The point as a tuple.
+    """
+
+    pnt = gp_Pnt(vec.x, vec.y, vec.z).Transformed(loc.wrapped.Transformation())
+
+    return (pnt.X(), pnt.Y(), pnt.Z())
+
+
+def world_direction(loc, vec):
+    """
+    Rotates a direction from the coordinates of an assembly node to the coordinates of the assembly.
+
+    Parameters:
+        loc - Location of the node relative to the assembly.
+        vec - The direction, as a cq.Vector.
+
+    Returns:
+        The unit direction as a tuple.
+    """
+
+    direction = gp_Dir(vec.x, vec.y, vec.z).Transformed(loc.wrapped.Transformation())
+
+    return (direction.X(), direction.Y(), direction.Z())
+
+
+def _view_transform(data):
+    """
+    Reads the scale and translation that cq.exporters.getSVG applied to a drawing.
+
+    Parameters:
+        data - The SVG content as bytes.
+
+    Returns:
+        A tuple of the scale and the x and y translations.
+    """
+
+    match = _VIEW_TRANSFORM.search(data)
+    if match is None:
+        raise ValueError(
+            "The SVG content does not have the view transform of cq.exporters.getSVG"
+        )
+
+    return float(match.group(1)), float(match.group(3)), float(match.group(4))
+
+
+def _format(value):
+    return "%.3f" % value
+
+
+def project_primitives(primitives, svg, opts=None, color=(0, 0, 0), stroke_width=1.5):
+    """
+    Projects annotation primitives into the view of an SVG drawing, so that they can be drawn as
+    SVG paths and text instead of going through hidden line removal as solids.
+
+    Parameters:
+        primitives - The ArrowPrimitive, LinePrimitive and TextPrimitive objects to draw.
+        svg - The SVG content that cq.exporters.getSVG produced, as a str or bytes.
+        opts - The options that were passed to cq.exporters.getSVG, of which "projectionDir" and "focus" are used.
+        color - RGB color of the annotations, with 0-255 components.
+        stroke_width - Width of the lines in pixels.
+
+    Returns:
+        An SVG group element holding the annotations in the coordinates of the drawing, as bytes.
+    """
+
+    opts = opts or {}
+    data = svg.encode("utf-8") if isinstance(svg, str) else svg
+    scale, x_translate, y_translate = _view_transform(data)
+
+    # Set up the same projection that the exporter used for the drawing
+    coordinate_system = gp_Ax2(
+        gp_Pnt(), gp_Dir(*opts.get("projectionDir", DEFAULT_PROJECTION_DIR))
+    )
+    focus = opts.get("focus")
+    if focus:
+        projector = HLRAlgo_Projector(coordinate_system, float(focus))
+    else:
+        projector = HLRAlgo_Projector(coordinate_system)
+
+    def project(point):
+        projected = gp_Pnt2d()
+        projector.Project(gp_Pnt(*point), projected)
+
+        # Apply the scale(s, -s) translate(x, y) transform of the drawing
+        return (
+            scale * (projected.X() + x_translate),
+            -scale * (projected.Y() + y_translate),
+        )
+
+    paths = []
+    texts = []
+    with stage("vector.project"):
+        for primitive in primitives:
+            count("primitives_drawn")
+
+            if isinstance(primitive, TextPrimitive):
+                x, y = project(primitive.anchor)
+                texts.append(
+                    '<text x="%s" y="%s" font-size="%s">%s</text>'
+                    % (
+                        _format(x),
+                        _format(y),
+                        _format(primitive.size * scale),
+                        escape(primitive.text),
+                    )
+                )
+                continue
+
+            # Arrows end at their anchor and lines start at it
+            offset = [d * primitive.length for d in primitive.direction]
+            if isinstance(primitive, ArrowPrimitive):
+                tail = tuple(a - o for a, o in zip(primitive.anchor, offset))
+                start, end = project(tail), project(primitive.anchor)
+            else:
+                tip = tuple(a + o for a, o in zip(primitive.anchor, offset))
+                start, end = project(primitive.anchor), project(tip)
+            path = "M%s,%s L%s,%s" % tuple(_format(v) for v in start + end)
+
+            # Draw the arrow head in the plane of the drawing, unless the arrow points at the viewer
+            dx = end[0] - start[0]
+            dy = end[1] - start[1]
+            length = sqrt(dx**2 + dy**2)
+            if isinstance(primitive, ArrowPrimitive) and length > 1e-9:
+                head = 0.5 * length
+                ux, uy = dx / length, dy / length
+                base = (end[0] - ux * head, end[1] - uy * head)
+                left = (base[0] - uy * head * 0.25, base[1] + ux * head * 0.25)
+                right = (base[0] + uy * head * 0.25, base[1] - ux * head * 0.25)
+                path += " M%s,%s L%s,%s L%s,%s Z" % tuple(
+                    _format(v) for v in end + left + right
+                )
+
+            paths.append('<path d="%s" />' % path)
+
+    rgb = "rgb(%s)" % ",".join(str(c) for c in color)
+    markup = (
+        '<g stroke="%s" stroke-width="%s" fill="%s" font-family="sans-serif">'
+        % (rgb, _format(stroke_width), rgb)
+        + "".join(paths)
+        + '<g stroke="none">'
+        + "".join(texts)
+        + "</g></g>"
+    )
+
+    return markup.encode("utf-8")
+
+
+def add_vector_annotations(
+    svg, primitives, opts=None, color=(0, 0, 0), stroke_width=1.5
+):
+    """
+    Draws annotation primitives on top of an SVG drawing made by cq.exporters.getSVG, as native SVG
+    paths and text. This skips the hidden line removal that 3D annotation solids would need.
+    Example: `add_vector_annotations(cq.exporters.getSVG(shape), get_assembly_arrow_primitives(assy))`
+
+    Parameters:
+        svg - The SVG content as a str, bytes or a file-like object to read it from.
+        primitives - The ArrowPrimitive, LinePrimitive and TextPrimitive objects to draw.
+        opts - The options that were passed to cq.exporters.getSVG, of which "projectionDir" and "focus" are used.
+        color - RGB color of the annotations, with 0-255 components.
+        stroke_width - Width of the lines in pixels.
+
+    Returns:
+        The annotated SVG content as the same type that was passed in. File-like objects
+        are returned as a new in-memory file positioned at the start.
+    """
+
+    # Read the content from file-like objects so that the view transform can be found
+    if hasattr(svg, "read"):
+        data = svg.read()
+        svg = io.StringIO(data) if isinstance(data, str) else io.BytesIO(data)
+    else:
+        data = svg
+
+    markup = project_primitives(primitives, data, opts, color, stroke_width)
+
+    return insert_markup(svg, markup)
@@ -1,4 +1,227 @@
-def explode_assembly(assy, depth=3):
+import numpy as np
+import cadquery as cq
+from OCP.gp import gp_Trsf
+from .instrumentation import count, stage
+from .spatial import AABBTree, _boxes_overlap
+
+
+def get_explode_location(child):
+    """
+    Composes the explode transform of a single assembly child from its metadata.
+
+    Parameters:
+        child - The assembly child to get the explode transform for.
+
+    Returns:
+        The location that the child should be moved by, or None if the child does not explode.
+    """
+
+    explode_loc = None
+
+    # Make sure there is an explode location provided
+    if "explode_loc" in child.metadata:
+        explode_loc = child.metadata["explode_loc"]
+
+    # Also accomodate the "explode_translation" metadata key
+    if "explode_translation" in child.metadata:
+        if explode_loc is None:
+            explode_loc = child.metadata["explode_translation"]
+        else:
+            explode_loc = explode_loc * child.metadata["explode_translation"]
+
+    return explode_loc
+
+
+def _touches(box, other, tolerance):
+    """
+    Tests whether two axis aligned boxes, given as (xmin, ymin, zmin, xmax, ymax, zmax), overlap or touch.
+    """
+
+    return bool(
+        np.all(box[:3] <= other[3:] + tolerance)
+        and np.all(box[3:] >= other[:3] - tolerance)
+    )
+
+
+def compute_explode_locs(assy, clearance=None, contact_tolerance=1e-3, overwrite=False):
+    """
+    Works out explode locations for the children of an assembly from their geometry, for
+    assemblies that are too large to set up by hand, and writes them to the "explode_loc"
+    metadata of each child so that `explode_assembly` and `add_assembly_lines` can use them.
+    Example: `compute_explode_locs(assy); explode_assembly(assy)`
+
+    The child with the largest bounding box stays in place. Every other child is pulled out of
+    the largest child that it touches along the X, Y or Z direction that takes the shortest move,
+    or moves directly away from the base part along the nearest axis when it touches nothing.
+    It moves far enough to clear the bounding boxes of all parts in its path, plus a clearance. Contacts and parts in the path are found with
+    a bounding volume hierarchy, so the cost grows with about n log n rather than n squared.
+
+    Parameters:
+        assy - The assembly whose children should be exploded.
+        clearance - Gap left between a moved child and the parts it clears, defaulting to half the size of the child along its explode axis.
+        contact_tolerance - Distance that bounding boxes may be apart and still count as touching.
+        overwrite - Whether to replace explode locations that the designer already set.
+
+    Returns:
+        A dictionary mapping the names of the children that were given explode locations to those locations.
+    """
+
+    children = list(assy.children)
+    if len(children) < 2:
+        return {}
+
+    # Bounding boxes of the children, in the coordinates of the assembly
+    with stage("views.auto_explode_bounds"):
+        boxes = np.empty((len(children), 6))
+        for i, child in enumerate(children):
+            bb = child.toCompound().BoundingBox()
+            boxes[i] = (bb.xmin, bb.ymin, bb.zmin, bb.xmax, bb.ymax, bb.zmax)
+
+    tree = AABBTree(boxes)
+    centers = (boxes[:, :3] + boxes[:, 3:]) / 2.0
+    sizes = boxes[:, 3:] - boxes[:, :3]
+    volumes = np.prod(np.maximum(sizes, 1e-9), axis=1)
+    base = int(np.argmax(volumes))
+
+    # Each child moves away from the largest part that it touches which is larger than itself
+    anchors = np.full(len(children), -1)
+    with stage("views.auto_explode_contacts"):
+        for i, j in tree.overlapping_pairs(contact_tolerance):
+            small, large = (i, j) if volumes[i] < volumes[j] else (j, i)
+            if anchors[small] == -1 or volumes[large] > volumes[anchors[small]]:
+                anchors[small] = large
+    anchors[anchors == -1] = base
+
+    # The whole assembly is the farthest that any child may need to travel
+    extent = boxes[:, 3:].max(axis=0) - boxes[:, :3].min(axis=0)
+
+    # Pick the axis and the sign of the direction that each child moves in
+    moves = {}
+    for i, child in enumerate(children):
+        if i == base or (not overwrite and get_explode_location(child) is not None):
+            continue
+
+        if anchors[i] != base or _touches(boxes[i], boxes[base], contact_tolerance):
+            # Pull the child out of the part it touches the way that needs the shortest move,
+            # which is along the shank for a fastener in a hole
+            anchor = boxes[anchors[i]]
+            exits = np.concatenate(
+                (anchor[3:] - boxes[i, :3], boxes[i, 3:] - anchor[:3])
+            )
+            direction = int(np.argmin(exits))
+            moves[i] = (direction % 3, 1.0 if direction < 3 else -1.0)
+        else:
+            # Snap the direction away from the base part to the nearest axis
+            away = centers[i] - centers[base]
+            axis = int(np.argmax(np.abs(away))) if np.any(away) else 2
+            moves[i] = (axis, 1.0 if away[axis] >= 0.0 else -1.0)
+
+    def progress(i):
+        axis, sign = moves[i]
+        return sign * centers[i, axis]
+
+    # The move of every child as arrays, where children that stay in place have an axis of -1
+    move_axes = np.full(len(children), -1)
+    move_signs = np.zeros(len(children))
+    for i, (axis, sign) in moves.items():
+        move_axes[i] = axis
+        move_signs[i] = sign
+
+    # Place the inner children first so that the outer ones can clear them where they ended up
+    current = boxes.copy()
+    placed = np.zeros(len(children), dtype=bool)
+    max_shifts = np.zeros(3)
+    explode_locs = {}
+    with stage("views.auto_explode_paths"):
+        for i in sorted(moves, key=progress):
+            axis, sign = moves[i]
+
+            # Sweep the box of the child along its path and clear everything it would pass through
+            swept = current[i].copy()
+            if sign > 0.0:
+                swept[axis + 3] += extent[axis] + max_shifts[axis]
+            else:
+                swept[axis] -= extent[axis] + max_shifts[axis]
+
+            # The index holds the original boxes, so widen the search by the furthest moves so far
+            found = tree.query(swept, max_shifts)
+            found = found[found != i]
+            found = found[_boxes_overlap(current[found], swept, 0.0)]
+
+            # Children further out along the same path will move out of the way themselves
+            same_path = (move_axes[found] == axis) & (move_signs[found] == sign)
+            found = found[placed[found] | ~same_path]
+
+            distance = 0.0
+            if len(found):
+                if sign > 0.0:
+                    distance = max(
+                        0.0, (current[found, axis + 3] - current[i, axis]).max()
+                    )
+                else:
+                    distance = max(
+                        0.0, (current[i, axis + 3] - current[found, axis]).max()
+                    )
+
+            gap = sizes[i, axis] / 2.0 if clearance is None else clearance
+            shift = sign * (distance + gap)
+            current[i, axis] += shift
+            current[i, axis + 3] += shift
+            placed[i] = True
+            max_shifts[axis] = max(max_shifts[axis], abs(shift))
+
+            # explode_assembly applies the location after the child's own, so rotate the translation into the child
+            child = children[i]
+            translation = [0.0, 0.0, 0.0]
+            translation[axis] = shift
+            explode_loc = (
+                child.loc.inverse * cq.Location(tuple(translation)) * child.loc
+            )
+
+            # Copy the metadata since several children may have been given the same dictionary
+            child.metadata = dict(child.metadata, explode_loc=explode_loc)
+            explode_locs[child.name] = explode_loc
+            count("parts_placed")
+
+    return explode_locs
+
+
+def get_explode_plan(assy, depth=3):
+    """
+    Walks an assembly once, at any depth, and collects the explode transforms of its children.
+    The resulting plan can be passed to `explode_assembly` and `unexplode_assembly` so that
+    the assembly tree does not need to be walked again.
+
+    Parameters:
+        assy - The assembly which is to be exploded.
+        depth - The number of sub-assembly levels to explode, or None to explode all of them.
+
+    Returns:
+        A list of (child, explode location) pairs in the order that the children are found.
+    """
+
+    plan = []
+
+    with stage("views.explode_plan"):
+        # Walk the tree depth-first with an explicit stack so that deep trees are not limited by recursion
+        stack = [(child, 1) for child in reversed(assy.children)]
+        while stack:
+            child, level = stack.pop()
+
+            explode_loc = get_explode_location(child)
+            if explode_loc is not None:
+                plan.append((child, explode_loc))
+
+            # Allow the user to choose which depth they want to explode to
+            if depth is None or level < depth:
+                stack.extend(
+                    (sub_child, level + 1) for sub_child in reversed(child.children)
+                )
+
+    return plan
+
+
+def explode_assembly(assy, depth=3, plan=None):
     """
     Explodes an assembly by moving the parts away in predefined directions and distances
     that should be included in each assembly child's metadata.
@@ -7,52 +230,170 @@ def explode_assembly(assy, depth=3):
     technique is to pass a face selector parameter to the constructor for your part so
     that you can be sure the correct face will be tagged, no matter the orientation.
 
-    NOTE: This will not work once a sub-assembly has been added to a main assembly.
-
     Parameters:
         assy - The assembly which is to be exploded.
+        depth - The number of sub-assembly levels to explode, or None to explode all of them.
+        plan - A plan from `get_explode_plan` to reuse instead of walking the assembly again.
 
     Returns:
-        Nothing, modifies the assembly in-place
+        The explode plan that was applied, modifies the assembly in-place
     """
 
-    # Explode the top-level assembly
-    for child in assy.children:
-        # Make sure there is an explode location provided
-        if "explode_loc" in child.metadata:
-            child.loc = child.loc * child.metadata["explode_loc"]
+    if plan is None:
+        plan = get_explode_plan(assy, depth)
 
-        # Also accomodate the "explode_translation" metadata key
-        if "explode_translation" in child.metadata:
-            child.loc = child.loc * child.metadata["explode_translation"]
+    with stage("views.explode_apply"):
+        for child, explode_loc in plan:
+            child.loc = child.loc * explode_loc
+        count("parts_moved", len(plan))
 
-        # Allow the user to choose which depth they want to explode to
-        if depth >= 2:
-            # Handle sub-assemblies in a clumsy way
-            for sub_child in child.children:
-                # Make sure there is an explode location provided
-                if "explode_loc" in sub_child.metadata:
-                    sub_child.loc = sub_child.loc * sub_child.metadata["explode_loc"]
+    return plan
 
-                # Also accomodate the "explode_translation" metadata key
-                if "explode_translation" in sub_child.metadata:
-                    sub_child.loc = (
-                        sub_child.loc * sub_child.metadata["explode_translation"]
-                    )
 
-                # Allow the user to choose which depth they want to explode to
-                if depth >= 3:
-                    for sub_sub_child in sub_child.children:
-                        # Make sure there is an explode location provided
-                        if "explode_loc" in sub_sub_child.metadata:
-                            sub_sub_child.loc = (
-                                sub_sub_child.loc
-                                * sub_sub_child.metadata["explode_loc"]
-                            )
-
-                        # Also accomodate the "explode_translation" metadata key
-                        if "explode_translation" in sub_sub_child.metadata:
-                            sub_sub_child.loc = (
-                                sub_sub_child.loc
-                                * sub_sub_child.metadata["explode_translation"]
-                            )
+def unexplode_assembly(assy, plan=None, depth=3):
+    """
+    Moves the parts of an exploded assembly back to where they were before it was exploded.
+
+    Parameters:
+        assy - The assembly which was exploded.
+        plan - The plan returned by `explode_assembly`, which avoids walking the assembly again.
+        depth - The number of sub-assembly levels that were exploded, used when no plan is given.
+
+    Returns:
+        The explode plan that was reversed, modifies the assembly in-place
+    """
+
+    if plan is None:
+        plan = get_explode_plan(assy, depth)
+
+    with stage("views.unexplode_apply"):
+        for child, explode_loc in plan:
+            child.loc = child.loc * explode_loc.inverse
+        count("parts_moved", len(plan))
+
+    return plan
+
+
+def _location_matrix(loc):
+    """
+    Converts a location into a 4x4 transformation matrix.
+
+    Parameters:
+        loc - The location to convert.
+
+    Returns:
+        A 4x4 NumPy array holding the transformation of the location.
+    """
+
+    trsf = loc.wrapped.Transformation()
+
+    mat = np.identity(4)
+    for row in range(3):
+        for col in range(4):
+            mat[row, col] = trsf.Value(row + 1, col + 1)
+
+    return mat
+
+
+def _matrix_location(mat):
+    """
+    Converts a 4x4 transformation matrix into a location.
+
+    Parameters:
+        mat - The 4x4 transformation matrix to convert.
+
+    Returns:
+        The location holding the transformation of the matrix.
+    """
+
+    trsf = gp_Trsf()
+    trsf.SetValues(*mat[:3, :].ravel().tolist())
+
+    return cq.Location(trsf)
+
+
+def explode_frames(assy, num_frames, depth=3, plan=None, apply=False):
+    """
+    Generates the part placements for an animation of an assembly exploding. The explode
+    metadata is read once, and the placements of all parts for every frame are computed
+    together as arrays of 4x4 matrices, so the geometry of the assembly is never copied.
+    Rotations in the explode locations are interpolated around their axis, and
+    translations are interpolated linearly.
+
+    Parameters:
+        assy - The assembly which is to be animated.
+        num_frames - The number of frames, the first showing the assembly as it is and the last fully exploded.
+        depth - The number of sub-assembly levels to explode, or None to explode all of them.
+        plan - A plan from `get_explode_plan` to reuse instead of walking the assembly again.
+        apply - Whether to move the parts of the assembly to the placements of each frame as it is
+                generated. The original placements are restored once the generator is finished or closed.
+
+    Returns:
+        A generator yielding a list of (child, location) pairs for each frame
+    """
+
+    if plan is None:
+        plan = get_explode_plan(assy, depth)
+
+    children = [child for child, _ in plan]
+    base_locs = [child.loc for child in children]
+
+    # Read the current placements and the explode transforms once
+    base = np.array([_location_matrix(loc) for loc in base_locs]).reshape(-1, 4, 4)
+    explode = np.array([_location_matrix(loc) for _, loc in plan]).reshape(-1, 4, 4)
+
+    # Split the explode rotations into an axis and angle so that they can be interpolated
+    quats = np.array(
+        [
+            (q.X(), q.Y(), q.Z(), q.W())
+            for q in (loc.wrapped.Transformation().GetRotation() for _, loc in plan)
+        ]
+    ).reshape(-1, 4)
+    angles = 2.0 * np.arccos(np.clip(quats[:, 3], -1.0, 1.0))
+    axis_lengths = np.linalg.norm(quats[:, :3], axis=1)
+    axes = np.zeros((len(plan), 3))
+    has_axis = axis_lengths > 1e-12
+    axes[has_axis] = quats[has_axis, :3] / axis_lengths[has_axis, np.newaxis]
+
+    # The cross product matrices of the axes, used by Rodrigues' rotation formula
+    cross = np.zeros((len(plan), 3, 3))
+    cross[:, 0, 1] = -axes[:, 2]
+    cross[:, 0, 2] = axes[:, 1]
+    cross[:, 1, 0] = axes[:, 2]
+    cross[:, 1, 2] = -axes[:, 0]
+    cross[:, 2, 0] = -axes[:, 1]
+    cross[:, 2, 1] = axes[:, 0]
+    cross_sq = cross @ cross
+
+    # Build the interpolated explode transforms for every frame and every part at once
+    fractions = np.linspace(0.0, 1.0, num_frames)
+    frame_angles = fractions[:, np.newaxis] * angles[np.newaxis, :]
+    steps = np.tile(np.identity(4), (num_frames, len(plan), 1, 1))
+    steps[:, :, :3, :3] += (
+        np.sin(frame_angles)[..., np.newaxis, np.newaxis] * cross
+        + (1.0 - np.cos(frame_angles))[..., np.newaxis, np.newaxis] * cross_sq
+    )
+    steps[:, :, :3, 3] = fractions[:, np.newaxis, np.newaxis] * explode[:, :3, 3]
+
+    # Compose the interpolated transforms with the current placements
+    frames = base[np.newaxis] @ steps
+    count("frames_computed", num_frames)
+
+    try:
+        for frame in frames:
+            with stage("views.frame_locations"):
+                placements = [
+                    (child, _matrix_location(mat))
+                    for child, mat in zip(children, frame)
+                ]
+
+            if apply:
+                for child, loc in placements:
+                    child.loc = loc
+
+            yield placements
+    finally:
+        # Put the parts back where they were
+        if apply:
+            for child, loc in zip(children, base_locs):
+                child.loc = loc
@@ -30,7 +30,6 @@ assy.add(
 
 # Explode the assembly, which will modify the existing assembly
 # in-place
-# Note that this will not work once a sub-assembly has been added to a main assembly
 explode_assembly(assy)
 
 # This only exists so that users running the example in CQ-editor
@@ -0,0 +1,201 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import pytest
+import cadquery as cq
+from cq_annotate.aio import (
+    AnnotationRunner,
+    add_assembly_arrows_async,
+    add_circular_dimensions_async,
+)
+from cq_annotate.callouts import add_assembly_arrows
+from cq_annotate.instrumentation import collect
+
+
+def _arrow_assembly():
+    """
+    Builds an assembly of two boxes with faces tagged for arrows.
+    """
+
+    box1 = cq.Workplane().workplane(offset=20.0).box(10, 10, 10)
+    box1.faces(">Z").tag("arrow")
+    box2 = cq.Workplane().box(10, 10, 10)
+    box2.faces("<Z").tag("arrow")
+
+    assy = cq.Assembly()
+    assy.add(box1, name="box1")
+    assy.add(box2, name="box2")
+
+    return assy
+
+
+def test_add_assembly_arrows_async():
+    """
+    Make sure that the async variant annotates assemblies like the blocking function.
+    """
+
+    runner = AnnotationRunner(max_concurrency=2)
+
+    async def annotate():
+        return await asyncio.gather(
+            *[
+                add_assembly_arrows_async(_arrow_assembly(), 0.5, runner=runner)
+                for _ in range(3)
+            ]
+        )
+
+    try:
+        results = asyncio.run(annotate())
+
+        # Nothing reaches OCCT on a thread unless a thread pool is asked for
+        assert isinstance(runner.executor, ProcessPoolExecutor)
+    finally:
+        runner.close()
+
+    expected = add_assembly_arrows(_arrow_assembly(), 0.5)
+    for assy in results:
+        assert len(assy.children) == 2
+        assert len(assy.objects) == len(expected.objects)
+
+
+def test_collect_async_calls():
+    """
+    Make sure that a collect() block around an awaited call records the work done on a thread pool.
+    """
+
+    runner = AnnotationRunner(ThreadPoolExecutor(max_workers=2), max_concurrency=2)
+
+    async def annotate():
+        with collect() as stats:
+            await add_assembly_arrows_async(_arrow_assembly(), 0.5, runner=runner)
+        return stats
+
+    try:
+        stats = asyncio.run(annotate())
+    finally:
+        runner.executor.shutdown()
+
+    assert stats.to_dict()["counters"]["aio.calls"] == 1
+    assert "callouts.rotation" in stats.to_dict()["stages"]
+
+
+def test_add_circular_dimensions_async_process_pool():
+    """
+    Make sure that models can be annotated in worker processes.
+    """
+
+    bd = cq.Workplane("YZ").circle(10.0).circle(5.0).extrude(50.0)
+    bd.edges("%CIRCLE").edges(cq.selectors.RadiusNthSelector(1)).edges(">X").tag(
+        "radius_1"
+    )
+
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        runner = AnnotationRunner(executor, max_concurrency=1)
+        assy = asyncio.run(add_circular_dimensions_async(bd, 0.1, runner=runner))
+
+    # The object, the arrow and the label, with usable shapes after the trip between processes
+    assert len(assy.children) == 3
+    assert assy.toCompound().isValid()
+
+
+def test_add_circular_dimensions_async_options():
+    """
+    Make sure that the grouping and search options reach add_circular_dimensions.
+    """
+
+    plate = cq.Workplane("XY").box(100.0, 100.0, 10.0)
+    plate = plate.faces(">Z").workplane().rarray(20.0, 20.0, 3, 2).hole(5.0)
+
+    runner = AnnotationRunner(max_concurrency=1)
+    try:
+        assy = asyncio.run(
+            add_circular_dimensions_async(
+                plate, 0.1, group_patterns=True, auto=True, runner=runner
+            )
+        )
+    finally:
+        runner.close()
+
+    # The object, and one leader and label for the whole pattern
+    assert len(assy.children) == 3
+
+
+def test_runner_limits_concurrency():
+    """
+    Make sure that no more calls run at once than allowed and that the event loop keeps running.
+    """
+
+    executor = ThreadPoolExecutor(max_workers=2)
+    runner = AnnotationRunner(executor, max_concurrency=2)
+    lock = threading.Lock()
+    active = [0]
+    peak = [0]
+
+    def work():
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+
+    async def main():
+        ticks = 0
+        calls = asyncio.gather(*[runner.run(work) for _ in range(6)])
+        while not calls.done():
+            ticks += 1
+            await asyncio.sleep(0.01)
+        await calls
+        return ticks
+
+    try:
+        ticks = asyncio.run(main())
+    finally:
+        executor.shutdown()
+
+    assert peak[0] == 2
+    assert ticks > 5
+
+
+def test_runner_backpressure_and_cancel():
+    """
+    Make sure that calls over the pending limit are refused and that queued calls can be cancelled.
+    """
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    runner = AnnotationRunner(executor, max_concurrency=1, max_pending=2, block=False)
+    started = []
+    release = threading.Event()
+
+    def work(name):
+        started.append(name)
+        release.wait(5.0)
+        return name
+
+    async def main():
+        first = asyncio.ensure_future(runner.run(work, "first"))
+        queued = asyncio.ensure_future(runner.run(work, "queued"))
+        await asyncio.sleep(0.05)
+
+        # One call is running and one is waiting, so there is no room for a third
+        with pytest.raises(asyncio.QueueFull):
+            await runner.run(work, "refused")
+
+        # Cancelling the waiting call means it never runs
+        queued.cancel()
+        await asyncio.sleep(0.01)
+        release.set()
+
+        result = await first
+        later = await runner.run(work, "later")
+        return result, later, queued.cancelled()
+
+    try:
+        result, later, cancelled = asyncio.run(main())
+    finally:
+        executor.shutdown()
+
+    assert (result, later) == ("first", "later")
+    assert cancelled
+    assert started == ["first", "later"]
@@ -1,7 +1,19 @@
 import pytest
 import cadquery as cq
-from cq_annotate.callouts import add_assembly_arrows, add_assembly_lines
-from cq_annotate.views import explode_assembly
+from cq_annotate.callouts import (
+    add_assembly_arrows,
+    add_assembly_lines,
+    annotate_assemblies,
+    get_assembly_line_specs,
+    remove_annotation_layer,
+)
+from cq_annotate.views import (
+    compute_explode_locs,
+    explode_assembly,
+    explode_frames,
+    get_explode_plan,
+    unexplode_assembly,
+)
 
 
 def test_add_assembly_arrows():
@@ -36,6 +48,84 @@ def test_add_assembly_arrows():
     assert len(assy.children) == 2
 
 
+def test_assembly_arrows_share_geometry():
+    """
+    Make sure that arrows of the same size reuse the same solid instead of rebuilding it.
+    """
+
+    box1 = cq.Workplane().workplane(offset=20.0).box(10, 10, 10)
+    box1.faces(">Z").tag("arrow")
+    box2 = cq.Workplane().box(10, 10, 10)
+    box2.faces("<Z").tag("arrow")
+
+    assy = cq.Assembly()
+    assy.add(box1, name="box1")
+    assy.add(box2, name="box2")
+    assy = add_assembly_arrows(assy, arrow_scale_factor=0.5)
+
+    # Both arrows should be located instances of one shared solid
+    arrow1 = assy.children[0].children[1]
+    arrow2 = assy.children[1].children[1]
+    assert arrow1.obj is arrow2.obj
+    assert arrow1.loc.toTuple() != arrow2.loc.toTuple()
+
+
+def test_assembly_arrows_any_normal():
+    """
+    Make sure that arrows point at faces that face in any direction, not only along Y and Z.
+    """
+
+    box = cq.Workplane().box(10, 10, 10)
+    box.faces("<X").tag("arrow")
+
+    assy = cq.Assembly()
+    assy.add(box, name="box")
+    assy = add_assembly_arrows(assy, arrow_scale_factor=0.5, annotation_layer=True)
+
+    # The arrow runs along X from the face out to its 10 long tail
+    arrow = assy.objects["annotations"].toCompound().BoundingBox()
+    assert arrow.xmin == pytest.approx(-15.0)
+    assert arrow.xmax == pytest.approx(-5.0)
+    assert arrow.center.y == pytest.approx(0.0, abs=1e-6)
+    assert arrow.center.z == pytest.approx(0.0, abs=1e-6)
+
+
+def test_annotation_layer():
+    """
+    Make sure that the annotation layer holds the arrows and lines without changing the parts.
+    """
+
+    box1 = cq.Workplane().workplane(offset=20.0).box(10, 10, 10)
+    box1.faces(">Z").tag("arrow")
+    box2 = cq.Workplane().box(10, 10, 10)
+    box2.faces("<Z").tag("arrow")
+    box2.faces("<Z").tag("assembly_line")
+
+    assy = cq.Assembly()
+    assy.add(box1, name="box1")
+    assy.add(
+        box2, name="box2", metadata={"explode_loc": cq.Location((0.0, 0.0, -10.0))}
+    )
+    parts = list(assy.children)
+
+    add_assembly_arrows(assy, arrow_scale_factor=0.5, annotation_layer=True)
+    add_assembly_lines(assy, annotation_layer=True)
+
+    # The parts are left alone and the annotations are in one extra subassembly
+    assert assy.children[:2] == parts
+    assert len(assy.children) == 3
+    assert len(assy.annotations.children) == 3
+
+    # Regenerating the annotations replaces them instead of adding more
+    add_assembly_arrows(assy, arrow_scale_factor=0.5, annotation_layer=True)
+    assert len(assy.annotations.children) == 3
+
+    # Stripping the layer leaves only the parts
+    remove_annotation_layer(assy)
+    assert assy.children == parts
+    assert "annotations/arrow_box1" not in assy.objects
+
+
 def test_add_assembly_lines():
     """
     Make sure that assembly lines are added correctly to the assembly.
@@ -92,6 +182,41 @@ def test_add_assembly_lines():
     assert len(assy.children) == 2
 
 
+def test_add_assembly_lines_nested():
+    """
+    Make sure that a part inside an exploded sub-assembly gets its line length from the sub-assembly,
+    and that a part without any explode settings is skipped.
+    """
+
+    screw = cq.Workplane().circle(1.0).extrude(6.0)
+    screw.faces("<Z").tag("assembly_line")
+
+    sub_assy = cq.Assembly()
+    sub_assy.add(screw, name="screw")
+
+    assy = cq.Assembly()
+    assy.add(cq.Workplane().box(10, 10, 10), name="box")
+    assy.add(
+        sub_assy,
+        name="fasteners",
+        metadata={"explode_loc": cq.Location((0.0, 0.0, -12.0))},
+    )
+    loose = cq.Workplane().circle(1.0).extrude(6.0)
+    loose.faces("<Z").tag("assembly_line")
+    assy.add(loose, name="loose", loc=cq.Location((20.0, 0.0, 0.0)))
+
+    specs = get_assembly_line_specs(assy)
+    assert [spec.name for spec in specs] == ["assembly_line_fasteners_screw"]
+    assert specs[0].length == pytest.approx(12.0)
+
+    add_assembly_lines(assy)
+
+    # The sub-assembly is paired with its line and the loose part is left alone
+    assert len(assy.children) == 3
+    assert assy.children[2].name == "loose"
+    assert assy.children[2].obj is loose
+
+
 def test_add_assembly_lines_non_z():
     """
     Make sure that assembly lines are added correctly to the assembly when other axis selectors
@@ -156,6 +281,76 @@ def test_add_assembly_lines_non_z():
     assert len(assy.children) == 3
 
 
+def _line_assembly(parts):
+    """
+    Builds an assembly of boxes with their bottom faces tagged for arrows and assembly lines.
+    """
+
+    box = cq.Workplane().box(10, 10, 10)
+    box.faces("<Z").tag("arrow")
+    box.faces("<Z").tag("assembly_line")
+
+    assy = cq.Assembly()
+    for i in range(parts):
+        assy.add(
+            box,
+            name="box%d" % i,
+            loc=cq.Location((i * 20.0, 0.0, 0.0)),
+            metadata={"explode_loc": cq.Location((0.0, 0.0, -5.0 - i))},
+        )
+
+    return assy
+
+
+def test_add_assembly_lines_parallel():
+    """
+    Make sure that lines built by a pool of processes match the lines built in this process.
+    """
+
+    serial = add_assembly_lines(_line_assembly(3))
+    parallel = add_assembly_lines(_line_assembly(3), max_workers=2)
+
+    for serial_child, parallel_child in zip(serial.children, parallel.children):
+        serial_bb = serial_child.toCompound().BoundingBox()
+        parallel_bb = parallel_child.toCompound().BoundingBox()
+        assert parallel_bb.zmin == pytest.approx(serial_bb.zmin)
+        assert parallel_bb.xmax == pytest.approx(serial_bb.xmax)
+        assert [child.name for child in parallel_child.children] == [
+            child.name for child in serial_child.children
+        ]
+
+
+def test_annotate_assemblies():
+    """
+    Make sure that a batch of assemblies is annotated and returned in order.
+    """
+
+    assemblies = [_line_assembly(parts) for parts in (1, 2, 3)]
+
+    results = annotate_assemblies(assemblies, annotation_layer=True, max_workers=2)
+
+    # Each assembly gets one arrow and one line per part
+    assert [len(assy.annotations.children) for assy in results] == [2, 4, 6]
+
+
+def test_low_detail_annotations():
+    """
+    Make sure that low detail annotations are built from flat faces only.
+    """
+
+    assy = add_assembly_lines(_line_assembly(2), segments=8)
+    add_assembly_arrows(assy, arrow_scale_factor=0.5, segments=8)
+
+    faces = assy.toCompound().Faces()
+    box_faces = 2 * 6
+    assert len(faces) > box_faces
+    assert {face.geomType() for face in faces} == {"PLANE"}
+
+    # Few annotations are kept at full detail when the detail is picked automatically
+    assy = add_assembly_lines(_line_assembly(2), segments="auto")
+    assert "CYLINDER" in {face.geomType() for face in assy.toCompound().Faces()}
+
+
 def test_explode_assembly():
     """
     Make sure that the explode_assembly function works correctly.
@@ -194,3 +389,110 @@ def test_explode_assembly():
     # Make sure that the assembly children are now at the correct positions
     assert assy.children[0].loc.toTuple()[0][2] == 15.0
     assert assy.children[1].loc.toTuple()[0][2] == -15.0
+
+
+def test_explode_deep_assembly():
+    """
+    Make sure that sub-assemblies of any depth can be exploded and put back together.
+    """
+
+    box = cq.Workplane().box(10, 10, 10)
+
+    # Nest boxes six levels deep, with each level exploding 10 units further up
+    assy = cq.Assembly()
+    parent = assy
+    for level in range(6):
+        sub_assy = cq.Assembly(
+            box,
+            name="level_" + str(level),
+            metadata={"explode_loc": cq.Location((0, 0, 10))},
+        )
+        parent.add(sub_assy)
+        parent = parent.children[-1]
+
+    # The default depth matches the previous three level behavior
+    assert len(get_explode_plan(assy)) == 3
+
+    # Explode every level and make sure that the deepest part moved by all of them
+    plan = explode_assembly(assy, depth=None)
+    assert len(plan) == 6
+    deepest = assy.toCompound().BoundingBox()
+    assert deepest.zmax == pytest.approx(65.0)
+
+    # Putting the assembly back together reuses the plan
+    unexplode_assembly(assy, plan)
+    assert assy.toCompound().BoundingBox().zmax == pytest.approx(5.0)
+
+
+def test_compute_explode_locs():
+    """
+    Make sure that explode locations are worked out from the geometry of the parts.
+    """
+
+    plate = cq.Workplane().box(100, 100, 5)
+    screw = cq.Workplane().circle(2).extrude(10).faces(">Z").circle(4).extrude(2)
+
+    assy = cq.Assembly()
+    assy.add(plate, name="plate")
+    for i in range(4):
+        assy.add(screw, name="screw%d" % i, loc=cq.Location((i * 20 - 30, 0, -5)))
+    assy.add(
+        screw,
+        name="preset",
+        loc=cq.Location((40, 40, -5)),
+        metadata={"explode_loc": cq.Location((0, 0, 50))},
+    )
+
+    explode_locs = compute_explode_locs(assy)
+
+    # The base part and the preset part are left alone
+    assert sorted(explode_locs) == ["screw0", "screw1", "screw2", "screw3"]
+    assert assy.preset.metadata["explode_loc"].toTuple()[0][2] == 50
+
+    # The screws are pulled out of the plate along their shanks until they clear it
+    explode_assembly(assy)
+    plate_top = assy.plate.toCompound().BoundingBox().zmax
+    for i in range(4):
+        bb = assy.children[i + 1].toCompound().BoundingBox()
+        assert bb.zmin > plate_top
+        assert bb.xmin == pytest.approx(i * 20 - 34)
+
+
+def test_explode_frames():
+    """
+    Make sure that the animation frames go from the assembled to the exploded placements.
+    """
+
+    box = cq.Workplane().box(10, 10, 10)
+
+    assy = cq.Assembly()
+    assy.add(
+        box,
+        name="box1",
+        loc=cq.Location((0, 0, 5)),
+        metadata={"explode_loc": cq.Location((0, 0, 10), (1, 0, 0), 90)},
+    )
+    assy.add(
+        box,
+        name="box2",
+        loc=cq.Location((0, 0, -5)),
+        metadata={"explode_loc": cq.Location((0, 0, -10))},
+    )
+
+    frames = list(explode_frames(assy, 11, apply=True))
+    assert len(frames) == 11
+
+    # The first frame is the assembled state and the middle frame is half way
+    assert frames[0][1][1].toTuple()[0][2] == pytest.approx(-5.0)
+    assert frames[5][1][1].toTuple()[0][2] == pytest.approx(-10.0)
+    assert frames[5][0][1].toTuple()[1][0] == pytest.approx(45.0)
+
+    # The parts were put back once the animation finished
+    assert assy.children[0].loc.toTuple()[0][2] == pytest.approx(5.0)
+
+    # The last frame matches the exploded assembly
+    last = [loc.toTuple() for _, loc in frames[-1]]
+    explode_assembly(assy)
+    for child, (pos, rot) in zip(assy.children, last):
+        assert child.loc.toTuple()[0] == pytest.approx(pos)
+        assert child.loc.toTuple()[1] == pytest.approx(rot)
@@ -0,0 +1,105 @@
+import pytest
+import cadquery as cq
+from cq_annotate.callouts import add_assembly_arrows, add_assembly_lines
+from cq_annotate.views import explode_assembly
+
+
+def _world_boxes(assy):
+    """
+    Gets the bounding box of every node of an assembly that holds an object, placed where the assembly puts it.
+    """
+
+    boxes = {}
+    stack = [(assy, cq.Location())]
+    while stack:
+        node, loc = stack.pop()
+        loc = loc * node.loc
+        if node.obj is not None:
+            shape = node.obj if isinstance(node.obj, cq.Shape) else node.obj.val()
+            boxes[node.name] = shape.moved(loc).BoundingBox()
+        stack.extend((child, loc) for child in node.children)
+
+    return boxes
+
+
+def _exploded_box(selector, tag="arrow"):
+    """
+    Builds an assembly of a box that explodes upwards, with one of its faces tagged for an annotation.
+    """
+
+    box = cq.Workplane().box(10, 10, 10)
+    box.faces(selector).tag(tag)
+
+    assy = cq.Assembly()
+    assy.add(box, name="box", metadata={"explode_loc": cq.Location((0, 0, 30))})
+
+    return assy
+
+
+@pytest.mark.parametrize("annotation_layer", [False, True])
+def test_arrows_explode_with_part(annotation_layer):
+    """
+    Make sure that arrows on faces that do not point along Z move the same way as their part when exploded.
+    """
+
+    # The arrow of each face sits 5 past the face once the part has moved up by 30
+    expected = {
+        ">Y": (0.0, 10.0, 30.0),
+        "<X": (-10.0, 0.0, 30.0),
+        ">Z": (0.0, 0.0, 40.0),
+    }
+    for selector, center in expected.items():
+        assy = _exploded_box(selector)
+        add_assembly_arrows(assy, 0.5, annotation_layer=annotation_layer)
+        explode_assembly(assy)
+
+        boxes = _world_boxes(assy)
+        arrow = next(bb for name, bb in boxes.items() if name.startswith("arrow"))
+        assert boxes["box"].center.toTuple() == pytest.approx((0.0, 0.0, 30.0))
+        assert arrow.center.toTuple() == pytest.approx(center, abs=1e-6)
+
+
+@pytest.mark.parametrize("annotation_layer", [False, True])
+def test_lines_explode_with_part(annotation_layer):
+    """
+    Make sure that an assembly line on a bottom face moves the same way as its part when exploded.
+    """
+
+    assy = _exploded_box("<Z", tag="assembly_line")
+    add_assembly_lines(assy, annotation_layer=annotation_layer)
+    explode_assembly(assy)
+
+    # The line runs from where the bottom face started up to where it ended up
+    boxes = _world_boxes(assy)
+    line = next(bb for name, bb in boxes.items() if name.startswith("assembly_line"))
+    assert (boxes["box"].zmin, boxes["box"].zmax) == pytest.approx((25.0, 35.0))
+    assert (line.zmin, line.zmax) == pytest.approx((0.0, 30.0), abs=1e-6)
+
+
+@pytest.mark.parametrize("annotation_layer", [False, True])
+def test_explode_after_annotate_nested(annotation_layer):
+    """
+    Make sure that annotations made before exploding follow parts that are moved by their own
+    explode location and by that of a turned sub-assembly.
+    """
+
+    box = cq.Workplane().box(10, 10, 10)
+    box.faces(">Y").tag("arrow")
+
+    sub_assy = cq.Assembly(
+        name="sub",
+        loc=cq.Location((0, 0, 0), (0, 0, 1), 90),
+        metadata={"explode_loc": cq.Location((20, 0, 0))},
+    )
+    sub_assy.add(box, name="box", metadata={"explode_loc": cq.Location((0, 0, 30))})
+    assy = cq.Assembly()
+    assy.add(sub_assy)
+
+    add_assembly_arrows(assy, 0.5, annotation_layer=annotation_layer)
+    explode_assembly(assy)
+
+    # The sub-assembly moves along its own turned X axis, and the arrow stays 5 past the face
+    boxes = _world_boxes(assy)
+    arrow = next(bb for name, bb in boxes.items() if name.startswith("arrow"))
+    assert boxes["box"].center.toTuple() == pytest.approx((0.0, 20.0, 30.0))
+    assert arrow.center.toTuple() == pytest.approx((-10.0, 20.0, 30.0), abs=1e-6)
@@ -0,0 +1,168 @@
+import pytest
+import cadquery as cq
+from cq_annotate.callouts import (
+    ANNOTATION_LAYER_NAME,
+    add_assembly_arrows,
+    add_assembly_lines,
+)
+from cq_annotate.deferred import DeferredAnnotations
+from cq_annotate.dimensioning import add_circular_dimensions
+from cq_annotate.instrumentation import collect
+from cq_annotate.specs import AnnotationSpec
+
+
+def _tagged_assembly():
+    """
+    Builds an assembly of two boxes with faces tagged for arrows and assembly lines, with
+    faces that point along Z and along Y.
+    """
+
+    box1 = cq.Workplane().workplane(offset=20.0).box(10, 10, 10)
+    box1.faces(">Z").tag("arrow")
+    box1.faces("<Z").tag("assembly_line")
+    box2 = cq.Workplane().box(10, 10, 10)
+    box2.faces("<Y").tag("arrow")
+
+    assy = cq.Assembly()
+    assy.add(
+        box1,
+        name="box1",
+        loc=cq.Location((5, 0, 0)),
+        metadata={"explode_loc": cq.Location((0, 0, 30))},
+    )
+    assy.add(box2, name="box2")
+
+    return assy
+
+
+def test_deferred_matches_built_annotations():
+    """
+    Make sure that deferred annotations build the same solids in the same places as the direct functions.
+    """
+
+    # Nothing is built until the geometry is asked for
+    with collect() as stats:
+        deferred = DeferredAnnotations.from_assembly(
+            _tagged_assembly(), arrow_scale_factor=0.5, line_diameter=0.5
+        )
+    assert [spec.kind for spec in deferred] == ["arrow", "arrow", "line"]
+    assert "shapes_built" not in stats.counters
+
+    built = _tagged_assembly()
+    add_assembly_arrows(built, arrow_scale_factor=0.5, annotation_layer=True)
+    add_assembly_lines(built, line_diameter=0.5, annotation_layer=True)
+    expected = built.objects[ANNOTATION_LAYER_NAME].toCompound().BoundingBox()
+
+    actual = deferred.toCompound().BoundingBox()
+    for name in ("xmin", "ymin", "zmin", "xmax", "ymax", "zmax"):
+        assert getattr(actual, name) == pytest.approx(getattr(expected, name), abs=1e-6)
+
+    # The annotations can also be added to the annotation layer of the assembly
+    assy = deferred.add_to(_tagged_assembly())
+    assert len(assy.objects[ANNOTATION_LAYER_NAME].children) == 3
+
+
+def test_deferred_json_round_trip():
+    """
+    Make sure that specs survive being written to JSON and read back.
+    """
+
+    deferred = DeferredAnnotations.from_assembly(_tagged_assembly())
+    loaded = DeferredAnnotations.from_json(deferred.to_json())
+
+    assert loaded.specs == deferred.specs
+    assert isinstance(loaded.specs[0], AnnotationSpec)
+
+    # Only the kept annotations are built
+    arrows = loaded.filter(lambda spec: spec.kind == "arrow")
+    assert len(arrows.to_assembly().children) == 2
+
+
+def test_deferred_dimensions():
+    """
+    Make sure that dimension labels are built facing the way of their workplane.
+    """
+
+    bd = cq.Workplane("YZ").circle(10.0).circle(5.0).extrude(50.0)
+    bd.edges("%CIRCLE").edges(cq.selectors.RadiusNthSelector(1)).edges(">X").tag(
+        "radius_1"
+    )
+
+    # The leaders and labels are placed without building them, and can be saved as they are
+    with collect() as stats:
+        deferred = DeferredAnnotations.from_dimensions(bd, arrow_scale_factor=0.1)
+        deferred.to_json()
+    assert [spec.kind for spec in deferred] == ["leader", "label"]
+    assert "shapes_built" not in stats.counters
+    assert not any("_cache." in name for name in stats.counters)
+    assert deferred.specs[1].label == "R 10.0"
+
+    # The text lies in the YZ plane, extruded along X
+    label = deferred.to_assembly().children[1].toCompound().BoundingBox()
+    assert label.xlen == pytest.approx(1.0, abs=1e-3)
+    assert label.ylen > label.zlen
+
+
+def test_deferred_dimensions_match_eager():
+    """
+    Make sure that deferred dimensions are built with the same leaders and label slots as add_circular_dimensions.
+    """
+
+    plate = cq.Workplane().box(40, 40, 5).faces(">Z").workplane().hole(10)
+    plate.faces(">Z").edges("%CIRCLE").tag("radius")
+
+    # Labels that would land on top of each other are moved apart in the same way
+    plate2 = cq.Workplane().box(60, 60, 5)
+    plate2 = plate2.faces(">Z").workplane().pushPoints([(0, 0), (6, 0)]).hole(2)
+    edges = plate2.faces(">Z").edges("%CIRCLE")
+    for i, edge in enumerate(edges.vals()):
+        edges.newObject([edge]).tag("radius_%d" % i)
+
+    for obj in (plate, plate2):
+        eager = add_circular_dimensions(obj, arrow_scale_factor=0.5)
+        deferred = DeferredAnnotations.from_dimensions(obj, arrow_scale_factor=0.5)
+        built = deferred.to_assembly()
+
+        assert len(built.children) == len(eager.children) - 1
+        for node, eager_node in zip(built.children, eager.children[1:]):
+            assert node.obj is eager_node.obj
+            bb = node.toCompound().BoundingBox()
+            eager_bb = eager_node.toCompound().BoundingBox()
+            assert (
+                bb.xmin,
+                bb.ymin,
+                bb.zmin,
+                bb.xmax,
+                bb.ymax,
+                bb.zmax,
+            ) == pytest.approx(
+                (
+                    eager_bb.xmin,
+                    eager_bb.ymin,
+                    eager_bb.zmin,
+                    eager_bb.xmax,
+                    eager_bb.ymax,
+                    eager_bb.zmax,
+                )
+            )
+
+    # The label sits beside the bent leader instead of over it
+    built = DeferredAnnotations.from_dimensions(plate, arrow_scale_factor=0.5)
+    leader, label = [
+        node.toCompound().BoundingBox() for node in built.to_assembly().children
+    ]
+    assert label.xmin > leader.xmax
+
+
+def test_deferred_grouped_dimensions():
+    """
+    Make sure that hole patterns are grouped and untagged circles are found for deferred dimensions.
+    """
+
+    plate = cq.Workplane("XY").box(100.0, 100.0, 10.0)
+    plate = plate.faces(">Z").workplane().rarray(20.0, 20.0, 3, 2).hole(5.0)
+
+    deferred = DeferredAnnotations.from_dimensions(
+        plate, arrow_scale_factor=0.1, group_patterns=True, auto=True
+    )
+    assert [spec.label for spec in deferred if spec.kind == "label"] == ["6× R 2.5"]
@@ -1,6 +1,34 @@
 import pytest
 import cadquery as cq
-from cq_annotate.dimensioning import add_circular_dimensions
+from cq_annotate.dimensioning import (
+    add_circular_dimensions,
+    find_circular_edges,
+    get_circular_dimension_specs,
+)
+
+
+def _yz_rect(bb):
+    """
+    Gets the rectangle that a bounding box covers in the YZ plane.
+    """
+
+    return (bb.ymin, bb.zmin, bb.ymax, bb.zmax)
+
+
+def _xy_rect(bb):
+    """
+    Gets the rectangle that a bounding box covers in the XY plane.
+    """
+
+    return (bb.xmin, bb.ymin, bb.xmax, bb.ymax)
+
+
+def _rects_overlap(a, b):
+    """
+    Checks whether two (umin, vmin, umax, vmax) rectangles overlap.
+    """
+
+    return a[0] < b[2] and a[1] < b[3] and a[2] > b[0] and a[3] > b[1]
 
 
 def test_add_radius_dimension():
@@ -27,3 +55,146 @@ def test_add_radius_dimension():
     assy2 = add_circular_dimensions(bd2, arrow_scale_factor=0.1)
 
     assert len(assy2.children) == 3
+
+
+def test_add_multiple_radius_dimensions():
+    """
+    Tests adding callouts for several radius dimensions to the same object.
+    """
+
+    bd = cq.Workplane("YZ").circle(10.0).circle(5.0).extrude(50.0)
+    bd.edges("%CIRCLE").edges(cq.selectors.RadiusNthSelector(1)).edges(">X").tag(
+        "radius_1"
+    )
+    bd.edges("%CIRCLE").edges(cq.selectors.RadiusNthSelector(0)).edges("<X").tag(
+        "radius_0"
+    )
+
+    assy = add_circular_dimensions(bd, arrow_scale_factor=0.1)
+
+    # 1 object + 2 arrows + 2 labels
+    assert len(assy.children) == 5
+
+    # The labels are placed apart from each other in the YZ view plane
+    label_1 = assy.children[2].toCompound().BoundingBox()
+    label_2 = assy.children[4].toCompound().BoundingBox()
+    assert not _rects_overlap(_yz_rect(label_1), _yz_rect(label_2))
+
+
+def test_radius_labels_share_geometry():
+    """
+    Tests that dimension labels with the same text reuse the same text solid.
+    """
+
+    plate = cq.Workplane("XY").box(100.0, 100.0, 10.0)
+    plate = plate.faces(">Z").workplane().pushPoints([(-20, 0), (20, 0)]).hole(10.0)
+    plate.faces(">Z").edges("%CIRCLE").edges(">X").tag("radius_a")
+    plate.faces(">Z").edges("%CIRCLE").edges("<X").tag("radius_b")
+
+    assy = add_circular_dimensions(plate, arrow_scale_factor=0.1)
+
+    # 1 object + 2 arrows + 2 labels, where both labels read "R 5.0"
+    assert len(assy.children) == 5
+    assert assy.children[2].obj is assy.children[4].obj
+
+    # The leaders share one solid, which is placed at the edge of each hole
+    assert assy.children[1].obj is assy.children[3].obj
+    leader_xmins = sorted(
+        assy.children[i].toCompound().BoundingBox().xmin for i in (1, 3)
+    )
+    assert -20.0 < leader_xmins[0] < -10.0
+    assert 20.0 < leader_xmins[1] < 30.0
+
+
+def test_radius_labels_do_not_collide():
+    """
+    Tests that the labels of many dimensions are placed where they do not overlap each other or the leaders.
+    """
+
+    points = [(x, y) for x in range(-40, 41, 20) for y in range(-40, 41, 20)]
+    plate = cq.Workplane("XY").box(120.0, 120.0, 10.0)
+    plate = plate.faces(">Z").workplane().pushPoints(points).hole(6.0)
+    edges = plate.faces(">Z").edges("%CIRCLE")
+    for i, edge in enumerate(edges.vals()):
+        edges.newObject([edge]).tag("radius_%d" % i)
+
+    assy = add_circular_dimensions(plate, arrow_scale_factor=0.1)
+
+    # 1 object + an arrow and a label for each of the 25 holes
+    assert len(assy.children) == 51
+
+    arrows = [_xy_rect(c.toCompound().BoundingBox()) for c in assy.children[1::2]]
+    labels = [_xy_rect(c.toCompound().BoundingBox()) for c in assy.children[2::2]]
+    for i, label in enumerate(labels):
+        assert not any(_rects_overlap(label, other) for other in labels[i + 1 :])
+        assert not any(_rects_overlap(label, arrow) for arrow in arrows)
+
+
+def test_group_hole_patterns():
+    """
+    Tests that the holes of a pattern get one dimension with the number of holes in the label.
+    """
+
+    plate = cq.Workplane("XY").box(100.0, 100.0, 10.0)
+    plate = plate.faces(">Z").workplane().rarray(20.0, 20.0, 3, 2).hole(5.0)
+    plate = plate.faces(">Z").workplane().pushPoints([(0, 35)]).hole(8.0)
+    edges = plate.faces(">Z").edges("%CIRCLE")
+    for i, edge in enumerate(edges.vals()):
+        edges.newObject([edge]).tag("radius_%d" % i)
+
+    # Without grouping every hole gets a dimension
+    assy = add_circular_dimensions(plate, arrow_scale_factor=0.1)
+    assert len(assy.children) == 15
+
+    # The six small holes share one dimension
+    specs = get_circular_dimension_specs(plate, 0.1, group_patterns=True)
+    assert sorted(spec.label for spec in specs if spec.kind == "label") == [
+        "6× R 2.5",
+        "R 4.0",
+    ]
+
+    # 1 object + an arrow and a label for the pattern + an arrow and a label for the larger hole
+    grouped = add_circular_dimensions(
+        plate, arrow_scale_factor=0.1, group_patterns=True
+    )
+    assert len(grouped.children) == 5
+
+
+def test_find_circular_edges():
+    """
+    Tests finding the circles of an untagged object, in any orientation and without duplicates.
+    """
+
+    plate = cq.Workplane("XY").box(100.0, 100.0, 10.0)
+    plate = plate.faces(">Z").workplane().rarray(20.0, 20.0, 3, 2).hole(5.0)
+    plate = plate.edges("|Z").fillet(2.0)
+    plate = plate.faces("<Y").workplane(centerOption="CenterOfBoundBox").hole(4.0, 20.0)
+
+    # The fillet arcs are left out and each through hole is only found once, at its top
+    candidates = find_circular_edges(plate)
+    assert len(candidates.edges) == 7
+    assert sorted(candidates.radii.tolist()) == [2.0] + [2.5] * 6
+    top = candidates.radii == 2.5
+    assert candidates.centers[top, 2].tolist() == [5.0] * 6
+    assert candidates.axes[~top].tolist() == [[0.0, 1.0, 0.0]]
+
+    # Filtering by size leaves the side hole out
+    assert len(find_circular_edges(plate, min_radius=2.25).edges) == 6
+
+    # The pattern on top and the hole in the side get one dimension each
+    specs = get_circular_dimension_specs(plate, 0.1, group_patterns=True, auto=True)
+    assert sorted(spec.label for spec in specs if spec.kind == "label") == [
+        "6× R 2.5",
+        "R 2.0",
+    ]
+
+    # The label of the side hole is drawn on the XZ plane, facing along Y
+    assy = add_circular_dimensions(
+        plate, arrow_scale_factor=0.1, group_patterns=True, auto=True
+    )
+    assert len(assy.children) == 5
+    side_label = assy.children[4].toCompound().BoundingBox()
+    assert side_label.ylen == pytest.approx(1.0, abs=1e-3)
+
+    # An object without circles gets no dimensions
+    assert len(find_circular_edges(cq.Workplane("XY").box(1.0, 1.0, 1.0)).edges) == 0
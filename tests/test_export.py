@@ -0,0 +1,48 @@
+import os
+import pytest
+import cadquery as cq
+from cq_annotate.export import export_instanced, share_geometry
+
+
+def _separately_built(count):
+    """
+    Builds an assembly of identical shapes that were each built on their own.
+    """
+
+    assy = cq.Assembly()
+    for i in range(count):
+        sphere = cq.Workplane().sphere(3).val()
+        assy.add(sphere.moved(cq.Location((i * 10.0, 0.0, 0.0))), name="s%d" % i)
+
+    return assy
+
+
+def test_share_geometry():
+    """
+    Make sure that identical shapes are replaced by one shape without moving them.
+    """
+
+    assy = _separately_built(5)
+
+    shared = share_geometry(assy)
+
+    assert len({id(child.obj) for child in shared.children}) == 1
+    assert len({id(child.obj) for child in assy.children}) == 5
+    assert shared.toCompound().BoundingBox().xmax == pytest.approx(
+        assy.toCompound().BoundingBox().xmax
+    )
+
+
+def test_export_instanced(tmp_path):
+    """
+    Make sure that the shared shapes are only written once.
+    """
+
+    assy = _separately_built(10)
+
+    assy.export(str(tmp_path / "plain.glb"))
+    export_instanced(assy, str(tmp_path / "instanced.glb"))
+
+    assert os.path.getsize(tmp_path / "instanced.glb") < os.path.getsize(
+        tmp_path / "plain.glb"
+    )
@@ -0,0 +1,79 @@
+import json
+import threading
+import pytest
+import cadquery as cq
+from cq_annotate.callouts import add_assembly_arrows
+from cq_annotate.instrumentation import collect, count, stage
+
+
+def test_collect_stats():
+    """
+    Make sure that stage timers and counters are collected while instrumentation is on.
+    """
+
+    assy = cq.Assembly()
+    for i in range(3):
+        box = cq.Workplane().box(10, 10, 10)
+        box.faces(">Z").tag("arrow")
+        assy.add(box, name="box" + str(i), loc=cq.Location((20 * i, 0, 0)))
+
+    events = []
+    with collect(on_event=lambda name, start, duration: events.append(name)) as stats:
+        # A scale factor that no other test uses, so that the first arrow is a cache miss
+        add_assembly_arrows(assy, arrow_scale_factor=0.37)
+
+    result = stats.to_dict()
+
+    # One arrow was built and shared by all three parts, each of which was copied
+    assert result["counters"]["shapes_built"] == 1
+    assert result["counters"]["callouts.arrow_cache.misses"] == 1
+    assert result["counters"]["copies_made"] == 3
+    # The orientation of all arrows is worked out in one batch
+    assert result["stages"]["callouts.rotation"]["calls"] == 1
+    assert "callouts.arrow_build" in events
+
+    # The trace can be loaded by Chrome's trace viewer
+    trace = json.loads(stats.to_chrome_trace())
+    assert any(event["name"] == "callouts.tag_lookup" for event in trace["traceEvents"])
+
+
+def test_disabled_stage():
+    """
+    Make sure that nothing is collected when instrumentation is off.
+    """
+
+    with collect() as stats:
+        pass
+
+    with stage("unused"):
+        pass
+
+    assert stats.to_dict() == {"stages": {}, "counters": {}}
+
+
+def test_collect_per_thread():
+    """
+    Make sure that collect() blocks running at the same time in different threads keep their stats apart.
+    """
+
+    results = {}
+    barrier = threading.Barrier(2)
+
+    def work(name, amount):
+        with collect() as stats:
+            # Both blocks are open at the same time while the counters are added to
+            barrier.wait()
+            count(name, amount)
+            barrier.wait()
+        results[name] = stats.to_dict()["counters"]
+
+    threads = [
+        threading.Thread(target=work, args=("first", 1)),
+        threading.Thread(target=work, args=("second", 2)),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {"first": {"first": 1}, "second": {"second": 2}}
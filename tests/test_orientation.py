@@ -0,0 +1,33 @@
+import numpy as np
+from cq_annotate.orientation import frame_rotations, locations, normal_rotations
+
+
+def test_normal_rotations():
+    """
+    Make sure that the rotations turn +Z to each normal, including straight down.
+    """
+
+    rng = np.random.default_rng(0)
+    normals = np.vstack((rng.normal(size=(50, 3)), [(0, 0, 1), (0, 0, -1)]))
+    unit = normals / np.linalg.norm(normals, axis=1, keepdims=True)
+
+    rotations = normal_rotations(normals)
+
+    assert np.allclose(rotations[:, :, 2], unit)
+    assert np.allclose(rotations @ rotations.transpose(0, 2, 1), np.eye(3))
+    assert np.allclose(np.linalg.det(rotations), 1.0)
+
+
+def test_frame_locations():
+    """
+    Make sure that plane frames turn into locations that place the origin and axes.
+    """
+
+    rotations = frame_rotations([(0, 1, 0)], [(1, 0, 0)])
+    loc = locations(rotations, [(1, 2, 3)])[0]
+
+    trsf = loc.wrapped.Transformation()
+    assert trsf.TranslationPart().Coord() == (1, 2, 3)
+
+    # The X axis of the plane is Y and its normal is X, as for the YZ workplane
+    assert np.allclose(rotations[0], [[0, 0, 1], [1, 0, 0], [0, 1, 0]])
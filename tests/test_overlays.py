@@ -1,12 +1,20 @@
+import io
+import os
 import pytest
 import cadquery as cq
-from cq_annotate.overlays import add_safety_warning
+from lxml import etree
+from cq_annotate.overlays import (
+    add_safety_warning,
+    add_safety_warning_data,
+    add_safety_warnings,
+    register_icon,
+)
 
 
-def test_add_safety_waring():
+def test_add_safety_waring(tmp_path):
     # Set up the location of the test SVG and the text to be added
     text = "Safety Warning"
-    svg_path = "tests/test_add_safety_waring.svg"
+    svg_path = str(tmp_path / "test_add_safety_waring.svg")
 
     # The SVG export options
     export_options = {
@@ -29,3 +37,151 @@ def test_add_safety_waring():
 
     # Add the safety warning to the SVG
     add_safety_warning(svg_path, text, use_icon=True)
+
+
+def test_add_safety_warning_data():
+    """
+    Tests adding a safety warning to SVG content that is held in memory.
+    """
+
+    box1 = cq.Workplane().box(10, 10, 10)
+    svg = cq.exporters.getSVG(box1.val(), {"showAxes": False})
+
+    # Strings go in and out
+    result = add_safety_warning_data(svg, "Safety Warning", use_icon=True)
+    assert isinstance(result, str)
+
+    # The result is still valid SVG with the overlay at the end of the drawing
+    root = etree.fromstring(result.encode("utf-8"))
+    assert root[-1].tag == "{http://www.w3.org/2000/svg}g"
+    assert root[-1][0].text == "Safety Warning"
+    assert len(root[-1]) == 2
+
+    # Bytes and file-like objects are supported as well
+    result = add_safety_warning_data(svg.encode("utf-8"), "Warning", use_icon=False)
+    assert isinstance(result, bytes)
+    result = add_safety_warning_data(io.BytesIO(svg.encode("utf-8")), "Warning")
+    assert etree.fromstring(result.read())[-1][0].text == "Warning"
+
+
+def test_register_icon():
+    """
+    Tests that custom icons can be registered once and used in safety warnings.
+    """
+
+    register_icon(
+        "test_circle",
+        '<svg xmlns="http://www.w3.org/2000/svg"><circle cx="50" cy="50" r="40"/></svg>',
+    )
+
+    svg = '<svg xmlns="http://www.w3.org/2000/svg" width="800" height="600"></svg>'
+    result = add_safety_warning_data(svg, "Pinch Point", icon="test_circle")
+
+    # The custom icon is placed after the text
+    root = etree.fromstring(result.encode("utf-8"))
+    icon = root[-1][1]
+    assert icon[0].tag == "{http://www.w3.org/2000/svg}circle"
+    assert "scale(0.4 0.4)" in icon.get("transform")
+
+    # Repeated warnings reuse the same serialized overlay
+    assert add_safety_warning_data(svg, "Pinch Point", icon="test_circle") == result
+
+
+def test_add_safety_warnings_batch(tmp_path):
+    """
+    Tests adding safety warnings to a batch of SVG files in parallel.
+    """
+
+    svg = '<svg xmlns="http://www.w3.org/2000/svg" width="800" height="600"></svg>'
+    for i in range(5):
+        (tmp_path / ("page_%d.svg" % i)).write_text(svg)
+    (tmp_path / "broken.svg").write_text("<svg>")
+
+    results = list(
+        add_safety_warnings(
+            str(tmp_path / "*.svg"),
+            {"text": "Safety Warning", "use_icon": False},
+            output_dir=str(tmp_path / "out"),
+            max_workers=2,
+        )
+    )
+
+    # Every file is reported, and the broken one comes back with an error
+    assert len(results) == 6
+    errors = [result for result in results if result.error is not None]
+    assert [os.path.basename(result.path) for result in errors] == ["broken.svg"]
+
+    # The results were written without touching the originals
+    page = etree.parse(str(tmp_path / "out" / "page_0.svg")).getroot()
+    assert page[-1][0].text == "Safety Warning"
+    assert (tmp_path / "page_0.svg").read_text() == svg
+    assert not list((tmp_path / "out").glob("*.tmp"))
+
+
+def test_add_safety_warnings_keeps_mode(tmp_path):
+    """
+    Tests that files which are changed in-place keep their permissions.
+    """
+
+    svg = '<svg xmlns="http://www.w3.org/2000/svg" width="800" height="600"></svg>'
+    page = tmp_path / "page.svg"
+    page.write_text(svg)
+    os.chmod(page, 0o644)
+
+    results = list(
+        add_safety_warnings(
+            str(page), {"text": "Safety Warning", "use_icon": False}, max_workers=1
+        )
+    )
+
+    assert results[0].error is None
+    assert os.stat(page).st_mode & 0o777 == 0o644
+
+
+def test_add_safety_warnings_new_file_mode(tmp_path):
+    """
+    Tests that new output files get fixed permissions without touching the process umask.
+    """
+
+    svg = '<svg xmlns="http://www.w3.org/2000/svg" width="800" height="600"></svg>'
+    (tmp_path / "page.svg").write_text(svg)
+
+    mask = os.umask(0o077)
+    try:
+        results = list(
+            add_safety_warnings(
+                str(tmp_path / "page.svg"),
+                {"text": "Safety Warning", "use_icon": False},
+                output_dir=str(tmp_path / "out"),
+                max_workers=1,
+            )
+        )
+        assert os.umask(0o077) == 0o077
+    finally:
+        os.umask(mask)
+
+    assert results[0].error is None
+    assert os.stat(results[0].output_path).st_mode & 0o777 == 0o644
+
+
+def test_add_safety_warnings_name_collision(tmp_path):
+    """
+    Tests that files with the same name are not written over each other in the output directory.
+    """
+
+    svg = '<svg xmlns="http://www.w3.org/2000/svg" width="800" height="600"></svg>'
+    for folder in ("a", "b"):
+        (tmp_path / folder).mkdir()
+        (tmp_path / folder / "view.svg").write_text(svg)
+
+    with pytest.raises(ValueError):
+        list(
+            add_safety_warnings(
+                [str(tmp_path / "a" / "view.svg"), str(tmp_path / "b" / "view.svg")],
+                {"text": "Safety Warning", "use_icon": False},
+                output_dir=str(tmp_path / "out"),
+                max_workers=1,
+            )
+        )
+
+    assert not (tmp_path / "out").exists()
@@ -0,0 +1,115 @@
+import pytest
+import cadquery as cq
+from cq_annotate.instrumentation import collect
+from cq_annotate.session import AnnotationSession
+
+
+def _box():
+    """
+    Builds a box tagged for arrows and assembly lines.
+    """
+
+    box = cq.Workplane().box(10, 10, 10)
+    box.faces("<Z").tag("arrow")
+    box.faces("<Z").tag("assembly_line")
+
+    return box
+
+
+def _model(offsets, box=None):
+    """
+    Builds an assembly of boxes tagged for arrows and assembly lines, exploded by the given offsets.
+    The box is rebuilt unless one is passed in.
+    """
+
+    if box is None:
+        box = _box()
+
+    assy = cq.Assembly()
+    for i, offset in enumerate(offsets):
+        assy.add(
+            box,
+            name="box%d" % i,
+            loc=cq.Location((i * 20.0, 0.0, 0.0)),
+            metadata={"explode_loc": cq.Location((0.0, 0.0, offset))},
+        )
+
+    return assy
+
+
+def test_annotation_session():
+    """
+    Make sure that only the parts that changed are annotated again when the geometry is hashed.
+    """
+
+    session = AnnotationSession(arrow_scale_factor=0.5, hash_geometry=True)
+
+    with collect() as stats:
+        assy = session.annotate(_model([-5.0, -5.0, -5.0]))
+    assert stats.counters["session.rebuilt"] == 3
+    assert len(assy.annotations.children) == 6
+
+    # Regenerate the model with a longer explode distance for one part
+    with collect() as stats:
+        assy = session.annotate(_model([-5.0, -20.0, -5.0]))
+    assert stats.counters["session.rebuilt"] == 1
+    assert stats.counters["session.reused"] == 2
+    assert len(assy.annotations.children) == 6
+
+    # The line of the changed part was rebuilt with the new length
+    line = assy.objects["annotations/assembly_line_box1"]
+    assert line.obj.moved(line.loc).BoundingBox().zlen == pytest.approx(20.0)
+
+    # Parts that are removed from the model lose their annotations
+    assy = session.annotate(_model([-5.0]))
+    assert len(assy.annotations.children) == 2
+
+
+def test_annotation_session_identity():
+    """
+    Make sure that shapes are compared by identity and location by default, without exporting them.
+    """
+
+    session = AnnotationSession(arrow_scale_factor=0.5)
+    box = _box()
+
+    with collect() as stats:
+        session.annotate(_model([-5.0, -5.0], box))
+    assert stats.counters["session.rebuilt"] == 2
+
+    # The same shapes are reused, and moving a part only rebuilds that part
+    with collect() as stats:
+        assy = session.annotate(_model([-5.0, -20.0], box))
+    assert stats.counters["session.rebuilt"] == 1
+    assert stats.counters["session.reused"] == 1
+    assert len(assy.annotations.children) == 4
+
+    # Rebuilt shapes are new shapes, even with the same geometry
+    with collect() as stats:
+        session.annotate(_model([-5.0, -20.0]))
+    assert stats.counters["session.rebuilt"] == 2
+
+
+def test_annotation_session_dimensions():
+    """
+    Make sure that unchanged objects reuse their dimensions.
+    """
+
+    session = AnnotationSession()
+
+    plate = cq.Workplane().box(40, 40, 5).faces(">Z").workplane().hole(10)
+    plate.faces(">Z").edges("%CIRCLE").tag("radius")
+
+    first = session.add_circular_dimensions(plate, arrow_scale_factor=0.25)
+    assert session.add_circular_dimensions(plate, arrow_scale_factor=0.25) is first
+    assert session.add_circular_dimensions(plate, arrow_scale_factor=0.5) is not first
+
+    # Grouping and finding the circles are part of the settings too
+    second = session.add_circular_dimensions(plate, arrow_scale_factor=0.5)
+    found = session.add_circular_dimensions(plate, arrow_scale_factor=0.5, auto=True)
+    assert found is not second
+    assert len(found.children) == 3
+    grouped = session.add_circular_dimensions(
+        plate, arrow_scale_factor=0.5, auto=True, group_patterns=True
+    )
+    assert grouped is not found
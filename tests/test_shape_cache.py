@@ -0,0 +1,41 @@
+import os
+import pytest
+from cq_annotate import callouts, shape_cache
+from cq_annotate.instrumentation import collect
+
+
+def test_shape_cache(tmp_path):
+    """
+    Make sure that generated shapes are read back from the cache directory and that the
+    cache is trimmed to its size cap.
+    """
+
+    shape_cache.configure_shape_cache(str(tmp_path))
+    try:
+        callouts._arrow_prototype.cache_clear()
+        with collect() as stats:
+            arrow = callouts._arrow_prototype(0.5, 2.5, 10.0)
+        assert stats.counters["shape_cache.misses"] == 1
+        assert len(os.listdir(tmp_path)) == 1
+
+        # A cold process reads the arrow back instead of building it
+        callouts._arrow_prototype.cache_clear()
+        with collect() as stats:
+            cached = callouts._arrow_prototype(0.5, 2.5, 10.0)
+        assert stats.counters["shape_cache.hits"] == 1
+        assert stats.counters["shapes_built"] == 0
+        assert type(cached) is type(arrow)
+        assert cached.Volume() == pytest.approx(arrow.Volume())
+
+        # Only the most recently used file is kept once the cap is smaller than two files
+        shape_cache.configure_shape_cache(
+            str(tmp_path), max_size=os.path.getsize(tmp_path / os.listdir(tmp_path)[0])
+        )
+        callouts._arrow_prototype(1.0, 5.0, 20.0)
+        assert len(os.listdir(tmp_path)) == 1
+
+        shape_cache.clear_shape_cache()
+        assert os.listdir(tmp_path) == []
+    finally:
+        shape_cache.configure_shape_cache(None)
+        callouts._arrow_prototype.cache_clear()
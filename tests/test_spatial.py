@@ -0,0 +1,76 @@
+import numpy as np
+from cq_annotate.spatial import AABBTree, GridIndex
+
+
+def _random_boxes(count, seed=0):
+    """
+    Builds random axis aligned boxes as (xmin, ymin, zmin, xmax, ymax, zmax) rows.
+    """
+
+    rng = np.random.default_rng(seed)
+    mins = rng.uniform(0.0, 100.0, (count, 3))
+
+    return np.hstack((mins, mins + rng.uniform(0.5, 10.0, (count, 3))))
+
+
+def test_aabb_tree_query():
+    """
+    Make sure that the tree finds the same boxes as testing every box.
+    """
+
+    boxes = _random_boxes(500)
+    tree = AABBTree(boxes)
+
+    for query in _random_boxes(20, seed=1):
+        expected = np.nonzero(
+            np.all(boxes[:, :3] <= query[3:], axis=1)
+            & np.all(boxes[:, 3:] >= query[:3], axis=1)
+        )[0]
+        assert tree.query(query).tolist() == expected.tolist()
+
+
+def test_aabb_tree_pairs():
+    """
+    Make sure that the overlapping pairs match testing every pair.
+    """
+
+    boxes = _random_boxes(200)
+
+    expected = [
+        (i, j)
+        for i in range(len(boxes))
+        for j in range(i + 1, len(boxes))
+        if np.all(boxes[i, :3] <= boxes[j, 3:]) and np.all(boxes[i, 3:] >= boxes[j, :3])
+    ]
+
+    assert sorted(AABBTree(boxes).overlapping_pairs()) == expected
+
+
+def _rects_overlap(a, b):
+    """
+    Checks whether two (umin, vmin, umax, vmax) rectangles overlap.
+    """
+
+    return a[0] < b[2] and a[1] < b[3] and a[2] > b[0] and a[3] > b[1]
+
+
+def test_grid_index_place():
+    """
+    Make sure that placed rectangles never overlap and stay near the preferred position.
+    """
+
+    blocked = (0.0, 0.0, 10.0, 10.0)
+    grid = GridIndex(4.0)
+    grid.insert(blocked)
+
+    # Nothing is in the way, so the preferred position is used
+    assert grid.place(3.0, 1.0, (20.0, 0.0)) == (20.0, 0.0)
+
+    placed = [grid.place(3.0, 1.0, (5.0, 5.0), gap=0.5) for _ in range(50)]
+    rects = [(u, v, u + 3.0, v + 1.0) for u, v in placed]
+    for i, rect in enumerate(rects):
+        assert not _rects_overlap(rect, blocked)
+        assert not any(_rects_overlap(rect, other) for other in rects[i + 1 :])
+
+    # The nearest free slots are used, so the rectangles stay packed around the preferred position
+    assert max(abs(u - 5.0) for u, _ in placed) < 40.0
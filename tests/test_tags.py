@@ -0,0 +1,82 @@
+import pytest
+import cadquery as cq
+from cq_annotate.callouts import add_assembly_arrows
+from cq_annotate.tags import build_tag_index, get_tag_index
+
+
+def test_tag_index_nested():
+    """
+    Make sure that tagged faces are found at any depth of an assembly.
+    """
+
+    box1 = cq.Workplane().box(10, 10, 10)
+    box1.faces(">Z").tag("arrow")
+    box2 = cq.Workplane().box(10, 10, 10)
+    box2.faces("<Z").tag("arrow")
+    box2.faces(">X").tag("assembly_line")
+
+    sub_assy = cq.Assembly(name="sub")
+    sub_assy.add(box2, name="box2", loc=cq.Location((0, 0, -20)))
+
+    assy = cq.Assembly()
+    assy.add(box1, name="box1", loc=cq.Location((0, 0, 20)))
+    assy.add(sub_assy, loc=cq.Location((5, 0, 0)))
+
+    index = build_tag_index(assy)
+
+    assert [entry.path for entry in index["arrow"]] == [("box1",), ("sub", "box2")]
+    assert len(index["assembly_line"]) == 1
+
+    # The nested entry is placed relative to the root of the assembly
+    nested = index["arrow"][1]
+    assert nested.loc.toTuple()[0] == pytest.approx((5.0, 0.0, -20.0))
+    assert nested.normal.toTuple() == pytest.approx((0.0, 0.0, -1.0))
+
+    # The arrow for the nested face ends up in the sub-assembly of its part
+    add_assembly_arrows(assy, arrow_scale_factor=0.5)
+    assert len(assy.children[1].children) == 2
+
+
+def test_tag_index_invalidation():
+    """
+    Make sure that the cached tag index is only rebuilt when the assembly changes.
+    """
+
+    box1 = cq.Workplane().box(10, 10, 10)
+    box1.faces(">Z").tag("arrow")
+
+    assy = cq.Assembly()
+    assy.add(box1, name="box1")
+
+    index = get_tag_index(assy)
+    assert get_tag_index(assy) is index
+
+    # Moving a part invalidates the index
+    assy.children[0].loc = cq.Location((0, 0, 10))
+    moved_index = get_tag_index(assy)
+    assert moved_index is not index
+    assert moved_index["arrow"][0].loc.toTuple()[0] == pytest.approx((0, 0, 10))
+
+
+def test_tag_index_retag():
+    """
+    Make sure that moving a tag to a different face under the same name rebuilds the index.
+    """
+
+    box1 = cq.Workplane().box(10, 10, 10)
+    box1.faces(">Z").tag("arrow")
+
+    assy = cq.Assembly()
+    assy.add(box1, name="box1")
+
+    index = get_tag_index(assy)
+    assert index["arrow"][0].normal.toTuple() == pytest.approx((0.0, 0.0, 1.0))
+
+    # The tag count stays the same, but the tag now points at another face
+    box1.faces("<X").tag("arrow")
+    retagged_index = get_tag_index(assy)
+    assert retagged_index is not index
+    assert retagged_index["arrow"][0].normal.toTuple() == pytest.approx(
+        (-1.0, 0.0, 0.0)
+    )
+    assert get_tag_index(assy) is retagged_index
@@ -0,0 +1,83 @@
+import re
+import pytest
+import cadquery as cq
+from cq_annotate.callouts import (
+    get_assembly_arrow_primitives,
+    get_assembly_line_primitives,
+)
+from cq_annotate.dimensioning import get_circular_dimension_primitives
+from cq_annotate.vector import LinePrimitive, add_vector_annotations
+
+
+def test_vector_projection():
+    """
+    Make sure that primitives are projected onto the same view as the SVG export.
+    """
+
+    box = cq.Workplane().box(10, 10, 10)
+    svg = cq.exporters.getSVG(box.val())
+
+    # A line along one edge of the box lands on the path that the exporter drew for that edge
+    line = LinePrimitive((5.0, 5.0, 5.0), (0.0, -1.0, 0.0), 10.0)
+    result = add_vector_annotations(svg, [line])
+    assert isinstance(result, str)
+
+    # Map the points of the exporter's paths through its view transform into pixels
+    scale, x, y = map(
+        float,
+        re.search(
+            r"scale\(([^,]+), -[^)]+\)\s*translate\(([^,]+),([^)]+)\)", svg
+        ).groups(),
+    )
+    points = re.findall(r"[ML](-?[0-9.]+),(-?[0-9.]+)", svg)
+    pixels = [(scale * (float(px) + x), -scale * (float(py) + y)) for px, py in points]
+
+    # Both ends of the line are corners of the box
+    drawn = re.findall(r"[ML](-?[0-9.]+),(-?[0-9.]+)", result[len(svg) - 6 :])
+    assert len(drawn) == 2
+    for dx, dy in drawn:
+        assert any(
+            float(dx) == pytest.approx(px, abs=1e-2)
+            and float(dy) == pytest.approx(py, abs=1e-2)
+            for px, py in pixels
+        )
+
+
+def test_annotation_primitives():
+    """
+    Make sure that the arrows, lines and dimensions are found as primitives.
+    """
+
+    box = cq.Workplane().box(10, 10, 10)
+    box.faces(">Z").tag("arrow")
+    box.faces("<Z").tag("assembly_line")
+    assy = cq.Assembly()
+    assy.add(
+        box,
+        name="box",
+        loc=cq.Location((0.0, 0.0, 20.0)),
+        metadata={"explode_loc": cq.Location((0.0, 0.0, 15.0))},
+    )
+
+    arrows = get_assembly_arrow_primitives(assy, arrow_scale_factor=0.5)
+    assert arrows[0].anchor == pytest.approx((0.0, 0.0, 25.0))
+    assert arrows[0].direction == pytest.approx((0.0, 0.0, -1.0))
+
+    lines = get_assembly_line_primitives(assy)
+    assert lines[0].length == pytest.approx(15.0)
+    assert lines[0].direction == pytest.approx((0.0, 0.0, -1.0))
+
+    plate = cq.Workplane().box(40, 40, 5).faces(">Z").workplane().hole(10)
+    plate.faces(">Z").edges("%CIRCLE").tag("radius")
+    arrow, label = get_circular_dimension_primitives(plate)
+    assert label.text == "R 5.0"
+
+    # Untagged circles can be found instead
+    untagged = cq.Workplane().box(40, 40, 5).faces(">Z").workplane().hole(10)
+    _, found = get_circular_dimension_primitives(untagged, auto=True)
+    assert found.text == "R 5.0"
+
+    svg = cq.exporters.getSVG(plate.val())
+    result = add_vector_annotations(svg.encode(), arrows + lines + [arrow, label])
+    assert result.count(b"<path") == svg.count("<path") + 3
+    assert b">R 5.0</text>" in result